@@ -0,0 +1,259 @@
+import os
+import math
+import hashlib
+import time
+import sqlite3
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, Request, status
+
+from backend.settings import get_settings
+from backend.user_cache import user_cache
+from backend.logger_config import logger, SAMPLED
+from backend.metrics import admission_rejected, admission_queue_wait
+
+
+settings = get_settings()
+ADMISSION_CONTROL = settings.admission_control
+# «запросов в секунду/ёмкость корзины»; 0 — без ограничения
+RATE_LIMIT_AUTH = settings.rate_limit_auth
+RATE_LIMIT_WRITE = settings.rate_limit_write
+RATE_LIMIT_READ = settings.rate_limit_read
+RATE_LIMIT_IP = settings.rate_limit_ip
+# Пусто — корзины в памяти процесса; sqlite:///path/limits.db — общий файл для нескольких воркеров uvicorn
+RATE_LIMIT_STORE_URL = settings.rate_limit_store_url
+# Одновременно обрабатываемых запросов: по умолчанию столько, сколько соединений может выдать пул
+ADMISSION_CONCURRENCY = settings.admission_concurrency
+# Сколько секунд запрос может ждать своей очереди; если ожидание будет дольше — сразу 503
+ADMISSION_LATENCY_BUDGET = settings.admission_latency_budget
+# Корзин в памяти больше этого — полные (давно не использованные) выбрасываются
+MAX_BUCKETS = 100_000
+AUTH_PATHS = ("/auth/login", "/auth/register")
+
+
+def parse_limit(value: str) -> tuple[float, float] | None:
+    """'20/40' → (20 в секунду, ёмкость 40); '20' → ёмкость равна скорости; '0' — без ограничения"""
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    return (rate, float(burst or rate)) if rate > 0 else None
+
+
+class MemoryBucketStore:
+    """Token bucket в памяти процесса: (токены, время обновления) по ключу"""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def reopen(self):
+        self._buckets = {}
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Забирает токен; 0 — запрос пропущен, иначе через сколько секунд появится следующий токен"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > MAX_BUCKETS:
+            self._evict(now, rate, burst)
+        return 0.0
+
+    def _evict(self, now: float, rate: float, burst: float):
+        # Корзина, которая успела бы наполниться, ничем не отличается от отсутствующей
+        full_after = burst / rate
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated > full_after]:
+            del self._buckets[key]
+
+
+class SqliteBucketStore:
+    """Корзины в файле SQLite, общем для всех воркеров на одной машине.
+
+    Транзакция ждёт блокировку файла, пока её держит соседний воркер, поэтому выполняется в отдельном
+    потоке: под нагрузкой ждёт только этот запрос, а не весь цикл событий.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._inherited = []
+        self._open()
+
+    def reopen(self):
+        # Соединение родителя после fork не используется и не закрывается, как в etag.SqliteVersionStore
+        self._inherited.append(self._conn)
+        self._open()
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                           "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        # Один поток: соединение не делится между потоками, транзакции идут по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bucket-store")
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._take, key, rate, burst)
+
+    def _take(self, key: str, rate: float, burst: float) -> float:
+        # Часы процесса у воркеров разные, поэтому здесь время настенное
+        now = time.time()
+        # Чтение и запись корзины — одна транзакция: соседний воркер не заберёт тот же токен
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0.0
+            self._conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                               (key, tokens if wait else tokens - 1, now))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def create_bucket_store(url: str = RATE_LIMIT_STORE_URL):
+    if not url:
+        return MemoryBucketStore()
+    if url.startswith("sqlite:///"):
+        return SqliteBucketStore(url.removeprefix("sqlite:///"))
+    raise RuntimeError(f"Неподдерживаемое хранилище лимитов: {url}")
+
+
+class ConcurrencyLimiter:
+    """Не больше limit запросов одновременно, остальные — в очереди FIFO.
+
+    Время ожидания оценивается по длине очереди и скользящему среднему длительности запроса: если оценка
+    больше бюджета, запрос отклоняется сразу, а не после того, как простоит в очереди впустую. Лимит
+    действует в пределах процесса, как и пул соединений, к размеру которого он привязан.
+    """
+
+    def __init__(self, limit: int = ADMISSION_CONCURRENCY, budget: float = ADMISSION_LATENCY_BUDGET):
+        self.limit = limit
+        self.budget = budget
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        # Скользящее среднее длительности запроса, секунды
+        self.service_time = 0.01
+
+    def estimated_wait(self) -> float:
+        return (len(self.waiters) + 1) * self.service_time / self.limit
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return
+        wait = self.estimated_wait()
+        if wait > self.budget:
+            raise Overloaded(wait)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.budget)
+        except BaseException as error:
+            # Таймаут или отмена запроса (клиент отключился): место в очереди не должно пропасть
+            if waiter.done():
+                # Слот выдан одновременно с отказом: возвращаем его следующему
+                self.release(None)
+            else:
+                self.waiters.remove(waiter)
+            if isinstance(error, asyncio.TimeoutError):
+                raise Overloaded(self.estimated_wait())
+            raise
+        finally:
+            admission_queue_wait.labels().observe(time.perf_counter() - started)
+
+    def release(self, duration: float | None):
+        if duration is not None:
+            self.service_time += (duration - self.service_time) * 0.1
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # Слот переходит ожидающему, in_flight не меняется
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class Overloaded(Exception):
+    def __init__(self, wait: float):
+        self.wait = wait
+
+
+class AdmissionControl:
+    def __init__(self):
+        self.enabled = ADMISSION_CONTROL
+        self.store = create_bucket_store()
+        self.limits = {"auth": parse_limit(RATE_LIMIT_AUTH), "write": parse_limit(RATE_LIMIT_WRITE),
+                       "read": parse_limit(RATE_LIMIT_READ), "ip": parse_limit(RATE_LIMIT_IP)}
+        self.limiter = ConcurrencyLimiter()
+
+    async def check_rate(self, kind: str, key: str):
+        limit = self.limits[kind]
+        if limit is None:
+            return
+        wait = await self.store.take(f"{kind}:{key}", *limit)
+        if wait:
+            admission_rejected.inc(kind)
+            logger.warning("Превышен лимит %s для %s, повтор через %.2f с", kind, key, wait, extra=SAMPLED)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Слишком много запросов, повторите попытку позже",
+                                headers={"Retry-After": str(math.ceil(wait))})
+
+
+admission = AdmissionControl()
+# Воркеры backend.serve создаются fork после импорта; store может быть заменён, поэтому берётся при fork
+os.register_at_fork(after_in_child=lambda: admission.store.reopen())
+
+
+def request_rate_key(request: Request) -> str | None:
+    """Ключ лимита пользователя без разбора JWT: проверка подписи на каждом запросе нагружала бы тот самый
+    горячий путь, который защищает контроль допуска.
+
+    id берётся из кеша проверенных токенов (его заполняют зависимости авторизации в router); токен, которого
+    там ещё нет, считается по своему хешу. Недействительный токен отклонит (и запишет в лог) сам обработчик.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    user_id = user_cache.user_id(token)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"token:{hashlib.sha256(token.encode()).hexdigest()[:32]}"
+
+
+async def admission_control(request: Request):
+    """Зависимость роутеров: лимиты по IP и пользователю, затем место в очереди к пулу соединений"""
+    if not admission.enabled:
+        yield
+        return
+    # За балансировщиком это адрес клиента, только если uvicorn доверяет X-Forwarded-For от балансировщика
+    # (FORWARDED_ALLOW_IPS); иначе все клиенты делят лимиты адреса балансировщика
+    ip = request.client.host if request.client else "unknown"
+    await admission.check_rate("ip", ip)
+    if request.url.path in AUTH_PATHS:
+        # Вход и регистрация упираются в bcrypt: пользователя ещё нет, ограничиваем по IP
+        await admission.check_rate("auth", ip)
+    else:
+        await admission.check_rate("read" if request.method in ("GET", "HEAD") else "write",
+                                   request_rate_key(request) or f"ip:{ip}")
+    try:
+        await admission.limiter.acquire()
+    except Overloaded as error:
+        admission_rejected.inc("overload")
+        logger.warning("Перегрузка: очередь %s, ожидание ~%.2f с, запрос %s %s отклонён",
+                       len(admission.limiter.waiters), error.wait, request.method, request.url.path, extra=SAMPLED)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Сервер перегружен, повторите попытку позже",
+                            headers={"Retry-After": str(max(1, math.ceil(error.wait)))})
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        admission.limiter.release(time.perf_counter() - started)
@@ -3,6 +3,7 @@ import os
 
 from sqlalchemy import create_engine
 from sqlalchemy import pool
+from sqlalchemy.engine import make_url
 
 from alembic import context
 from dotenv import load_dotenv
@@ -20,6 +21,10 @@ if config.config_file_name is not None:
 target_metadata = Model.metadata
 
 url = config.get_main_option("sqlalchemy.url")
+if not url and os.getenv("DATABASE_URL"):
+    # Тот же URL, что у приложения, но с синхронным драйвером по умолчанию
+    database_url = make_url(os.getenv("DATABASE_URL"))
+    url = database_url.set(drivername=database_url.get_backend_name()).render_as_string(hide_password=False)
 if not url:
     DB_LOGIN = os.getenv("DB_LOGIN")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
@@ -0,0 +1,59 @@
+"""composite key and index audit
+
+Revision ID: 2c9bf53055e1
+Revises: 3afa5cb1c946
+Create Date: 2026-10-17 20:03:18.564027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c9bf53055e1'
+down_revision: Union[str, Sequence[str], None] = '3afa5cb1c946'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки) индексов, которые повторяют первичный ключ или его префикс либо заменены составными
+REDUNDANT_INDEXES = [
+    ('ix_tracks_id', 'tracks', ['id']),
+    ('ix_users_id', 'users', ['id']),
+    ('ix_playlists_id', 'playlists', ['id']),
+    ('ix_playlists_user_id', 'playlists', ['user_id']),
+    ('ix_playlist_tracks_playlist_id', 'playlist_tracks', ['playlist_id']),
+    ('ix_playlist_tracks_playlist_id_position', 'playlist_tracks', ['playlist_id', 'position']),
+]
+HOT_INDEXES = [
+    # GET /playlists: WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+    ('ix_playlists_user_id_id', 'playlists', ['user_id', 'id']),
+    # GET /playlists/{id}/tracks и первые треки в GET /playlists?include=tracks: ORDER BY position, track_id
+    ('ix_playlist_tracks_playlist_id_position_track_id', 'playlist_tracks', ['playlist_id', 'position', 'track_id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # В 980a6ebddb1e первичный ключ playlist_tracks был только по playlist_id — по треку на плейлист.
+    # Уникальный индекс строится без блокировки записи, затем подменяет старый ключ
+    with op.get_context().autocommit_block():
+        op.create_index('playlist_tracks_pkey_new', 'playlist_tracks', ['playlist_id', 'track_id'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        for name, table, columns in HOT_INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+    op.execute("ALTER TABLE playlist_tracks DROP CONSTRAINT playlist_tracks_pkey, "
+               "ADD CONSTRAINT playlist_tracks_pkey PRIMARY KEY USING INDEX playlist_tracks_pkey_new")
+    with op.get_context().autocommit_block():
+        for name, table, _ in REDUNDANT_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Составной первичный ключ остаётся: ключ только по playlist_id не примет плейлисты из нескольких треков
+    with op.get_context().autocommit_block():
+        for name, table, columns in REDUNDANT_INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+        for name, table, _ in HOT_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
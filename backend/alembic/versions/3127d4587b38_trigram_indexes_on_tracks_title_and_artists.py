@@ -0,0 +1,40 @@
+"""trigram indexes on tracks title and artists
+
+Revision ID: 3127d4587b38
+Revises: c15da513637c
+Create Date: 2026-10-17 14:05:27.593140
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3127d4587b38'
+down_revision: Union[str, Sequence[str], None] = 'c15da513637c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # array_to_string только STABLE, а выражение индекса должно быть IMMUTABLE
+    op.execute("CREATE OR REPLACE FUNCTION tracks_artists_text(varchar[]) RETURNS text LANGUAGE sql "
+               "IMMUTABLE PARALLEL SAFE AS $$ SELECT array_to_string($1, ' ') $$")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tracks_title_trgm', 'tracks', ['title'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tracks_artists_trgm', 'tracks', [sa.text('tracks_artists_text(artists) gin_trgm_ops')],
+                        unique=False, postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tracks_artists_trgm', table_name='tracks', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_tracks_title_trgm', table_name='tracks', postgresql_concurrently=True, if_exists=True)
+    op.execute("DROP FUNCTION IF EXISTS tracks_artists_text(varchar[])")
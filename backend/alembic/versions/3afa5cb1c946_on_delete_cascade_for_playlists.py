@@ -0,0 +1,44 @@
+"""on delete cascade for playlists
+
+Revision ID: 3afa5cb1c946
+Revises: f448f6f5df2d
+Create Date: 2026-10-17 18:20:54.731902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3afa5cb1c946'
+down_revision: Union[str, Sequence[str], None] = 'f448f6f5df2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Имена, которые Postgres дал безымянным ключам из 980a6ebddb1e: (таблица, колонка, ссылка)
+FOREIGN_KEYS = [
+    ('playlists', 'user_id', 'users'),
+    ('playlist_tracks', 'playlist_id', 'playlists'),
+]
+
+
+def replace_foreign_keys(on_delete: str) -> None:
+    for table, column, referent in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_fkey, "
+                   f"ADD CONSTRAINT {table}_{column}_fkey FOREIGN KEY ({column}) REFERENCES {referent} (id) "
+                   f"ON DELETE {on_delete} NOT VALID")
+    # Проверка существующих строк — отдельной транзакцией: VALIDATE не блокирует запись в таблицы
+    with op.get_context().autocommit_block():
+        for table, column, _ in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_fkey")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    replace_foreign_keys("CASCADE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    replace_foreign_keys("NO ACTION")
@@ -0,0 +1,32 @@
+"""title index for bulk dedupe
+
+Revision ID: 6ae364726951
+Revises: ffaa0b83fcb2
+Create Date: 2026-10-17 03:53:45.623944
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6ae364726951'
+down_revision: Union[str, Sequence[str], None] = 'ffaa0b83fcb2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Массовая загрузка с dedupe ищет уже загруженные треки по равенству title: без индекса каждая пачка —
+    # полный просмотр tracks, а по триграммному ix_tracks_title_trgm равенство проверяется перепроверкой строк
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tracks_title', 'tracks', ['title'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tracks_title', table_name='tracks', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,35 @@
+"""gin indexes on tracks tags and artists
+
+Revision ID: c15da513637c
+Revises: 931a092a8f38
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c15da513637c'
+down_revision: Union[str, Sequence[str], None] = '931a092a8f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в tracks, но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tracks_tags', 'tracks', ['tags'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tracks_artists', 'tracks', ['artists'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tracks_artists', table_name='tracks', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_tracks_tags', table_name='tracks', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,45 @@
+"""position column on playlist tracks
+
+Revision ID: f448f6f5df2d
+Revises: 3127d4587b38
+Create Date: 2026-10-17 16:42:11.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f448f6f5df2d'
+down_revision: Union[str, Sequence[str], None] = '3127d4587b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# backend.positions.POSITION_GAP на момент миграции
+POSITION_GAP = 1 << 20
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('playlist_tracks', sa.Column('position', sa.BigInteger(), nullable=True))
+    # Порядок существующих плейлистов раньше не хранился; сохраняем тот, что клиенты видели после сортировки по id
+    op.execute(f"UPDATE playlist_tracks SET position = ranked.position "
+               f"FROM (SELECT playlist_id, track_id, "
+               f"row_number() OVER (PARTITION BY playlist_id ORDER BY track_id) * {POSITION_GAP} AS position "
+               f"FROM playlist_tracks) AS ranked "
+               f"WHERE playlist_tracks.playlist_id = ranked.playlist_id "
+               f"AND playlist_tracks.track_id = ranked.track_id")
+    op.alter_column('playlist_tracks', 'position', nullable=False)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_playlist_tracks_playlist_id_position', 'playlist_tracks', ['playlist_id', 'position'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_playlist_tracks_playlist_id_position', table_name='playlist_tracks',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('playlist_tracks', 'position')
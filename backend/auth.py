@@ -1,40 +1,91 @@
-import os
+import time
+import asyncio
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException, status
 
-from dotenv import load_dotenv
-from passlib.context import CryptContext
-from jose import jwt, JWTError
 from datetime import datetime, timedelta
 
+from backend.settings import get_settings
 from backend.logger_config import logger
+from backend.metrics import bcrypt_duration, bcrypt_queue_wait
 
 
-load_dotenv()
-SECRET_KEY = os.getenv("SECRET_KEY")
+settings = get_settings()
+SECRET_KEY = settings.secret_key
 if not SECRET_KEY:
     raise RuntimeError("Secret key is not set as an environment variable")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+BCRYPT_WORKERS = settings.bcrypt_workers
+BCRYPT_MAX_QUEUE = settings.bcrypt_max_queue
+BCRYPT_RETRY_AFTER = 1
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt отпускает GIL на время хеширования, поэтому хватает потоков, процессы не нужны
+hashing_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+hashing_in_flight = 0
+
+
+@lru_cache(maxsize=1)
+def password_context():
+    """passlib и jose импортируются при первом использовании, а не при старте процесса"""
+    from passlib.context import CryptContext
+    # min = max = default: хеши с другой стоимостью считаются устаревшими и перехешируются при входе
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS,
+                        bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
+
+async def run_hashing(func, *args):
+    """Выполняет bcrypt в отдельном пуле; при переполнении очереди сразу отвечает 503, а не копит запросы"""
+    global hashing_in_flight
+    if hashing_in_flight >= BCRYPT_WORKERS + BCRYPT_MAX_QUEUE:
+        logger.warning("Очередь хеширования паролей переполнена: %s", hashing_in_flight)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Сервер перегружен, повторите попытку позже",
+                            headers={"Retry-After": str(BCRYPT_RETRY_AFTER)})
+    hashing_in_flight += 1
+    submitted = time.perf_counter()
+    try:
+        result, started, finished = await asyncio.get_running_loop().run_in_executor(
+            hashing_executor, timed_call, func, *args)
+    finally:
+        hashing_in_flight -= 1
+    # Гистограммы пишем уже в потоке цикла событий, а не из потоков пула
+    bcrypt_queue_wait.labels().observe(started - submitted)
+    bcrypt_duration.labels(func.__name__).observe(finished - started)
+    return result
+
+def timed_call(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started, time.perf_counter()
+
+async def hash_password(password: str) -> str:
+    return await run_hashing(password_context().hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """(пароль верен, новый хеш или None, если стоимость хеша не изменилась)"""
+    return await run_hashing(password_context().verify_and_update, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
-    logger.info(f"Создан токен для пользователя: {data}")
+    from jose import jwt
+    logger.debug("Создан токен для пользователя id=%s", data.get("sub"))
     to_encode = data.copy()
     expire = datetime.now() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_access_token(token: str):
+    from jose import jwt, JWTError
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError as e:
-        logger.warning(f"Ошибка декодирования токена: {e}")
+        logger.warning("Ошибка декодирования токена: %s", e)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
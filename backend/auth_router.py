@@ -2,69 +2,90 @@ from datetime import timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select, insert, update, delete, or_
+from sqlalchemy.exc import IntegrityError
 
 from backend.models import UserRegister, UserLogin
-from backend.database import async_session, UsersOrm
-from backend.auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.database import get_db, UsersOrm, PlaylistsOrm
+from backend.auth import hash_password, verify_and_update_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.router import get_current_user_id
+from backend.admission import admission_control
+from backend.user_cache import user_cache
+from backend.etag import version_store, user_playlists_key, playlist_key
 from backend.logger_config import logger
 
 
-router = APIRouter(prefix="/auth", tags=["Аутентификация"])
-
-async def get_db():
-    async with async_session() as session:
-        yield session
+router = APIRouter(prefix="/auth", tags=["Аутентификация"], dependencies=[Depends(admission_control)])
 
 
 @router.post("/register",status_code=status.HTTP_201_CREATED, summary="Регистрация нового пользователя")
 async def register(user: UserLogin, db: AsyncSession = Depends(get_db)):
-    logger.info(f"Регистрация пользователя: {user.username}/{user.email}")
-    query = await db.execute(
-        select(UsersOrm).where(
-            or_(
-                UsersOrm.email == user.email,
-                UsersOrm.username == user.username
-            )
-        )
-    )
-    existing_user = query.scalar_one_or_none()
-    if existing_user:
-        logger.error(f"Пользователь с таким username или email уже существует: {user.username}/{user.email}")
+    logger.info("Регистрация пользователя: %s/%s", user.username, user.email)
+    hashed_password = await hash_password(user.password)
+    # Уникальность email и username проверяет сама база данных: без SELECT перед INSERT и без гонки между ними
+    try:
+        await db.execute(insert(UsersOrm).values(
+            email=user.email,
+            username=user.username,
+            password=hashed_password
+        ))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.error("Пользователь с таким username или email уже существует: %s/%s", user.username, user.email)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Пользователь с таким username или email уже существует")
-    hashed_password = get_password_hash(user.password)
-    new_user = UsersOrm(
-        email=user.email,
-        username=user.username,
-        password=hashed_password
-    )
-    db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
-    logger.info(f"Пользователь зарегистрирован: {user.username}/{user.email}")
+    logger.info("Пользователь зарегистрирован: %s/%s", user.username, user.email)
     return {"message": "Пользователь успешно зарегистрирован"}
 
 
 @router.post("/login", summary="Вход пользователя")
 async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
-    logger.info(f"Попытка входа пользователя: {user.username or user.email}")
+    logger.info("Попытка входа пользователя: %s", user.username or user.email)
     query = await db.execute(
-        select(UsersOrm).where(
+        select(UsersOrm.id, UsersOrm.password).where(
             or_(
                 UsersOrm.email == user.email,
                 UsersOrm.username == user.username
             )
         )
     )
-    db_user = query.scalar_one_or_none()
+    db_user = query.one_or_none()
+    # Соединение возвращается в пул до bcrypt: хеширование идёт десятки миллисекунд и пул не держит
+    await db.rollback()
 
-    if not db_user or not verify_password(user.password, db_user.password):
-        logger.error(f"Неуспешная попытка входа: {user.username or user.email}")
+    valid, new_hash = (await verify_and_update_password(user.password, db_user.password)
+                       if db_user else (False, None))
+    if not valid:
+        logger.error("Неуспешная попытка входа: %s", user.username or user.email)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверные данные пользователя")
+    if new_hash:
+        # Стоимость bcrypt изменилась (BCRYPT_ROUNDS): сохраняем пароль с новой стоимостью отдельной короткой транзакцией
+        await db.execute(update(UsersOrm).where(UsersOrm.id == db_user.id).values(password=new_hash))
+        await db.commit()
+        logger.info("Хеш пароля обновлён: %s", user.username or user.email)
 
     access_token_expires = ACCESS_TOKEN_EXPIRE_MINUTES
     access_token = create_access_token(
         data={"sub": str(db_user.id)}, expires_delta=timedelta(minutes=access_token_expires)
     )
-    logger.info(f"Пользователь вошел: {user.username or user.email}")
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    logger.info("Пользователь вошел: %s", user.username or user.email)
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.delete("/me", summary="Удалить свой аккаунт",
+               description="Удаляет пользователя одним DELETE; его плейлисты и их треки удаляет база данных "
+                           "через ON DELETE CASCADE")
+async def delete_me(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    logger.info("Пользователь id=%s удаляет свой аккаунт", user_id)
+    # id плейлистов нужны только для сброса их ETag: сами строки удалит каскад
+    playlist_ids = (await db.scalars(select(PlaylistsOrm.id).where(PlaylistsOrm.user_id == user_id))).all()
+    deleted = await db.scalar(delete(UsersOrm).where(UsersOrm.id == user_id).returning(UsersOrm.id))
+    if deleted is None:
+        await db.rollback()
+        logger.warning("Пользователь id=%s не найден при удалении аккаунта", user_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
+    await db.commit()
+    user_cache.invalidate_user(user_id)
+    await version_store.bump(user_playlists_key(user_id), *map(playlist_key, playlist_ids))
+    logger.info("Аккаунт пользователя id=%s удалён вместе с плейлистами: %s", user_id, len(playlist_ids))
+    return {"message": "Аккаунт удалён"}
@@ -0,0 +1,166 @@
+from bisect import bisect_left, insort
+from heapq import heapify, heappop, heappush
+
+import numpy as np
+
+from backend.database import TracksOrm, stream_tracks
+from backend.logger_config import logger
+
+
+KINDS = ("title", "artist", "tag")
+# Больше новых ключей за раз — дешевле досортировать весь массив, чем вставлять по одному
+INSORT_LIMIT = 64
+# Больше любого символа ключа: все ключи с префиксом p лежат в [p, p + PREFIX_END)
+PREFIX_END = "\U0010ffff"
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.casefold().split())
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей для подсказок по префиксу.
+
+    Ключ — нормализованное значение и каждый его хвост с начала слова, поэтому «love» находит
+    и «Love Song», и «Hello Love». Поиск — bisect по массиву, запись — вставка или досортировка.
+
+    У ключа есть вес — наибольшее число треков среди его написаний; над весами в порядке ключей лежит
+    дерево максимумов. Ключи диапазона префикса достаются из него по убыванию веса, так что подсказки —
+    самые популярные среди всех ключей с префиксом за O(limit · log n), а не среди первых по алфавиту.
+    """
+
+    def __init__(self):
+        self.keys: list[str] = []
+        # ключ → {исходное написание: число треков}
+        self.entries: dict[str, dict[str, int]] = {}
+        self.counts = np.zeros(0, dtype=np.int32)
+        # Дерево максимумов над counts: листья в tree[n:2n], у узла i дети 2i и 2i+1; None — пересобрать
+        self.tree: np.ndarray | None = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, values: list[str]):
+        new_keys = []
+        touched = set()
+        for value in values:
+            words = normalize(value).split(" ")
+            for start in range(len(words)):
+                key = " ".join(words[start:])
+                if not key:
+                    continue
+                labels = self.entries.get(key)
+                if labels is None:
+                    labels = self.entries[key] = {}
+                    new_keys.append(key)
+                labels[value] = labels.get(value, 0) + 1
+                touched.add(key)
+        if new_keys:
+            new_keys.sort()
+            # Места вставки — в массиве до вставки, как их ждёт np.insert
+            self.counts = np.insert(self.counts, [bisect_left(self.keys, key) for key in new_keys], 0)
+            if len(new_keys) <= INSORT_LIMIT:
+                for key in new_keys:
+                    insort(self.keys, key)
+            else:
+                self.keys.extend(new_keys)
+                self.keys.sort()
+            self.tree = None
+        for key in touched:
+            self._set_count(bisect_left(self.keys, key), max(self.entries[key].values()))
+
+    def _set_count(self, position: int, count: int):
+        self.counts[position] = count
+        if self.tree is None:
+            return
+        # Числа треков только растут, поэтому максимум поднимается вверх, пока он больше
+        node = position + len(self.counts)
+        while node and self.tree[node] < count:
+            self.tree[node] = count
+            node //= 2
+
+    def _build(self) -> np.ndarray:
+        size = len(self.counts)
+        tree = np.zeros(2 * size, dtype=np.int32)
+        tree[size:] = self.counts
+        # Узлы [low, high) считаются одним срезом: их дети не меньше high и уже посчитаны
+        high = size
+        while high > 1:
+            low = (high + 1) // 2
+            tree[low:high] = np.maximum(tree[2 * low:2 * high:2], tree[2 * low + 1:2 * high:2])
+            high = low
+        self.tree = tree
+        return tree
+
+    def suggest(self, prefix: str, limit: int) -> list[tuple[str, int]]:
+        prefix = normalize(prefix)
+        low, high = bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + PREFIX_END)
+        if low >= high:
+            return []
+        tree = self.tree if self.tree is not None else self._build()
+        size = len(self.counts)
+        # Диапазон раскладывается на O(log n) узлов дерева; дальше — обход по убыванию максимума в узле
+        heap = []
+        low, high = low + size, high + size
+        while low < high:
+            if low & 1:
+                heap.append((-int(tree[low]), low))
+                low += 1
+            if high & 1:
+                high -= 1
+                heap.append((-int(tree[high]), high))
+            low //= 2
+            high //= 2
+        heapify(heap)
+        counts: dict[str, int] = {}
+        while heap:
+            if len(counts) >= limit and -heap[0][0] <= sorted(counts.values(), reverse=True)[limit - 1]:
+                # В оставшихся ключах треков не больше, чем у уже найденных limit подсказок
+                break
+            _, node = heappop(heap)
+            if node < size:
+                heappush(heap, (-int(tree[2 * node]), 2 * node))
+                heappush(heap, (-int(tree[2 * node + 1]), 2 * node + 1))
+                continue
+            for label, count in self.entries[self.keys[node - size]].items():
+                counts[label] = max(counts.get(label, 0), count)
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+class Autocomplete:
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in KINDS}
+        self.max_track_id = 0
+
+    def add_tracks(self, tracks):
+        """Добавляет (id, title, artists, tags, ...) пачкой: массивы досортировываются один раз на пачку"""
+        titles, artists, tags = [], [], []
+        for track_id, title, track_artists, track_tags, *_ in tracks:
+            titles.append(title)
+            tags.extend(dict.fromkeys(track_tags))
+            artists.extend(dict.fromkeys(track_artists))
+            self.max_track_id = max(self.max_track_id, track_id)
+        self.indexes["title"].add(titles)
+        self.indexes["artist"].add(artists)
+        self.indexes["tag"].add(tags)
+
+    def suggest(self, prefix: str, kinds: list[str], limit: int) -> list[tuple[str, str, int]]:
+        return [(kind, value, count) for kind in kinds
+                for value, count in self.indexes[kind].suggest(prefix, limit)]
+
+
+autocomplete = Autocomplete()
+
+
+async def init_autocomplete():
+    """Собирает индексы подсказок из базы данных и догоняет треками, добавленными после сборки"""
+    batch = []
+    async for row in stream_tracks(TracksOrm.title, TracksOrm.artists, TracksOrm.tags,
+                                   after_id=autocomplete.max_track_id):
+        batch.append(row)
+        if len(batch) >= 10_000:
+            autocomplete.add_tracks(batch)
+            batch = []
+    autocomplete.add_tracks(batch)
+    logger.info("Индекс подсказок готов: названий=%s, исполнителей=%s, тегов=%s",
+                *(len(autocomplete.indexes[kind]) for kind in KINDS))
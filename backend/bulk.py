@@ -0,0 +1,149 @@
+import os
+import csv
+import json
+import uuid
+import codecs
+
+import asyncpg
+from pydantic import ValidationError
+from sqlalchemy import select, insert, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.settings import get_settings
+from backend.database import TracksOrm
+from backend.models import TrackAdd
+
+
+CSV_COLUMNS = ["title", "artists", "tags", "url"]
+MAX_ERRORS_PER_BATCH = 100
+# Куда сохраняются файлы фоновой загрузки до её выполнения; общий для процессов uvicorn на одной машине
+BULK_SPOOL_DIR = get_settings().bulk_spool_dir
+SPOOL_CHUNK = 1 << 16
+
+
+async def iter_lines(chunks):
+    """Построчно декодирует поток байтов тела запроса, не собирая его целиком в памяти"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def spool_upload(chunks, upload_format: str) -> tuple[str, int]:
+    """Сохраняет поток тела запроса в BULK_SPOOL_DIR; возвращает путь и размер файла"""
+    os.makedirs(BULK_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(BULK_SPOOL_DIR, f"{uuid.uuid4().hex}.{upload_format}")
+    size = 0
+    with open(path, "wb") as f:
+        async for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+    return path, size
+
+
+async def read_spooled(path: str, counter: list[int]):
+    """Читает сохранённый файл кусками; counter[0] — сколько байт прочитано (для прогресса задачи)"""
+    with open(path, "rb") as f:
+        while chunk := f.read(SPOOL_CHUNK):
+            counter[0] += len(chunk)
+            yield chunk
+
+
+def describe_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+                         for error in e.errors())
+    return str(e)
+
+
+def parse_line(line: str, upload_format: str, header: list[str] | None) -> dict:
+    if upload_format == "csv":
+        values = next(csv.reader([line]))
+        row = dict(zip(header, values))
+        return {
+            "title": row.get("title"),
+            "artists": [value for value in (row.get("artists") or "").split("|") if value],
+            "tags": [value for value in (row.get("tags") or "").split("|") if value],
+            "url": row.get("url"),
+        }
+    return json.loads(line)
+
+
+async def iter_batches(lines, upload_format: str, batch_size: int):
+    """Отдаёт пачки (валидные треки, ошибки) с номерами строк исходного файла"""
+    header = None
+    tracks: list[TrackAdd] = []
+    errors: list[dict] = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        if upload_format == "csv" and header is None:
+            header = [column.strip() for column in next(csv.reader([line]))]
+            missing = [column for column in CSV_COLUMNS if column not in header]
+            if missing:
+                raise ValueError(f"В заголовке CSV нет колонок: {', '.join(missing)}")
+            continue
+        try:
+            tracks.append(TrackAdd.model_validate(parse_line(line, upload_format, header)))
+        except (ValidationError, ValueError) as e:
+            errors.append({"line": line_number, "error": describe_error(e)})
+        if len(tracks) + len(errors) >= batch_size:
+            yield tracks, errors
+            tracks, errors = [], []
+    if tracks or errors:
+        yield tracks, errors
+
+
+def dedupe_batch(tracks: list[TrackAdd]) -> list[TrackAdd]:
+    unique = {}
+    for track in tracks:
+        unique.setdefault((track.title, tuple(track.artists)), track)
+    return list(unique.values())
+
+
+async def insert_batch_copy(db: AsyncSession, tracks: list[TrackAdd], dedupe: bool):
+    """COPY во временную таблицу и один INSERT ... SELECT ... RETURNING в tracks"""
+    await db.execute(text("CREATE TEMP TABLE tracks_staging "
+                          "(title varchar(255), artists varchar(255)[], tags varchar(255)[], url varchar(255)) "
+                          "ON COMMIT DROP"))
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    try:
+        await raw.driver_connection.copy_records_to_table(
+            "tracks_staging", columns=CSV_COLUMNS,
+            records=[(track.title, track.artists, track.tags, track.url) for track in tracks])
+    except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        # COPY идёт мимо DBAPI-адаптера: ошибку asyncpg оборачиваем, как SQLAlchemy оборачивает ошибки execute,
+        # чтобы load_batch записал её в отчёт пачки, а не уронил весь запрос
+        raise DBAPIError("COPY tracks_staging", None, e) from e
+    condition = ("WHERE NOT EXISTS (SELECT 1 FROM tracks t WHERE t.title = s.title AND t.artists = s.artists)"
+                 if dedupe else "")
+    result = await db.execute(text(f"INSERT INTO tracks (title, artists, tags, url) "
+                                   f"SELECT s.title, s.artists, s.tags, s.url FROM tracks_staging s {condition} "
+                                   f"RETURNING id, title, artists, tags, url"))
+    return result.all()
+
+
+async def insert_batch_values(db: AsyncSession, tracks: list[TrackAdd], dedupe: bool):
+    """Многострочный INSERT ... VALUES ... RETURNING — для драйверов без COPY"""
+    if dedupe:
+        existing = await db.execute(select(TracksOrm.title, TracksOrm.artists)
+                                    .where(TracksOrm.title.in_({track.title for track in tracks})))
+        known = {(title, tuple(artists)) for title, artists in existing.all()}
+        tracks = [track for track in tracks if (track.title, tuple(track.artists)) not in known]
+    if not tracks:
+        return []
+    result = await db.execute(insert(TracksOrm)
+                              .values([track.model_dump() for track in tracks])
+                              .returning(TracksOrm.id, TracksOrm.title, TracksOrm.artists, TracksOrm.tags, TracksOrm.url))
+    return result.all()
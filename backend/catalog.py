@@ -0,0 +1,243 @@
+import os
+import shutil
+import argparse
+import asyncio
+from array import array
+from bisect import bisect_right, insort
+
+import numpy as np
+
+from backend.settings import get_settings
+from backend.database import TracksOrm, stream_tracks, dispose_engines
+from backend.logger_config import logger, configure_logging
+
+
+settings = get_settings()
+# Реплика каталога в памяти процесса: GET /tracks и треки плейлистов читаются из неё, а не из базы
+CATALOG_REPLICA = settings.catalog_replica
+CATALOG_SNAPSHOT_PATH = settings.catalog_snapshot_path
+COLUMNS = ("ids", "titles", "urls", "artist_offsets", "artist_values", "tag_offsets", "tag_values",
+           "string_offsets", "strings")
+
+
+class CatalogReplica:
+    """Каталог треков в колонках numpy вместо объектов TracksOrm.
+
+    Все строки (названия, url, исполнители, теги) интернированы в один пул UTF-8 байт со смещениями,
+    трек хранит номера строк: название и url — по одному int32, исполнители и теги — срезы массивов
+    int32 в формате CSR. Снимок открывается через np.load(mmap_mode="r"), поэтому воркеры делят одну
+    копию в page cache. Треки, добавленные после снимка, лежат в словаре extra в памяти процесса.
+    """
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.titles = np.zeros(0, dtype=np.int32)
+        self.urls = np.zeros(0, dtype=np.int32)
+        self.artist_offsets = np.zeros(1, dtype=np.int64)
+        self.artist_values = np.zeros(0, dtype=np.int32)
+        self.tag_offsets = np.zeros(1, dtype=np.int64)
+        self.tag_values = np.zeros(0, dtype=np.int32)
+        self.string_offsets = np.zeros(1, dtype=np.int64)
+        self.strings = np.zeros(0, dtype=np.uint8)
+        self._buffer = memoryview(self.strings)
+        # Исполнители и теги повторяются, поэтому их раскодированные строки держим в словаре
+        self._names: dict[int, str] = {}
+        self.extra: dict[int, dict] = {}
+        self.extra_ids: list[int] = []
+        self.max_track_id = 0
+        self.ready = False
+
+    def __len__(self):
+        return len(self.ids) + len(self.extra)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self.extra or self._find([track_id])[0] >= 0
+
+    def _strings(self, string_ids: np.ndarray) -> list[str]:
+        starts = self.string_offsets[string_ids].tolist()
+        ends = self.string_offsets[string_ids + 1].tolist()
+        buffer = self._buffer
+        return [bytes(buffer[start:end]).decode() for start, end in zip(starts, ends)]
+
+    def _names_of(self, values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> list[list[str]]:
+        """Срезы CSR-колонки (исполнители или теги) для строк rows одним обращением к массивам"""
+        starts, ends = offsets[rows], offsets[rows + 1]
+        lengths = ends - starts
+        # Индексы всех элементов всех срезов подряд: start строки + номер элемента внутри неё
+        index = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        string_ids = values[index].tolist()
+        missing = [string_id for string_id in set(string_ids) if string_id not in self._names]
+        if missing:
+            self._names.update(zip(missing, self._strings(np.array(missing, dtype=np.int64))))
+        names = [self._names[string_id] for string_id in string_ids]
+        result, position = [], 0
+        for length in lengths.tolist():
+            result.append(names[position:position + length])
+            position += length
+        return result
+
+    def _rows(self, rows: np.ndarray) -> list[dict]:
+        """Треки по номерам строк снимка: по одному векторному обращению на колонку, а не на трек"""
+        rows = np.asarray(rows, dtype=np.int64)
+        return [{"id": track_id, "title": title, "artists": artists, "tags": tags, "url": url}
+                for track_id, title, artists, tags, url in zip(
+                    self.ids[rows].tolist(),
+                    self._strings(self.titles[rows].astype(np.int64)),
+                    self._names_of(self.artist_values, self.artist_offsets, rows),
+                    self._names_of(self.tag_values, self.tag_offsets, rows),
+                    self._strings(self.urls[rows].astype(np.int64)))]
+
+    def _find(self, track_ids: list[int]) -> np.ndarray:
+        """Номера строк снимка для track_ids; -1 — трека в снимке нет"""
+        rows = np.searchsorted(self.ids, track_ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == np.asarray(track_ids)[found]
+        return np.where(found, rows, -1)
+
+    def get(self, track_id: int) -> dict | None:
+        tracks, _ = self.get_many([track_id])
+        return tracks[0] if tracks else None
+
+    def get_many(self, track_ids: list[int]) -> tuple[list[dict], list[int]]:
+        """Треки в порядке track_ids и id, которых в реплике ещё нет"""
+        if not track_ids:
+            return [], []
+        rows = self._find(track_ids)
+        base = iter(self._rows(rows[rows >= 0]))
+        tracks, missing = [], []
+        for track_id, row in zip(track_ids, rows.tolist()):
+            if row >= 0:
+                tracks.append(next(base))
+            elif track_id in self.extra:
+                tracks.append(self.extra[track_id])
+            else:
+                missing.append(track_id)
+        return tracks, missing
+
+    def page(self, limit: int, offset: int = 0, after_id: int | None = None) -> list[dict]:
+        """Как select ... order by id limit/offset или where id > after_id: снимок, затем extra"""
+        if after_id is not None:
+            start = int(np.searchsorted(self.ids, after_id, side="right"))
+            extra_start = bisect_right(self.extra_ids, after_id)
+        else:
+            start = min(offset, len(self.ids))
+            extra_start = max(0, offset - len(self.ids))
+        tracks = self._rows(np.arange(start, min(start + limit, len(self.ids))))
+        for track_id in self.extra_ids[extra_start:extra_start + limit - len(tracks)]:
+            tracks.append(self.extra[track_id])
+        return tracks
+
+    def add_track(self, track_id: int, title: str, artists: list[str], tags: list[str], url: str):
+        if track_id in self:
+            return
+        self.extra[track_id] = {"id": track_id, "title": title, "artists": list(artists), "tags": list(tags),
+                                "url": url}
+        insort(self.extra_ids, track_id)
+        self.max_track_id = max(self.max_track_id, track_id)
+
+    def build(self, rows):
+        """Строит колонки из (id, title, artists, tags, url), отсортированных по id"""
+        self.__init__()
+        interned: dict[str, int] = {}
+        ids, titles, urls = array("q"), array("i"), array("i")
+        artist_values, tag_values = array("i"), array("i")
+        artist_offsets, tag_offsets = array("q", [0]), array("q", [0])
+
+        def intern(value: str) -> int:
+            string_id = interned.get(value)
+            if string_id is None:
+                string_id = interned[value] = len(interned)
+            return string_id
+
+        for track_id, title, artists, tags, url in rows:
+            ids.append(track_id)
+            titles.append(intern(title))
+            urls.append(intern(url))
+            artist_values.extend(intern(artist) for artist in artists)
+            tag_values.extend(intern(tag) for tag in tags)
+            artist_offsets.append(len(artist_values))
+            tag_offsets.append(len(tag_values))
+
+        encoded = [value.encode() for value in interned]
+        self.ids, self.titles, self.urls = (np.frombuffer(ids, dtype=np.int64), np.frombuffer(titles, dtype=np.int32),
+                                            np.frombuffer(urls, dtype=np.int32))
+        self.artist_values = np.frombuffer(artist_values, dtype=np.int32)
+        self.tag_values = np.frombuffer(tag_values, dtype=np.int32)
+        self.artist_offsets = np.frombuffer(artist_offsets, dtype=np.int64)
+        self.tag_offsets = np.frombuffer(tag_offsets, dtype=np.int64)
+        self.string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=self.string_offsets[1:])
+        self.strings = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self._buffer = memoryview(self.strings)
+        self.max_track_id = int(self.ids[-1]) if len(self.ids) else 0
+
+    def rows(self, chunk: int = 10_000):
+        for start in range(0, len(self.ids), chunk):
+            for track in self._rows(np.arange(start, min(start + chunk, len(self.ids)))):
+                yield track["id"], track["title"], track["artists"], track["tags"], track["url"]
+        for track_id in self.extra_ids:
+            track = self.extra[track_id]
+            yield track_id, track["title"], track["artists"], track["tags"], track["url"]
+
+    def save(self, path: str):
+        snapshot = CatalogReplica()
+        snapshot.build(self.rows())
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in COLUMNS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(snapshot, name))
+        if os.path.exists(path):
+            os.replace(path, f"{path}.old")
+        os.replace(tmp_path, path)
+        shutil.rmtree(f"{path}.old", ignore_errors=True)
+
+    def load(self, path: str):
+        self.__init__()
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self._buffer = memoryview(self.strings)
+        self.max_track_id = int(self.ids[-1]) if len(self.ids) else 0
+
+
+catalog = CatalogReplica()
+
+
+async def catch_up(after_id: int) -> int:
+    added = 0
+    async for track_id, title, artists, tags, url in stream_tracks(TracksOrm.title, TracksOrm.artists,
+                                                                   TracksOrm.tags, TracksOrm.url,
+                                                                   after_id=after_id):
+        if track_id not in catalog:
+            catalog.add_track(track_id, title, artists, tags, url)
+            added += 1
+    return added
+
+
+async def init_catalog():
+    """Открывает снимок каталога (CATALOG_SNAPSHOT_PATH) и догоняет его треками, добавленными после сборки"""
+    if os.path.isdir(CATALOG_SNAPSHOT_PATH):
+        catalog.load(CATALOG_SNAPSHOT_PATH)
+        logger.info("Снимок каталога загружен из %s: треков=%s", CATALOG_SNAPSHOT_PATH, len(catalog.ids))
+    else:
+        logger.warning("Снимок каталога %s не найден, реплика будет собрана из базы данных", CATALOG_SNAPSHOT_PATH)
+    added = await catch_up(catalog.max_track_id)
+    catalog.ready = True
+    logger.info("Реплика каталога готова: треков=%s, догружено=%s", len(catalog), added)
+
+
+async def rebuild(path: str):
+    replica = CatalogReplica()
+    replica.build([row async for row in stream_tracks(TracksOrm.title, TracksOrm.artists, TracksOrm.tags,
+                                                      TracksOrm.url)])
+    replica.save(path)
+    await dispose_engines()
+    logger.info("Снимок каталога пересобран: треков=%s, строк=%s, снимок=%s",
+                len(replica), len(replica.string_offsets) - 1, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-пересборка снимка каталога треков")
+    parser.add_argument("--out", default=CATALOG_SNAPSHOT_PATH)
+    configure_logging()
+    asyncio.run(rebuild(parser.parse_args().out))
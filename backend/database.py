@@ -1,22 +1,190 @@
-import os
+import time
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
 
-from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, ARRAY, ForeignKey
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy import (String, Text, BigInteger, Boolean, Float, DateTime, ForeignKey, Index, JSON, DDL, event, func,
+                        select, text)
+from sqlalchemy.dialects.postgresql import ARRAY
 
+from backend.settings import Settings, get_settings
+from backend.query_stats import instrument
+from backend.metrics import db_pool_wait
 
-load_dotenv()
-DB_LOGIN = os.getenv("DB_LOGIN")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
 
+# Сколько секунд после записи реплика может отставать: в это окно ответы из неё не получают ETag
+DB_REPLICA_MAX_LAG = get_settings().db_replica_max_lag
 
-engine = create_async_engine(f'postgresql+asyncpg://{DB_LOGIN}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
 
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+@dataclass(slots=True)
+class PoolStats:
+    checkouts: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    timeouts: int = 0
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет ожидание свободного соединения (вместе с открытием нового, если пул не полон)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self.wait_histogram = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.stats.checkouts += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+            if self.wait_histogram is not None:
+                self.wait_histogram.observe(waited)
+
+    def recreate(self):
+        # pool_pre_ping и dispose() пересоздают пул: счётчики переносим, чтобы метрики не обнулялись
+        pool = super().recreate()
+        pool.stats = self.stats
+        pool.wait_histogram = self.wait_histogram
+        return pool
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, _):
+    # SQLite по умолчанию не проверяет внешние ключи и не выполняет ON DELETE CASCADE
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def create_engine_from_url(url: str, name: str = "primary", settings: Settings | None = None, **options):
+    """Движок с настройками пула из settings (по умолчанию — процесса); options перекрывают их (нужно бенчмаркам)"""
+    settings = settings or get_settings()
+    url = make_url(url)
+    connect_args = {}
+    if url.get_driver_name() == "asyncpg":
+        connect_args = {"statement_cache_size": settings.db_statement_cache_size,
+                        "command_timeout": settings.db_command_timeout}
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.db_statement_cache_size)})
+    pool_settings = dict(poolclass=TimedQueuePool,
+                         pool_size=settings.db_pool_size,
+                         max_overflow=settings.db_max_overflow,
+                         pool_timeout=settings.db_pool_timeout,
+                         pool_recycle=settings.db_pool_recycle,
+                         pool_pre_ping=settings.db_pool_pre_ping,
+                         connect_args=connect_args)
+    db_engine = create_async_engine(url, **(pool_settings | options))
+    if url.get_backend_name() == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", enable_sqlite_foreign_keys)
+    db_engine.pool.wait_histogram = db_pool_wait.labels(name)
+    instrument(db_engine, name)
+    return db_engine
+
+
+class LazySessionmaker(async_sessionmaker):
+    """Фабрика сессий, которая при первом вызове без lifespan (скрипты, бенчмарки) сама создаёт движки"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            init_engines()
+        return super().__call__(**local_kw)
+
+
+# Движки создаются в lifespan приложения (init_engines), а не при импорте: импорт не открывает
+# соединений и не загружает драйвер базы. Сессии привязываются к движкам там же.
+async_session = LazySessionmaker(expire_on_commit=False)
+read_session = LazySessionmaker(expire_on_commit=False)
+_engines: dict = {}
+
+
+def init_engines(settings: Settings | None = None):
+    """Создаёт основной движок и движок реплики (без DATABASE_READ_URL — тот же) и привязывает к ним сессии"""
+    if _engines:
+        return _engines["primary"], _engines["replica"]
+    settings = settings or get_settings()
+    primary = create_engine_from_url(settings.database_url, settings=settings)
+    replica = (create_engine_from_url(settings.database_read_url, "replica", settings=settings)
+               if settings.database_read_url else primary)
+    _engines.update(primary=primary, replica=replica)
+    async_session.configure(bind=primary)
+    read_session.configure(bind=replica)
+    return primary, replica
+
+
+async def warm_up_pool(db_engine, connections: int):
+    """Открывает connections соединений одновременно и возвращает их в пул: первые запросы их не ждут"""
+    async def connect():
+        async with db_engine.connect() as conn:
+            await conn.exec_driver_sql("SELECT 1")
+
+    await asyncio.gather(*(connect() for _ in range(min(connections, db_engine.pool.size()))))
+
+
+async def dispose_engines():
+    """Закрывает соединения и забывает движки; следующий init_engines() (например, в дочернем процессе) создаст новые"""
+    engines = {id(db_engine): db_engine for db_engine in _engines.values()}
+    _engines.clear()
+    async_session.configure(bind=None)
+    read_session.configure(bind=None)
+    for db_engine in engines.values():
+        await db_engine.dispose()
+
+
+def __getattr__(name: str):
+    # from backend.database import engine — в скриптах и бенчмарках движок создаётся при первом обращении
+    if name == "engine":
+        return init_engines()[0]
+    if name == "read_engine":
+        return init_engines()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def get_db():
+    async with async_session() as session:
+        yield session
+
+
+async def get_read_db():
+    # Без DATABASE_READ_URL это тот же основной пул
+    async with read_session() as session:
+        yield session
+
+
+def pool_metrics() -> dict[str, dict]:
+    engines = {}
+    if _engines:
+        engines["primary"] = _engines["primary"]
+        if _engines["replica"] is not _engines["primary"]:
+            engines["replica"] = _engines["replica"]
+    metrics = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        metrics[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.stats.checkouts,
+            "wait_seconds_total": round(pool.stats.wait_seconds, 6),
+            "wait_seconds_max": round(pool.stats.max_wait_seconds, 6),
+            "timeouts": pool.stats.timeouts,
+        }
+    return metrics
+
+
+def string_array():
+    # На SQLite (локальные проверки без Postgres) массивы хранятся как JSON
+    return ARRAY(String(255)).with_variant(JSON(), "sqlite")
+
 
 class Model(DeclarativeBase):
     pass
@@ -25,40 +193,121 @@ class Model(DeclarativeBase):
 class TracksOrm(Model):
     __tablename__ = 'tracks'
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
-    artists: Mapped[list[str]] = mapped_column(ARRAY(String(255)), nullable=False)
-    tags: Mapped[list[str]] = mapped_column(ARRAY(String(255)), nullable=False)
+    artists: Mapped[list[str]] = mapped_column(string_array(), nullable=False)
+    tags: Mapped[list[str]] = mapped_column(string_array(), nullable=False)
     url: Mapped[str] = mapped_column(String(255), nullable=False)
 
+    __table_args__ = (
+        Index('ix_tracks_tags', 'tags', postgresql_using='gin'),
+        Index('ix_tracks_artists', 'artists', postgresql_using='gin'),
+        # Дедупликация массовой загрузки: NOT EXISTS (... t.title = s.title ...) и title IN (...)
+        Index('ix_tracks_title', 'title'),
+        Index('ix_tracks_title_trgm', 'title', postgresql_using='gin',
+              postgresql_ops={'title': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+
+def artists_text(artists):
+    """Исполнители одной строкой; то же выражение, что в индексе ix_tracks_artists_trgm"""
+    return func.tracks_artists_text(artists)
+
+
+# pg_trgm и неизменяемая обёртка над array_to_string (сама она STABLE и в индекс не годится);
+# миграция 3127d4587b38 создаёт то же самое, а здесь — для create_all
+event.listen(Model.metadata, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
+event.listen(Model.metadata, "before_create",
+             DDL("CREATE OR REPLACE FUNCTION tracks_artists_text(varchar[]) RETURNS text LANGUAGE sql "
+                 "IMMUTABLE PARALLEL SAFE AS $$ SELECT array_to_string($1, ' ') $$").execute_if(dialect='postgresql'))
+Index('ix_tracks_artists_trgm', artists_text(TracksOrm.artists).label('artists_text'), postgresql_using='gin',
+      postgresql_ops={'artists_text': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
 
 class UsersOrm(Model):
     __tablename__ = 'users'
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(String(255), unique=True)
     username: Mapped[str] = mapped_column(String(255), unique=True)
     password: Mapped[str] = mapped_column(String(255), nullable=False)
 
-    playlists = relationship("PlaylistsOrm", back_populates="user", cascade="all, delete-orphan")
+    # Плейлисты и их треки удаляет сама база (ON DELETE CASCADE), ORM не загружает их перед удалением
+    playlists = relationship("PlaylistsOrm", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class PlaylistsOrm(Model):
     __tablename__ = 'playlists'
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]  = mapped_column(String(255), nullable=False)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
 
     user = relationship("UsersOrm", back_populates="playlists")
-    tracks = relationship("PlaylistTracksOrm", back_populates="playlist", cascade="all, delete-orphan")
+    tracks = relationship("PlaylistTracksOrm", back_populates="playlist", cascade="all, delete-orphan",
+                          passive_deletes=True)
+
+    __table_args__ = (
+        # GET /playlists: плейлисты пользователя по порядку id с курсором id > after
+        Index('ix_playlists_user_id_id', 'user_id', 'id'),
+    )
 
 
 class PlaylistTracksOrm(Model):
     __tablename__ = 'playlist_tracks'
 
-    playlist_id: Mapped[int] = mapped_column(ForeignKey('playlists.id'), index=True, primary_key=True)
+    # Отдельный индекс по playlist_id не нужен: это префикс первичного ключа (playlist_id, track_id)
+    playlist_id: Mapped[int] = mapped_column(ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True)
     track_id: Mapped[int] = mapped_column(ForeignKey('tracks.id'), index=True, primary_key=True)
+    # Порядок трека в плейлисте: ключи с промежутками (см. backend/positions.py), при равенстве — по track_id
+    position: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
     playlist = relationship("PlaylistsOrm", back_populates="tracks")
     track = relationship("TracksOrm")
+
+    __table_args__ = (
+        # Треки плейлиста по порядку (position, track_id) и id треков для реплики каталога — index-only scan
+        Index('ix_playlist_tracks_playlist_id_position_track_id', 'playlist_id', 'position', 'track_id'),
+    )
+
+
+class JobsOrm(Model):
+    __tablename__ = 'jobs'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    # queued → running → succeeded | failed | cancelled; при повторе после ошибки снова queued
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # Итог задачи; пока она выполняется — сохранённое ею промежуточное состояние (для продолжения после сбоя)
+    result: Mapped[dict | None] = mapped_column(JSON)
+    error: Mapped[str | None] = mapped_column(Text)
+    progress: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    # Номер попытки; он же маркер владения — записи воркера, чья аренда истекла, не применяются
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(nullable=False)
+    # queued — не раньше этого времени (отсрочка повтора), running — до этого времени действует аренда воркера
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    user_id: Mapped[int | None] = mapped_column(ForeignKey('users.id', ondelete='SET NULL'))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Выбор следующей задачи: только незавершённые, по времени доступности
+        Index('ix_jobs_available_at', 'available_at', postgresql_where=text("status IN ('queued', 'running')"),
+              sqlite_where=text("status IN ('queued', 'running')")),
+    )
+
+
+async def stream_tracks(*columns, after_id: int = 0, sessionmaker=None):
+    """Потоково отдаёт (id, *columns) всех треков с id > after_id через серверный курсор"""
+    async with (sessionmaker or read_session)() as session:
+        result = await session.stream(select(TracksOrm.id, *columns)
+                                      .where(TracksOrm.id > after_id)
+                                      .order_by(TracksOrm.id)
+                                      .execution_options(yield_per=10_000))
+        async for row in result:
+            yield row
@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+import uuid
+import zlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Request, Response, status
+
+from backend.settings import get_settings
+from backend.database import DB_REPLICA_MAX_LAG
+
+
+# Пусто — счётчики в памяти процесса; sqlite:///path/versions.db — общий файл для нескольких воркеров uvicorn
+VERSION_STORE_URL = get_settings().version_store_url
+
+
+class MemoryVersionStore:
+    """Счётчики версий ресурсов в памяти процесса"""
+
+    def __init__(self):
+        self.reopen()
+
+    def reopen(self):
+        # Эпоха меняется при каждом запуске, поэтому ETag прошлого процесса или соседнего воркера не совпадёт
+        self.epoch = uuid.uuid4().hex[:12]
+        self._versions: dict[str, tuple[int, float]] = {}
+
+    async def get(self, key: str) -> tuple[int, float]:
+        """(версия, время последнего изменения)"""
+        return self._versions.get(key, (0, 0.0))
+
+    async def bump(self, *keys: str):
+        now = time.time()
+        for key in keys:
+            self._versions[key] = (self._versions.get(key, (0, 0.0))[0] + 1, now)
+
+
+class SqliteVersionStore:
+    """Счётчики в файле SQLite, общем для всех воркеров на одной машине.
+
+    sqlite3 блокирующий, а запись соседнего воркера держит блокировку файла: запросы идут в отдельном
+    потоке, чтобы ожидание не останавливало цикл событий. Поток один — соединение не делится между потоками.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._inherited = []
+        self._open()
+
+    def reopen(self):
+        # Соединение SQLite нельзя использовать после fork, а закрывать его в дочернем процессе — тоже:
+        # оно остаётся нетронутым, дочерний процесс открывает своё
+        self._inherited.append(self._conn)
+        self._open()
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versions "
+                           "(key TEXT PRIMARY KEY, version INTEGER NOT NULL, changed_at REAL NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO versions VALUES ('__epoch__', ?, 0)", (uuid.uuid4().int >> 80,))
+        self.epoch = format(self._conn.execute("SELECT version FROM versions WHERE key = '__epoch__'").fetchone()[0], "x")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="version-store")
+
+    async def get(self, key: str) -> tuple[int, float]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._get, key)
+
+    async def bump(self, *keys: str):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._bump, keys)
+
+    def _get(self, key: str) -> tuple[int, float]:
+        row = self._conn.execute("SELECT version, changed_at FROM versions WHERE key = ?", (key,)).fetchone()
+        return row or (0, 0.0)
+
+    def _bump(self, keys: tuple[str, ...]):
+        now = time.time()
+        self._conn.executemany("INSERT INTO versions VALUES (?, 1, ?) "
+                               "ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at",
+                               [(key, now) for key in keys])
+
+
+def create_version_store(url: str = VERSION_STORE_URL):
+    if not url:
+        return MemoryVersionStore()
+    if url.startswith("sqlite:///"):
+        return SqliteVersionStore(url.removeprefix("sqlite:///"))
+    raise RuntimeError(f"Неподдерживаемое хранилище версий: {url}")
+
+
+version_store = create_version_store()
+# Воркеры backend.serve создаются fork после импорта: каждому — своё соединение и поток
+os.register_at_fork(after_in_child=version_store.reopen)
+
+
+def require_shared_version_store(workers: int):
+    """Счётчики в памяти у каждого воркера свои: запись в одном не меняет ETag, выданные другими, и клиент
+    получит 304 на устаревшие данные. Поэтому с несколькими воркерами приложение без общего хранилища не стартует"""
+    if workers > 1 and isinstance(version_store, MemoryVersionStore):
+        raise RuntimeError(f"Воркеров {workers}, а хранилище версий ETag в памяти процесса: "
+                           "задайте VERSION_STORE_URL=sqlite:///path/versions.db")
+
+
+def tracks_key() -> str:
+    return "tracks"
+
+
+def user_playlists_key(user_id: int) -> str:
+    return f"playlists:{user_id}"
+
+
+def playlist_key(playlist_id: int) -> str:
+    return f"playlist:{playlist_id}"
+
+
+async def conditional_response(request: Request, response: Response, key: str,
+                               private: bool, *vary, max_lag: float = DB_REPLICA_MAX_LAG) -> Response | None:
+    """Ставит ETag и Cache-Control; если клиент прислал тот же ETag, возвращает готовый 304.
+
+    Версию нужно читать до запроса к базе данных: запись повышает её после commit, поэтому в худшем
+    случае свежие данные получат старый ETag и клиент лишний раз их перезапросит, но не наоборот.
+    max_lag — насколько источник чтения может отставать от записи (реплика базы, реплика каталога).
+    """
+    version, changed_at = await version_store.get(key)
+    if time.time() - changed_at < max_lag:
+        # Чтение идёт с реплики, которая могла ещё не догнать запись: такой ответ не кешируем вовсе
+        response.headers["Cache-Control"] = "no-store"
+        return None
+    # Параметры запроса и пользователь входят в ETag: разные представления одного ресурса не смешиваются
+    variant = zlib.crc32("\n".join([request.url.query, *map(str, vary)]).encode())
+    etag = f'"{version_store.epoch}-{version}-{variant:x}"'
+    headers = {"ETag": etag, "Cache-Control": f"{'private' if private else 'public'}, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,42 @@
+import numpy as np
+
+from backend.tag_graph import tag_graph
+
+
+# Вес ассоциированного тега относительно тега-семени
+ASSOCIATION_WEIGHT = 0.5
+RELATED_PER_SEED = 20
+
+
+def expand_tags(seed_tags: list[str]) -> dict[str, float]:
+    """Веса тегов: семена плюс их соседи по графу совместной встречаемости"""
+    weights = {}
+    for tag in seed_tags:
+        weights[tag] = weights.get(tag, 0.0) + 1.0
+    for tag, seed_weight in list(weights.items()):
+        for related, score, _ in tag_graph.related(tag, RELATED_PER_SEED) or []:
+            weights[related] = weights.get(related, 0.0) + seed_weight * score * ASSOCIATION_WEIGHT
+    return weights
+
+
+def sample_tracks(candidate_tags: list[list[str]], weights: dict[str, float], size: int,
+                  rng: np.random.Generator) -> np.ndarray:
+    """Взвешенная выборка без возвращения: индексы кандидатов, вероятность пропорциональна сумме весов тегов"""
+    if not candidate_tags:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.fromiter((len(tags) for tags in candidate_tags), dtype=np.int64, count=len(candidate_tags))
+    flat = np.fromiter((weights.get(tag, 0.0) for tags in candidate_tags for tag in tags),
+                       dtype=np.float64, count=int(lengths.sum()))
+    scores = np.zeros(len(candidate_tags))
+    non_empty = lengths > 0
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    scores[non_empty] = np.add.reduceat(flat, offsets[non_empty]) if len(flat) else 0.0
+
+    # Gumbel-top-k: argmax(log w + Gumbel) без возвращения эквивалентно последовательной выборке ~ w
+    with np.errstate(divide="ignore"):
+        keys = np.log(scores) + rng.gumbel(size=len(scores))
+    size = min(size, int(np.count_nonzero(scores > 0)))
+    if size == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-keys, size - 1)[:size]
+    return top[np.argsort(-keys[top])]
@@ -0,0 +1,120 @@
+import os
+import asyncio
+
+import numpy as np
+from sqlalchemy import select, func
+
+from backend.settings import get_settings
+from backend.database import TracksOrm, stream_tracks
+from backend.bulk import (iter_lines, iter_batches, read_spooled, insert_batch_copy, insert_batch_values,
+                          MAX_ERRORS_PER_BATCH)
+from backend.router import load_batch
+from backend.jobs import job_handler, job_runner, JobContext, PermanentJobError
+from backend.tag_graph import TagGraph, init_tag_graph
+from backend.similarity import SimilarityIndex, encode, init_similarity_index, DIM
+from backend.logger_config import logger
+
+
+# Как часто (в строках) обработчики пересборки обновляют прогресс
+PROGRESS_EVERY = 10_000
+
+
+async def count_tracks(ctx: JobContext) -> int:
+    async with ctx.sessionmaker() as db:
+        return await db.scalar(select(func.count()).select_from(TracksOrm))
+
+
+async def counted(rows, ctx: JobContext, total: int):
+    done = 0
+    async for row in rows:
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            ctx.report(done, total)
+        yield row
+
+
+@job_handler("tracks_import")
+async def import_tracks(ctx: JobContext) -> dict:
+    """Фоновая массовая загрузка из файла, сохранённого POST /tracks/bulk?background=true.
+
+    Номер последней загруженной пачки сохраняется вместе с ней, поэтому повтор после сбоя продолжает
+    со следующей пачки, а не вставляет треки заново.
+    """
+    payload = ctx.payload
+    path = payload["path"]
+    if not os.path.exists(path):
+        raise PermanentJobError(f"Файл загрузки {path} не найден")
+    summary = ctx.state or {"batches": 0, "inserted": 0, "skipped": 0, "failed": 0, "errors": []}
+    insert_batch = insert_batch_copy if payload["method"] == "copy" else insert_batch_values
+    read = [0]
+
+    async def checkpoint(db, report):
+        summary["batches"] = report.batch
+        summary["inserted"] += report.inserted
+        summary["skipped"] += report.skipped
+        summary["failed"] += report.failed
+        room = MAX_ERRORS_PER_BATCH - len(summary["errors"])
+        summary["errors"] += [error.model_dump() for error in report.errors[:max(0, room)]]
+        ctx.report(read[0], payload["size"])
+        await ctx.checkpoint(db, summary)
+
+    finished = False
+    try:
+        async with ctx.sessionmaker() as db:
+            number = 0
+            async for tracks, errors in iter_batches(iter_lines(read_spooled(path, read)), payload["format"],
+                                                     payload["batch_size"]):
+                number += 1
+                if number <= summary["batches"]:
+                    # Эта пачка зафиксирована прошлой попыткой
+                    continue
+                await load_batch(db, number, tracks, errors, payload["dedupe"], insert_batch, checkpoint)
+        finished = True
+    except ValueError as e:
+        finished = True
+        raise PermanentJobError(str(e))
+    except asyncio.CancelledError:
+        # При остановке процесса задача вернётся в очередь — файл ещё понадобится
+        finished = not job_runner.stopping
+        raise
+    except Exception:
+        finished = ctx.last_attempt
+        raise
+    finally:
+        if finished:
+            os.remove(path)
+    logger.info("Фоновая загрузка %s завершена: добавлено=%s, пропущено=%s, ошибок=%s",
+                path, summary["inserted"], summary["skipped"], summary["failed"])
+    return summary
+
+
+@job_handler("tag_graph_rebuild")
+async def rebuild_tag_graph(ctx: JobContext) -> dict:
+    """Пересборка снимка графа тегов (TAG_GRAPH_PATH).
+
+    Процесс, выполнивший задачу, сразу переходит на новый снимок, остальные — при перезапуске.
+    """
+    path = get_settings().tag_graph_path
+    graph = TagGraph()
+    await graph.build(counted(stream_tracks(TracksOrm.tags, sessionmaker=ctx.sessionmaker), ctx,
+                              await count_tracks(ctx)))
+    await asyncio.to_thread(graph.save, path)
+    await init_tag_graph()
+    return {"path": path, "tracks": graph.total_tracks, "tags": len(graph.tags), "edges": len(graph.indices)}
+
+
+@job_handler("similarity_rebuild")
+async def rebuild_similarity_index(ctx: JobContext) -> dict:
+    """Пересборка снимка LSH-индекса (SIMILARITY_INDEX_PATH); применяется так же, как снимок графа тегов"""
+    path = get_settings().similarity_index_path
+    ids, vectors = [], []
+    async for track_id, tags, artists in counted(stream_tracks(TracksOrm.tags, TracksOrm.artists,
+                                                               sessionmaker=ctx.sessionmaker),
+                                                 ctx, await count_tracks(ctx)):
+        ids.append(track_id)
+        vectors.append(encode(tags, artists))
+    index = SimilarityIndex()
+    index.build(np.array(ids, dtype=np.int64), np.array(vectors, dtype=np.float32).reshape(-1, DIM))
+    await asyncio.to_thread(index.save, path)
+    await init_similarity_index()
+    return {"path": path, "tracks": len(index)}
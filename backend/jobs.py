@@ -0,0 +1,288 @@
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from backend.settings import Settings, get_settings
+from backend.database import JobsOrm, create_engine_from_url
+from backend.metrics import jobs_finished
+from backend.logger_config import logger
+
+
+settings = get_settings()
+JOB_POLL_INTERVAL = settings.job_poll_interval
+# Аренда задачи воркером: если он не продлил её за это время (процесс упал), задачу заберёт другой
+JOB_LEASE_SECONDS = settings.job_lease_seconds
+JOB_HEARTBEAT_INTERVAL = settings.job_heartbeat_interval
+JOB_MAX_ATTEMPTS = settings.job_max_attempts
+JOB_RETRY_BASE_DELAY = settings.job_retry_base_delay
+JOB_RETRY_MAX_DELAY = settings.job_retry_max_delay
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+HANDLERS = {}
+
+
+def job_handler(kind: str):
+    """Регистрирует async-функцию handler(ctx: JobContext) -> dict как исполнителя задач вида kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class PermanentJobError(Exception):
+    """Ошибка, после которой повтор не поможет (неверные параметры, пропавший файл): задача сразу failed"""
+
+
+class LeaseLost(Exception):
+    """Аренда задачи истекла и её забрал другой воркер — результаты этой попытки не записываются"""
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempt: int) -> float:
+    # Экспоненциальная отсрочка с разбросом, чтобы упавшие вместе задачи не повторялись вместе
+    return min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+async def enqueue(db: AsyncSession, kind: str, payload: dict, user_id: int | None = None,
+                  max_attempts: int = JOB_MAX_ATTEMPTS) -> JobsOrm:
+    """Добавляет задачу в сессию вызывающего; видна воркерам после его commit, затем — job_runner.notify()"""
+    if kind not in HANDLERS:
+        raise ValueError(f"Неизвестный вид задачи: {kind}")
+    now = utcnow()
+    return await db.scalar(insert(JobsOrm).values(kind=kind, status="queued", payload=payload, progress=0.0,
+                                                  attempts=0, max_attempts=max_attempts, available_at=now,
+                                                  cancel_requested=False, user_id=user_id, created_at=now,
+                                                  updated_at=now)
+                           .returning(JobsOrm))
+
+
+async def request_cancel(db: AsyncSession, job_id: int) -> JobsOrm | None:
+    """Отменяет задачу в очереди сразу, у выполняемой — ставит флаг, который воркер увидит при продлении аренды"""
+    now = utcnow()
+    job = await db.scalar(update(JobsOrm)
+                          .where(JobsOrm.id == job_id, JobsOrm.status == "queued")
+                          .values(status="cancelled", finished_at=now, updated_at=now)
+                          .returning(JobsOrm))
+    if job is None:
+        job = await db.scalar(update(JobsOrm)
+                              .where(JobsOrm.id == job_id, JobsOrm.status == "running")
+                              .values(cancel_requested=True, updated_at=now)
+                              .returning(JobsOrm))
+    if job is None:
+        job = await db.get(JobsOrm, job_id)
+    return job
+
+
+class JobContext:
+    """То, что видит обработчик: параметры, сохранённое состояние прошлой попытки, прогресс и сессии пула задач"""
+
+    def __init__(self, job: JobsOrm, sessionmaker: async_sessionmaker):
+        self.id = job.id
+        self.payload = job.payload
+        self.attempt = job.attempts
+        self.last_attempt = job.attempts >= job.max_attempts
+        # Состояние, сохранённое checkpoint() прошлой попытки; None — задача начинается с начала
+        self.state = job.result
+        self.sessionmaker = sessionmaker
+        self.progress = job.progress
+
+    def report(self, done: float, total: float):
+        # В базу прогресс попадает при следующем продлении аренды, а не на каждый вызов
+        self.progress = min(1.0, done / total) if total else 0.0
+
+    async def checkpoint(self, db: AsyncSession, state: dict):
+        """Сохраняет состояние в транзакции db: оно фиксируется вместе с работой, которую описывает"""
+        updated = await db.scalar(update(JobsOrm)
+                                  .where(JobsOrm.id == self.id, JobsOrm.status == "running",
+                                         JobsOrm.attempts == self.attempt)
+                                  .values(result=state, progress=self.progress, updated_at=utcnow())
+                                  .returning(JobsOrm.id))
+        if updated is None:
+            raise LeaseLost()
+        self.state = state
+
+
+class JobRunner:
+    """Пул воркеров asyncio поверх таблицы jobs.
+
+    Задачу забирает один UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP LOCKED): несколько процессов uvicorn
+    делят очередь, не выполняя одну задачу дважды и не дожидаясь блокировок друг друга. Взятая задача
+    арендуется на JOB_LEASE_SECONDS и продлевается, пока работает; упавший воркер аренду не продлит, и задачу
+    заберёт другой. Номер попытки служит маркером владения во всех последующих записях.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.sessionmaker = None
+        self.tasks: list[asyncio.Task] = []
+        # id задачи → задача asyncio обработчика, для отмены без ожидания продления аренды
+        self.running: dict[int, asyncio.Task] = {}
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+
+    async def start(self, settings: Settings):
+        """settings.job_workers воркеров; 0 — процесс задачи только ставит в очередь.
+        У воркеров отдельный пул (job_db_pool_size), чтобы тяжёлые задачи не занимали соединения запросов"""
+        if settings.job_workers <= 0:
+            return
+        self.engine = create_engine_from_url(settings.database_url, "jobs", settings,
+                                             pool_size=settings.job_db_pool_size, max_overflow=0)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.stopping = False
+        self.tasks = [asyncio.create_task(self.worker(i)) for i in range(settings.job_workers)]
+        logger.info("Воркеры задач запущены: %s, соединений %s", settings.job_workers, settings.job_db_pool_size)
+
+    async def stop(self):
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    def notify(self):
+        """Будит воркеры этого процесса сразу после постановки задачи; остальные заметят её при опросе"""
+        self.wakeup.set()
+
+    def cancel_local(self, job_id: int):
+        task = self.running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def claim(self) -> JobsOrm | None:
+        now = utcnow()
+        candidate = (select(JobsOrm.id)
+                     .where(JobsOrm.status.in_(ACTIVE), JobsOrm.available_at <= now)
+                     .order_by(JobsOrm.available_at)
+                     .limit(1)
+                     .with_for_update(skip_locked=True)
+                     .scalar_subquery())
+        async with self.sessionmaker() as db:
+            job = await db.scalar(update(JobsOrm)
+                                  .where(JobsOrm.id == candidate)
+                                  .values(status="running", attempts=JobsOrm.attempts + 1,
+                                          available_at=now + timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now)
+                                  .returning(JobsOrm))
+            await db.commit()
+        return job
+
+    async def worker(self, number: int):
+        while True:
+            self.wakeup.clear()
+            try:
+                job = await self.claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Воркер задач %s не смог получить задачу: %s", number, e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Итог не записан (обычно база недоступна): аренда истечёт, и задачу повторит следующая попытка.
+                # Воркер продолжает работу, иначе пул задач молча сокращался бы до перезапуска
+                logger.error("Воркер задач %s не смог завершить задачу %s (%s): %s", number, job.id, job.kind, e)
+
+    async def finish(self, job: JobsOrm, **values) -> bool:
+        now = utcnow()
+        async with self.sessionmaker() as db:
+            updated = await db.scalar(update(JobsOrm)
+                                      .where(JobsOrm.id == job.id, JobsOrm.status == "running",
+                                             JobsOrm.attempts == job.attempts)
+                                      .values(updated_at=now, **values)
+                                      .returning(JobsOrm.id))
+            await db.commit()
+        if updated is None:
+            logger.warning("Задача %s (%s): аренда попытки %s потеряна, результат не записан",
+                           job.id, job.kind, job.attempts)
+            return False
+        if values.get("status") in FINISHED:
+            jobs_finished.inc(job.kind, values["status"])
+        return True
+
+    async def execute(self, job: JobsOrm):
+        handler = HANDLERS.get(job.kind)
+        if handler is None or job.attempts > job.max_attempts or job.cancel_requested:
+            # Неизвестный вид, исчерпанные попытки (воркеры падали, не закончив) или отмена до взятия
+            status, error = (("cancelled", None) if job.cancel_requested else
+                             ("failed", f"Неизвестный вид задачи: {job.kind}" if handler is None else
+                              "Превышено число попыток"))
+            await self.finish(job, status=status, error=error, finished_at=utcnow())
+            return
+        ctx = JobContext(job, self.sessionmaker)
+        logger.info("Задача %s (%s) начата, попытка %s из %s", job.id, job.kind, job.attempts, job.max_attempts)
+        task = asyncio.create_task(handler(ctx))
+        self.running[job.id] = task
+        heartbeat = asyncio.create_task(self.heartbeat(job, ctx, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self.stopping:
+                # Остановка процесса: задача возвращается в очередь, попытка не засчитывается
+                await self.finish(job, status="queued", attempts=job.attempts - 1, available_at=utcnow())
+                logger.info("Задача %s (%s) возвращена в очередь при остановке", job.id, job.kind)
+                raise
+            await self.finish(job, status="cancelled", finished_at=utcnow())
+            logger.info("Задача %s (%s) отменена", job.id, job.kind)
+        except LeaseLost:
+            logger.warning("Задача %s (%s): аренда потеряна во время выполнения", job.id, job.kind)
+        except Exception as e:
+            if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+                await self.finish(job, status="failed", error=str(e), finished_at=utcnow())
+                logger.error("Задача %s (%s) завершилась ошибкой: %s", job.id, job.kind, e)
+            else:
+                delay = retry_delay(job.attempts)
+                await self.finish(job, status="queued", error=str(e), progress=ctx.progress,
+                                  available_at=utcnow() + timedelta(seconds=delay))
+                logger.warning("Задача %s (%s), попытка %s: %s; повтор через %.1f с",
+                               job.id, job.kind, job.attempts, e, delay)
+        else:
+            if await self.finish(job, status="succeeded", result=result, progress=1.0, error=None,
+                                 finished_at=utcnow()):
+                logger.info("Задача %s (%s) выполнена", job.id, job.kind)
+        finally:
+            heartbeat.cancel()
+            self.running.pop(job.id, None)
+
+    async def heartbeat(self, job: JobsOrm, ctx: JobContext, task: asyncio.Task):
+        """Продлевает аренду, записывает прогресс и проверяет, не запрошена ли отмена"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            now = utcnow()
+            try:
+                async with self.sessionmaker() as db:
+                    cancel_requested = await db.scalar(
+                        update(JobsOrm)
+                        .where(JobsOrm.id == job.id, JobsOrm.status == "running", JobsOrm.attempts == job.attempts)
+                        .values(available_at=now + timedelta(seconds=JOB_LEASE_SECONDS), progress=ctx.progress,
+                                updated_at=now)
+                        .returning(JobsOrm.cancel_requested))
+                    await db.commit()
+            except Exception as e:
+                # Аренда длиннее нескольких продлений: один сбой базы задачу не прерывает
+                logger.warning("Задача %s: не удалось продлить аренду: %s", job.id, e)
+                continue
+            if cancel_requested is None or cancel_requested:
+                task.cancel()
+                return
+
+
+job_runner = JobRunner()
+
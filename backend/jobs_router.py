@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models import Job, JobCreate
+from backend.database import get_db, JobsOrm
+from backend.router import get_current_user
+from backend.user_cache import CurrentUser
+from backend.jobs import enqueue, request_cancel, job_runner
+from backend.admission import admission_control
+from backend.logger_config import logger
+
+
+router = APIRouter(prefix="/jobs", tags=["Фоновые задачи"], dependencies=[Depends(admission_control)])
+
+
+async def visible_job(job_id: int, user: CurrentUser, db: AsyncSession) -> JobsOrm:
+    job = await db.get(JobsOrm, job_id)
+    if job is None or not (user.is_admin or job.user_id == user.id):
+        # Чужие задачи неотличимы от несуществующих
+        logger.warning("Задача id=%s не найдена для пользователя %s", job_id, user.email)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    return job
+
+
+@router.post("", response_model=Job, status_code=status.HTTP_202_ACCEPTED, summary="Запустить задачу (админ-функция)",
+             description="Ставит в очередь пересборку графа тегов или индекса похожих треков. Ход выполнения — "
+                         "GET /jobs/{id}")
+async def create_job(params: JobCreate,
+                     db: AsyncSession = Depends(get_db),
+                     user: CurrentUser = Depends(get_current_user)):
+    if not user.is_admin:
+        logger.warning("Пользователь %s не является администратором и попытался запустить задачу", user.email)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Только администратор может запускать задачи")
+    job = await enqueue(db, params.kind, {}, user.id)
+    await db.commit()
+    job_runner.notify()
+    logger.info("Пользователь %s поставил задачу %s в очередь: id=%s", user.email, params.kind, job.id)
+    return job
+
+
+@router.get("/{job_id}", response_model=Job, summary="Состояние задачи",
+            description="Статус, прогресс (0..1), число попыток, результат или последняя ошибка. Задачу видит "
+                        "поставивший её пользователь и администраторы")
+async def get_job(job_id: int,
+                  db: AsyncSession = Depends(get_db),
+                  user: CurrentUser = Depends(get_current_user)):
+    return await visible_job(job_id, user, db)
+
+
+@router.post("/{job_id}/cancel", response_model=Job, summary="Отменить задачу",
+             description="Задача в очереди отменяется сразу. Выполняемая — как только воркер это заметит: сразу, "
+                         "если она идёт в этом процессе, иначе при следующем продлении аренды. Уже зафиксированные "
+                         "ею изменения (например, загруженные пачки треков) остаются")
+async def cancel_job(job_id: int,
+                     db: AsyncSession = Depends(get_db),
+                     user: CurrentUser = Depends(get_current_user)):
+    await visible_job(job_id, user, db)
+    job = await request_cancel(db, job_id)
+    await db.commit()
+    if job.status == "running":
+        job_runner.cancel_local(job_id)
+    logger.info("Пользователь %s отменяет задачу id=%s (%s): статус %s", user.email, job_id, job.kind, job.status)
+    return job
@@ -1,24 +1,142 @@
 import os
 import sys
+import json
+import uuid
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-logger = logging.getLogger("logs/app_logger")
-logger.setLevel(logging.DEBUG)
+from backend.settings import Settings, get_settings
+
+
+SAMPLED = {"sample": True}
+
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+class RequestContextFilter(logging.Filter):
+    """Подставляет request_id и прореживает сообщения горячего пути; работает в потоке, который пишет лог"""
+
+    def __init__(self, sample_every: int):
+        super().__init__()
+        self.sample_every = sample_every
+        self._seen: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        if getattr(record, "sample", False) and self.sample_every > 1:
+            # Шаблон %-сообщения и есть тип сообщения: значения аргументов на выборку не влияют
+            seen = self._seen.get(record.msg, 0)
+            self._seen[record.msg] = seen + 1
+            if seen % self.sample_every:
+                return False
+            record.sampled = self.sample_every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if getattr(record, "sampled", None):
+            entry["sampled"] = record.sampled
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RequestIdMiddleware:
+    """Берёт X-Request-ID из запроса или создаёт новый, кладёт его в контекст логов и в ответ"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        token = request_id.set(incoming or uuid.uuid4().hex)
 
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-request-id", request_id.get().encode("latin-1"))]}
+            await send(message)
 
-#Консольные логи
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+
+def make_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s")
+
+
+logger = logging.getLogger("logs/app_logger")
+logger.propagate = False
 
 log_dir = "logs"
 log_file = "app.log"
-os.makedirs(log_dir, exist_ok=True)
+# Цикл событий только кладёт запись в очередь; запись в stdout и на диск идёт в потоке QueueListener
+log_queue = queue.SimpleQueue()
+listener: QueueListener | None = None
+
+
+def configure_logging(settings: Settings | None = None):
+    """Подключает вывод логов (LOG_SINKS, LOG_FORMAT) и запускает поток записи; повторный вызов ничего не делает.
+
+    Вызывается из create_app() и из CLI модулей, а не при импорте: импорт не создаёт каталогов и потоков.
+    """
+    global listener
+    if listener is not None:
+        return
+    settings = settings or get_settings()
+    logger.setLevel(settings.log_level)
+
+    formatter = make_formatter(settings.log_format)
+    handlers = []
+    #Консольные логи
+    if "console" in settings.log_sinks:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    #Файловые логи
+    if "file" in settings.log_sinks:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = RotatingFileHandler(os.path.join(log_dir, log_file), maxBytes=10*1024*1024, backupCount=5)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(settings.log_sample_every))
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener)
+    # Поток записи не переживает fork: перед ним очередь дописывается, после — поток запускается заново
+    # в обоих процессах (воркеры backend.serve)
+    os.register_at_fork(before=stop_listener, after_in_parent=start_listener, after_in_child=start_listener)
+
+
+def start_listener():
+    if listener is not None and listener._thread is None:
+        listener.start()
+
 
-#Файловые логи
-file_handler = RotatingFileHandler(os.path.join(log_dir, log_file), maxBytes=10*1024*1024, backupCount=5)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+def stop_listener():
+    if listener is not None and listener._thread is not None:
+        listener.stop()
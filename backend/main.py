@@ -1,22 +1,109 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
-from backend.router import router as tracks_router
-from backend.auth_router import router as auth_router
-
-
-app = FastAPI(title="Associative Playlist API",
-              description="API для управления плейлистами и треками",
-              contact={
-        "name": "Kirill Sviridov",
-        "email": "svrdlrk@gmail.com",},
-              )
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"]
-)
-app.include_router(auth_router)
-app.include_router(tracks_router)
+from backend.settings import Settings, get_settings, use_settings
+from backend.logger_config import RequestIdMiddleware, configure_logging
+from backend.metrics import MetricsMiddleware, monitor_loop_lag
+
+
+async def load_shared_state(settings: Settings):
+    """Структуры в памяти, которые воркеры почти только читают: граф тегов, индекс похожих треков,
+    автодополнение и реплика каталога. backend.serve загружает их в родительском процессе до fork —
+    воркеры получают их готовыми и делят страницы памяти, пока не изменят их (copy-on-write)"""
+    from backend.tag_graph import init_tag_graph
+    from backend.similarity import init_similarity_index
+    from backend.autocomplete import init_autocomplete
+    from backend.catalog import init_catalog
+    from backend.track_index import track_indexes_loaded
+    await init_tag_graph()
+    await init_similarity_index()
+    await init_autocomplete()
+    if settings.catalog_replica:
+        await init_catalog()
+    track_indexes_loaded()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from backend.database import init_engines, warm_up_pool, dispose_engines
+    from backend.track_index import poll_track_indexes
+    from backend.jobs import job_runner
+    from backend.etag import require_shared_version_store
+    settings = app.state.settings
+    require_shared_version_store(settings.workers)
+    engine, _ = init_engines(settings)
+    # Соединения открываются до первого запроса, а не в нём
+    await warm_up_pool(engine, settings.db_pool_warmup)
+    if not app.state.shared_state_loaded:
+        await load_shared_state(settings)
+        app.state.shared_state_loaded = True
+    # Записи других воркеров попадают в граф тегов, индексы и реплику каталога этого воркера только опросом
+    tasks = [asyncio.create_task(monitor_loop_lag()), asyncio.create_task(poll_track_indexes())]
+    await job_runner.start(settings)
+    yield
+    await job_runner.stop()
+    for task in tasks:
+        task.cancel()
+    await dispose_engines()
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """Собирает приложение; без settings — настройки из окружения.
+
+    Модули читают настройки в константы при импорте, поэтому роутеры импортируются здесь, после
+    use_settings(): настройки действуют на процесс, а не на отдельный экземпляр приложения.
+    Движки базы создаются в lifespan, не при импорте.
+    """
+    if settings is not None:
+        use_settings(settings)
+    settings = get_settings()
+    configure_logging(settings)
+
+    from backend.router import router as tracks_router
+    from backend.auth_router import router as auth_router
+    from backend.tags_router import router as tags_router
+    from backend.metrics_router import router as metrics_router
+    from backend.jobs_router import router as jobs_router
+    from backend.query_stats import QueryStatsMiddleware
+    import backend.job_handlers  # обработчики задач регистрируются при импорте
+
+    app = FastAPI(title="Associative Playlist API",
+                  description="API для управления плейлистами и треками",
+                  contact={
+            "name": "Kirill Sviridov",
+            "email": "svrdlrk@gmail.com",},
+                  lifespan=lifespan,
+                  default_response_class=ORJSONResponse,
+                  )
+    app.state.settings = settings
+    app.state.shared_state_loaded = False
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"]
+    )
+    if settings.debug:
+        app.add_middleware(QueryStatsMiddleware)
+    app.add_middleware(RequestIdMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(auth_router)
+    app.include_router(tracks_router)
+    app.include_router(tags_router)
+    app.include_router(jobs_router)
+    app.include_router(metrics_router)
+    return app
+
+
+def __getattr__(name: str):
+    # uvicorn backend.main:app и from backend.main import app: приложение создаётся при первом обращении
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,156 @@
+import time
+import asyncio
+from bisect import bisect_left
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    """Гистограмма без блокировок: пишется только из потока цикла событий, читается при выгрузке"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.children: dict[tuple, Histogram] = {}
+
+    def labels(self, *values) -> Histogram:
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(self.buckets)
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, child in self.children.items():
+            labels = format_labels(self.label_names, values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {child.sum}")
+            lines.append(f"{self.name}_count{suffix} {child.count}")
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *values, amount: float = 1):
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in self.values.items():
+            labels = format_labels(self.label_names, values)
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def samples(name: str, documentation: str, metric_type: str, values: list[tuple[dict, float]]) -> list[str]:
+    """Значения, которые считаются в других модулях (пул, кеш пользователей), в текстовом формате Prometheus"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in values:
+        rendered = format_labels(tuple(labels), tuple(labels.values()))
+        lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+    return lines
+
+
+http_requests = CounterFamily("http_requests_total", "Запросы по маршруту, методу и статусу",
+                              ("route", "method", "status"))
+http_latency = HistogramFamily("http_request_duration_seconds", "Время обработки запроса",
+                               ("route", "method"), LATENCY_BUCKETS)
+db_statements = HistogramFamily("db_statement_duration_seconds", "Время выполнения SQL-выражений",
+                                ("engine",), DB_BUCKETS)
+db_pool_wait = HistogramFamily("db_pool_wait_seconds", "Ожидание соединения из пула", ("engine",), DB_BUCKETS)
+loop_lag = HistogramFamily("event_loop_lag_seconds", "Задержка пробуждения цикла событий", (), DB_BUCKETS)
+bcrypt_duration = HistogramFamily("bcrypt_duration_seconds", "Время bcrypt в пуле потоков", ("operation",),
+                                  LATENCY_BUCKETS)
+bcrypt_queue_wait = HistogramFamily("bcrypt_queue_wait_seconds", "Ожидание свободного потока bcrypt", (),
+                                    LATENCY_BUCKETS)
+admission_rejected = CounterFamily("admission_rejected_total", "Запросы, отклонённые лимитами или из-за перегрузки",
+                                   ("reason",))
+admission_queue_wait = HistogramFamily("admission_queue_wait_seconds", "Ожидание места в очереди к пулу соединений",
+                                       (), LATENCY_BUCKETS)
+jobs_finished = CounterFamily("jobs_finished_total", "Завершённые фоновые задачи по виду и итогу", ("kind", "status"))
+FAMILIES = [http_requests, http_latency, db_statements, db_pool_wait, loop_lag, bcrypt_duration, bcrypt_queue_wait,
+            admission_rejected, admission_queue_wait, jobs_finished]
+
+
+class MetricsMiddleware:
+    """Считает запросы и время ответа по шаблону маршрута, а не по фактическому пути: число рядов ограничено"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_latency.labels(path, method).observe(time.perf_counter() - start)
+            http_requests.inc(path, method, status_code)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Фоновая задача: насколько позже заказанного просыпается sleep — столько цикл был занят"""
+    lag = loop_lag.labels()
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, loop.time() - expected))
+
+
+def render(extra: list[str] = ()) -> str:
+    lines = [line for family in FAMILIES for line in family.render()]
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
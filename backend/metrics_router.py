@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from backend import auth, metrics
+from backend.database import pool_metrics
+from backend.user_cache import user_cache
+
+
+router = APIRouter(tags=["Служебное"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Метрики в формате Prometheus",
+            description="Счётчики и гистограммы запросов по маршрутам, SQL-выражений, ожидания пула соединений, "
+                        "задержки цикла событий и bcrypt")
+async def get_metrics():
+    pools = pool_metrics()
+    cache = user_cache.stats()
+    extra = [
+        *metrics.samples("db_pool_checked_out", "Выданные из пула соединения", "gauge",
+                         [({"engine": name}, pool["checked_out"]) for name, pool in pools.items()]),
+        *metrics.samples("db_pool_size", "Размер пула соединений", "gauge",
+                         [({"engine": name}, pool["size"]) for name, pool in pools.items()]),
+        *metrics.samples("db_pool_timeouts_total", "Таймауты ожидания соединения", "counter",
+                         [({"engine": name}, pool["timeouts"]) for name, pool in pools.items()]),
+        *metrics.samples("bcrypt_in_flight", "Хеширования паролей в работе и в очереди", "gauge",
+                         [({}, auth.hashing_in_flight)]),
+        *metrics.samples("user_cache_entries", "Записей в кеше пользователей", "gauge", [({}, cache["size"])]),
+        *metrics.samples("user_cache_hits_total", "Попадания в кеш пользователей", "counter", [({}, cache["hits"])]),
+        *metrics.samples("user_cache_misses_total", "Промахи кеша пользователей", "counter",
+                         [({}, cache["misses"])]),
+    ]
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
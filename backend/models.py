@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Annotated, List, Literal, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
@@ -21,11 +22,15 @@ class UserLogin(BaseModel):
             raise ValueError("Необходимо указать либо username, либо email")
         return values
 
+# Колонки tracks — varchar(255) и varchar(255)[]: длинное значение отклоняется здесь, построчно, а не базой
+TrackText = Annotated[str, Field(max_length=255)]
+
+
 class TrackAdd(BaseModel):
-    title: str = Field(..., examples=["Song Title"])
-    artists: List[str] = Field(..., examples=[["Song Artist"]])
-    tags: List[str] = Field(..., examples=[["rock", "pop", "hip-hop"]])
-    url: str = Field(..., examples=["Song Url"])
+    title: TrackText = Field(..., examples=["Song Title"])
+    artists: List[TrackText] = Field(..., examples=[["Song Artist"]])
+    tags: List[TrackText] = Field(..., examples=[["rock", "pop", "hip-hop"]])
+    url: TrackText = Field(..., examples=["Song Url"])
 
 
 class Track(TrackAdd):
@@ -36,10 +41,64 @@ class Track(TrackAdd):
     }
 
 
+class TrackSearchResult(Track):
+    score: float = Field(..., examples=[2], description="Количество совпавших тегов; при поиске по q — "
+                                                        "триграммное сходство с названием или исполнителем (0..1)")
+
+
+class BulkRowError(BaseModel):
+    line: Optional[int] = Field(..., examples=[42], description="Номер строки файла; null — ошибка всей пачки")
+    error: str = Field(..., examples=["title: Field required"])
+
+
+class BulkBatchReport(BaseModel):
+    batch: int = Field(..., examples=[1])
+    received: int = Field(..., examples=[1000])
+    inserted: int = Field(..., examples=[990])
+    skipped: int = Field(..., examples=[8], description="Дубликаты по (title, artists) при dedupe=true")
+    failed: int = Field(..., examples=[2])
+    errors: List[BulkRowError] = Field(..., examples=[[{"line": 42, "error": "title: Field required"}]])
+
+
+class BulkReport(BaseModel):
+    inserted: int = Field(..., examples=[990])
+    skipped: int = Field(..., examples=[8])
+    failed: int = Field(..., examples=[2])
+    batches: List[BulkBatchReport]
+
+
+class SimilarTrack(Track):
+    score: float = Field(..., examples=[0.87], description="Косинусная близость профилей тегов и исполнителей")
+
+
+class Suggestion(BaseModel):
+    kind: Literal["title", "artist", "tag"] = Field(..., examples=["artist"])
+    value: str = Field(..., examples=["Radiohead"])
+    count: int = Field(..., examples=[12], description="Количество треков с этим значением")
+
+
+class RelatedTag(BaseModel):
+    tag: str = Field(..., examples=["indie"])
+    score: float = Field(..., examples=[0.42], description="Jaccard или PMI в зависимости от metric")
+    count: int = Field(..., examples=[128], description="Количество треков, где теги встречаются вместе")
+
+
 class PlaylistCreate(BaseModel):
     name: str = Field(..., max_length=100, examples=["Playlist Name"])
 
 
+class PlaylistGenerate(PlaylistCreate):
+    seed_tags: List[str] = Field([], max_length=20, examples=[["rock", "night"]])
+    seed_track_ids: List[int] = Field([], max_length=50, examples=[[1, 2]])
+    length: int = Field(50, ge=1, le=500, examples=[200])
+
+    @model_validator(mode='after')
+    def validate_seeds(cls, values):
+        if not values.seed_tags and not values.seed_track_ids:
+            raise ValueError("Необходимо указать seed_tags или seed_track_ids")
+        return values
+
+
 class Playlist(PlaylistCreate):
     id: int = Field(..., examples=[0])
     user_id: int = Field(..., examples=[1])
@@ -49,6 +108,30 @@ class Playlist(PlaylistCreate):
     }
 
 
+class PlaylistSummary(Playlist):
+    track_count: Optional[int] = Field(None, examples=[42], description="Только при include=counts")
+    tracks: Optional[List[Track]] = Field(None, description="Первые tracks_limit треков, только при include=tracks")
+
+
+class PlaylistTracksPatch(BaseModel):
+    add: List[int] = Field([], max_length=1000, examples=[[1, 2, 3]])
+    remove: List[int] = Field([], max_length=1000, examples=[[4]])
+
+    @model_validator(mode='after')
+    def validate_patch(cls, values):
+        if set(values.add) & set(values.remove):
+            raise ValueError("Один и тот же трек не может одновременно добавляться и удаляться")
+        return values
+
+
+class PlaylistTracksPatchResult(BaseModel):
+    added: List[int] = Field(..., examples=[[1, 2]])
+    skipped: List[int] = Field(..., examples=[[3]], description="Уже были в плейлисте")
+    missing: List[int] = Field(..., examples=[[]], description="Таких треков не существует")
+    removed: List[int] = Field(..., examples=[[4]])
+    not_in_playlist: List[int] = Field(..., examples=[[]])
+
+
 class PlaylistWithTracks(Playlist):
     tracks: List[Track] = Field(..., examples=[[{
         "id": 0,
@@ -58,3 +141,27 @@ class PlaylistWithTracks(Playlist):
         "url": "Song Url"
     }]])
 
+
+
+class JobCreate(BaseModel):
+    kind: Literal["tag_graph_rebuild", "similarity_rebuild"] = Field(..., examples=["tag_graph_rebuild"])
+
+
+class Job(BaseModel):
+    id: int = Field(..., examples=[1])
+    kind: str = Field(..., examples=["tracks_import"])
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"] = Field(..., examples=["running"])
+    progress: float = Field(..., examples=[0.42], description="Доля выполненной работы, 0..1")
+    attempts: int = Field(..., examples=[1])
+    max_attempts: int = Field(..., examples=[3])
+    cancel_requested: bool = Field(..., examples=[False])
+    result: Optional[dict] = Field(None, description="Итог задачи; пока выполняется — сохранённое промежуточное "
+                                                     "состояние")
+    error: Optional[str] = Field(None, description="Ошибка последней неудачной попытки")
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    model_config = {
+        "from_attributes": True
+    }
@@ -0,0 +1,98 @@
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import PlaylistsOrm, PlaylistTracksOrm, async_session
+from backend.logger_config import logger
+
+
+# Шаг между соседними треками: 2^20 позволяет ~20 раз вставить трек в одно и то же место без перенумерации
+POSITION_GAP = 1 << 20
+# Если после перемещения соседи ближе этого, плейлист перенумеровывается в фоне, пока место ещё есть
+REBALANCE_GAP = 1 << 6
+
+
+def tail_position(playlist_id):
+    """Позиция после последнего трека плейлиста — скалярный подзапрос для INSERT ... SELECT"""
+    return (select(func.coalesce(func.max(PlaylistTracksOrm.position), 0) + POSITION_GAP)
+            .where(PlaylistTracksOrm.playlist_id == playlist_id)
+            .scalar_subquery())
+
+
+def between(prev: int | None, following: int | None) -> int | None:
+    """Позиция строго между соседями; None — промежуток исчерпан"""
+    if prev is None:
+        return POSITION_GAP if following is None else following - POSITION_GAP
+    if following is None:
+        return prev + POSITION_GAP
+    if following - prev < 2:
+        return None
+    return (prev + following) // 2
+
+
+async def neighbours(db: AsyncSession, playlist_id: int, track_id: int,
+                     after: int | None) -> tuple[int | None, int | None]:
+    """Позиции соседей, между которыми встанет track_id: трек after и следующий за ним (без after — начало)"""
+    others = (PlaylistTracksOrm.playlist_id == playlist_id, PlaylistTracksOrm.track_id != track_id)
+    if after is None:
+        return None, await db.scalar(select(func.min(PlaylistTracksOrm.position)).where(*others))
+    prev = await db.scalar(select(PlaylistTracksOrm.position)
+                           .where(PlaylistTracksOrm.playlist_id == playlist_id, PlaylistTracksOrm.track_id == after))
+    following = await db.scalar(select(PlaylistTracksOrm.position)
+                                .where(*others, tuple_(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id)
+                                       > tuple_(prev, after))
+                                .order_by(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id)
+                                .limit(1))
+    return prev, following
+
+
+async def lock_playlist(db: AsyncSession, playlist_id: int):
+    """Блокирует строку плейлиста до конца транзакции: перемещения и перенумерация одного плейлиста идут по очереди.
+
+    Иначе перенумерация, чей подзапрос прочитал позиции до коммита перемещения, записала бы поверх него старый
+    порядок. Блокировка берётся до чтения позиций, так что следующий запрос видит уже закоммиченные.
+    """
+    await db.execute(select(PlaylistsOrm.id).where(PlaylistsOrm.id == playlist_id).with_for_update())
+
+
+async def move_track(db: AsyncSession, playlist_id: int, track_id: int, after: int | None) -> tuple[int, bool]:
+    """Ставит track_id после after одним UPDATE. Возвращает новую позицию и признак, что пора перенумеровать"""
+    await lock_playlist(db, playlist_id)
+    prev, following = await neighbours(db, playlist_id, track_id, after)
+    position = between(prev, following)
+    if position is None:
+        # Место между соседями кончилось раньше фоновой перенумерации: делаем её в этой же транзакции
+        logger.info("Промежуток позиций в плейлисте id=%s исчерпан, перенумерация перед перемещением", playlist_id)
+        await rebalance(db, playlist_id)
+        prev, following = await neighbours(db, playlist_id, track_id, after)
+        position = between(prev, following)
+    await db.execute(update(PlaylistTracksOrm)
+                     .where(PlaylistTracksOrm.playlist_id == playlist_id, PlaylistTracksOrm.track_id == track_id)
+                     .values(position=position))
+    crowded = None not in (prev, following) and following - prev < REBALANCE_GAP
+    return position, crowded
+
+
+async def rebalance(db: AsyncSession, playlist_id: int) -> int:
+    """Перенумеровывает плейлист с шагом POSITION_GAP, сохраняя порядок, одним UPDATE ... FROM"""
+    ranked = (select(PlaylistTracksOrm.track_id,
+                     (func.row_number().over(order_by=(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id))
+                      * POSITION_GAP).label("position"))
+              .where(PlaylistTracksOrm.playlist_id == playlist_id)
+              .subquery("ranked"))
+    result = await db.execute(update(PlaylistTracksOrm)
+                              .where(PlaylistTracksOrm.playlist_id == playlist_id,
+                                     PlaylistTracksOrm.track_id == ranked.c.track_id)
+                              .values(position=ranked.c.position))
+    return result.rowcount
+
+
+async def rebalance_later(playlist_id: int):
+    """Фоновая перенумерация после ответа клиенту: порядок не меняется, поэтому версии ETag не трогаем"""
+    try:
+        async with async_session() as db:
+            await lock_playlist(db, playlist_id)
+            count = await rebalance(db, playlist_id)
+            await db.commit()
+        logger.info("Плейлист id=%s перенумерован в фоне: треков=%s", playlist_id, count)
+    except Exception:
+        logger.exception("Не удалось перенумеровать плейлист id=%s", playlist_id)
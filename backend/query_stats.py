@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.settings import get_settings
+from backend.metrics import db_statements
+
+
+DEBUG = get_settings().debug
+
+
+@dataclass(slots=True)
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Счётчик текущего запроса; SQLAlchemy переносит контекст в свои гринлеты, поэтому хуки видят его
+current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def instrument(engine, name: str = "primary"):
+    """Вешает на движок хуки: счётчик current_stats текущего запроса и гистограмма для /metrics"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    durations = db_statements.labels(name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        durations.observe(elapsed)
+        stats = current_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+@contextmanager
+def collect_queries():
+    stats = QueryStats()
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+class QueryStatsMiddleware:
+    """В режиме отладки добавляет к ответу X-DB-Queries и X-DB-Time (мс)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with collect_queries() as stats:
+            async def send_with_stats(message: Message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", str(stats.count).encode()))
+                    headers.append((b"x-db-time", f"{stats.seconds * 1000:.2f}".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
@@ -1,176 +1,687 @@
-import os
-from typing import List
+import io
+import csv
+import json
+from typing import List, Literal, Optional
 
-from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy import (select, case, insert, delete, literal, bindparam, any_, or_, func, true, Integer, Float,
+                        JSON)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert as pg_insert
 
-from backend.database import async_session, TracksOrm, PlaylistsOrm, PlaylistTracksOrm, UsersOrm
-from backend.models import  Track, TrackAdd, Playlist, PlaylistCreate, PlaylistWithTracks
+from backend.database import (async_session, get_db, get_read_db, stream_tracks, artists_text, DB_REPLICA_MAX_LAG,
+                              TracksOrm, PlaylistsOrm, PlaylistTracksOrm, UsersOrm)
+from backend.models import (Track, TrackAdd, TrackSearchResult, SimilarTrack, BulkReport, BulkBatchReport, BulkRowError,
+                            Suggestion, Playlist, PlaylistSummary, PlaylistCreate, PlaylistGenerate, PlaylistWithTracks,
+                            PlaylistTracksPatch, PlaylistTracksPatchResult, Job)
 from backend.auth import decode_access_token
-from backend.logger_config import logger
+from backend.admission import admission_control
+from backend.user_cache import CurrentUser, user_cache
+from backend.pagination import encode_cursor, decode_cursor
+from backend.positions import POSITION_GAP, tail_position, move_track, rebalance_later
+from backend.etag import version_store, conditional_response, tracks_key, user_playlists_key, playlist_key
+from backend.similarity import similarity_index
+from backend.autocomplete import autocomplete
+from backend.catalog import catalog
+from backend.track_index import index_new_tracks, INDEX_POLL_INTERVAL
+from backend.generator import expand_tags, sample_tracks
+from backend.bulk import (iter_lines, iter_batches, dedupe_batch, insert_batch_copy, insert_batch_values,
+                          spool_upload, MAX_ERRORS_PER_BATCH)
+from backend.jobs import enqueue, job_runner
+from backend.logger_config import logger, SAMPLED
 
-router = APIRouter(tags=["Треки и Плейлисты"])
+router = APIRouter(tags=["Треки и Плейлисты"], dependencies=[Depends(admission_control)])
 bearer_scheme = HTTPBearer()
-load_dotenv()
-ADMIN_LIST = os.getenv("ADMIN_LIST", "")
-admin_list = [email.strip() for email in ADMIN_LIST.split(",") if email.strip()]
+# Во сколько раз кандидатов из GIN-индекса больше, чем треков в генерируемом плейлисте
+GENERATOR_CANDIDATES_FACTOR = 20
+EXPORT_CHUNK_ROWS = 1000
+TRACK_COLUMNS = (TracksOrm.id, TracksOrm.title, TracksOrm.artists, TracksOrm.tags, TracksOrm.url)
 
-async def get_db():
-    async with async_session() as session:
-        yield session
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-                           db: AsyncSession = Depends(get_db)):
-    token = credentials.credentials
+def token_subject(token: str) -> tuple[int, float | None]:
     payload = decode_access_token(token)
     if not payload or "sub" not in payload:
         logger.warning("Недействительный токен при попытке авторизации")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Недействительный токен")
-    user_id = int(payload["sub"])
-    user = await db.get(UsersOrm, user_id)
-    if not user:
-        logger.warning(f"Пользователь с id={user_id} не найден при попытке авторизации")
+    return int(payload["sub"]), payload.get("exp")
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> CurrentUser:
+    token = credentials.credentials
+    user = user_cache.get(token)
+    if user:
+        return user
+    user_id, token_exp = token_subject(token)
+    async with async_session() as db:
+        db_user = await db.get(UsersOrm, user_id)
+    if not db_user:
+        logger.warning("Пользователь с id=%s не найден при попытке авторизации", user_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
-    logger.debug(f"Пользователь {user.username} (id={user.id}) успешно авторизован")
+    user = CurrentUser.from_orm(db_user)
+    user_cache.put(token, user, token_exp)
+    logger.debug("Пользователь %s (id=%s) успешно авторизован", user.username, user.id, extra=SAMPLED)
     return user
 
 
-async def validate_playlist_owner(playlist_id: int, user: UsersOrm, db: AsyncSession) -> PlaylistsOrm:
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> int:
+    # Обработчикам, которым нужен только id, хватает подписи токена: в базу данных не ходим вообще.
+    # Проверенный токен запоминается — по нему же контроль допуска находит пользователя без разбора JWT
+    token = credentials.credentials
+    user_id = user_cache.user_id(token)
+    if user_id is not None:
+        return user_id
+    user_id, token_exp = token_subject(token)
+    user_cache.put_id(token, user_id, token_exp)
+    return user_id
+
+
+def rows_response(content, response: Response) -> ORJSONResponse:
+    # Строки из базы уже соответствуют схеме ответа: отдаём их в orjson без повторной валидации Pydantic.
+    # response_model у маршрута остаётся только для документации
+    return ORJSONResponse(content, headers=dict(response.headers))
+
+
+async def validate_playlist_owner(playlist_id: int, user_id: int, db: AsyncSession) -> PlaylistsOrm:
     playlist = await db.get(PlaylistsOrm, playlist_id)
     if not playlist:
-        logger.warning(f"Плейлист id={playlist_id} не найден при валидации владельца (user_id={user.id})")
+        logger.warning("Плейлист id=%s не найден при валидации владельца (user_id=%s)", playlist_id, user_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такого плейлиста не существует")
-    if playlist.user_id != user.id:
-        logger.warning(f"Пользователь id={user.id} пытался получить доступ к чужому плейлисту id={playlist_id}")
+    if playlist.user_id != user_id:
+        logger.warning("Пользователь id=%s пытался получить доступ к чужому плейлисту id=%s", user_id, playlist_id)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Вы не являетесь создателем этого плейлиста")
-    logger.debug(f"Пользователь id={user.id} успешно прошёл валидацию владельца для плейлиста id={playlist_id}")
+    logger.debug("Пользователь id=%s успешно прошёл валидацию владельца для плейлиста id=%s",
+                 user_id, playlist_id, extra=SAMPLED)
     return playlist
 
 
+def catalog_lag() -> float:
+    return INDEX_POLL_INTERVAL if catalog.ready else 0.0
+
+
+async def catalog_tracks(track_ids: list[int], db: AsyncSession) -> list[dict]:
+    """Треки из реплики каталога; те, что добавлены другим воркером и ещё не догнаны опросом, — из базы"""
+    tracks, missing = catalog.get_many(track_ids)
+    if missing:
+        result = await db.execute(select(*TRACK_COLUMNS).where(TracksOrm.id.in_(missing)))
+        for row in result.all():
+            catalog.add_track(*row)
+        tracks, _ = catalog.get_many(track_ids)
+    return tracks
+
+
+def search_query(tags: List[str], mode: str, q: Optional[str], limit: int, offset: int):
+    """Поиск треков по тегам и/или тексту.
+
+    Теги фильтруются через GIN-индекс ix_tracks_tags, ранжирование — по числу совпавших тегов. Текст q ищется
+    оператором word_similarity (<%) по триграммным индексам ix_tracks_title_trgm и ix_tracks_artists_trgm, поэтому
+    опечатки и часть слова не мешают; тогда ранжирование — по лучшему сходству с названием или исполнителем.
+    """
+    conditions = []
+    if tags:
+        conditions.append(TracksOrm.tags.contains(tags) if mode == "all" else TracksOrm.tags.overlap(tags))
+    if q:
+        artists = artists_text(TracksOrm.artists)
+        conditions.append(or_(literal(q).op("<%")(TracksOrm.title), literal(q).op("<%")(artists)))
+        score = func.greatest(func.word_similarity(q, TracksOrm.title), func.word_similarity(q, artists))
+    else:
+        score = sum(case((TracksOrm.tags.contains([tag]), 1), else_=0) for tag in tags)
+    score = score.label("score")
+    return (select(*TRACK_COLUMNS, score)
+            .where(*conditions)
+            .order_by(score.desc(), TracksOrm.id)
+            .limit(limit)
+            .offset(offset))
+
+
 @router.get("/tracks", response_model=List[Track], summary= "Получить все треки",
-            description="Возвращает список всех треков из базы данных")
-async def get_tracks(limit: int = Query(10, le=100),
+            description="Возвращает список всех треков из базы данных. Для глубокого пролистывания "
+                        "передавайте курсор из заголовка X-Next-Cursor предыдущего ответа вместо offset")
+async def get_tracks(request: Request,
+                     response: Response,
+                     limit: int = Query(10, le=100),
                      offset: int = Query(0),
-                     db: AsyncSession = Depends(get_db)):
-    logger.info(f"Запрос списка треков с лимитом={limit} и смещением={offset}")
-    result = await db.execute(select(TracksOrm).order_by(TracksOrm.id).limit(limit).offset(offset))
-    tracks = result.scalars().all()
-    logger.info(f"Возвращено треков: {len(tracks)}")
-    return [Track.model_validate(t) for t in tracks]
+                     cursor: Optional[str] = Query(None),
+                     db: AsyncSession = Depends(get_read_db)):
+    logger.info("Запрос списка треков с лимитом=%s, смещением=%s, курсором=%s", limit, offset, cursor, extra=SAMPLED)
+    # Реплика каталога в других воркерах догоняет запись не сразу, а за интервал опроса
+    not_modified = await conditional_response(request, response, tracks_key(), False,
+                                              max_lag=max(DB_REPLICA_MAX_LAG, catalog_lag()))
+    if not_modified:
+        logger.info("Список треков не изменился, ответ 304", extra=SAMPLED)
+        return not_modified
+    after_id = decode_cursor(cursor) if cursor else None
+    if catalog.ready:
+        tracks = catalog.page(limit, offset, after_id)
+    else:
+        query = select(*TRACK_COLUMNS).order_by(TracksOrm.id).limit(limit)
+        if after_id is not None:
+            query = query.where(TracksOrm.id > after_id)
+        else:
+            query = query.offset(offset)
+        result = await db.execute(query)
+        tracks = [dict(row) for row in result.mappings()]
+    if len(tracks) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(tracks[-1]["id"])
+    logger.info("Возвращено треков: %s", len(tracks), extra=SAMPLED)
+    return rows_response(tracks, response)
+
+
+async def export_rows(export_format: str):
+    # Отдельная сессия: зависимость get_db закрывается раньше, чем StreamingResponse дочитает поток
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(["id", "title", "artists", "tags", "url"])
+    exported = 0
+    async for track_id, title, artists, tags, url in stream_tracks(TracksOrm.title, TracksOrm.artists,
+                                                                   TracksOrm.tags, TracksOrm.url):
+        if export_format == "csv":
+            writer.writerow([track_id, title, "|".join(artists), "|".join(tags), url])
+        else:
+            buffer.write(json.dumps({"id": track_id, "title": title, "artists": artists, "tags": tags, "url": url},
+                                    ensure_ascii=False))
+            buffer.write("\n")
+        exported += 1
+        if exported % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+    logger.info("Экспорт каталога завершён: формат=%s, треков=%s", export_format, exported)
+
+
+@router.get("/tracks/export", summary="Выгрузить весь каталог",
+            description="Потоково отдаёт все треки в формате NDJSON или CSV (исполнители и теги через |) "
+                        "через серверный курсор, не загружая каталог в память")
+async def export_tracks(format: Literal["ndjson", "csv"] = Query("ndjson")):
+    logger.info("Запрошен экспорт каталога в формате %s", format)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(export_rows(format), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=tracks.{format}"})
+
+
+@router.get("/tracks/search", response_model=List[TrackSearchResult], summary="Поиск треков по тегам и названию",
+            description="Возвращает треки, содержащие любой (mode=any) или все (mode=all) из указанных тегов, "
+                        "отсортированные по количеству совпавших тегов. С параметром q ищет по названию и "
+                        "исполнителям с допуском опечаток и сортирует по сходству; tags тогда работают как фильтр")
+async def search_tracks(tags: List[str] = Query([], max_length=20),
+                        q: Optional[str] = Query(None, min_length=2, max_length=100),
+                        mode: Literal["any", "all"] = Query("any"),
+                        limit: int = Query(10, le=100),
+                        offset: int = Query(0),
+                        db: AsyncSession = Depends(get_read_db)):
+    tags = list(dict.fromkeys(tags))
+    logger.info("Поиск треков: q=%s, теги=%s, режим=%s, лимит=%s, смещение=%s",
+                q, tags, mode, limit, offset, extra=SAMPLED)
+    if not tags and not q:
+        logger.warning("Поиск треков без тегов и без q")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Укажите теги или строку поиска q")
+    result = await db.execute(search_query(tags, mode, q, limit, offset))
+    rows = result.all()
+    logger.info("Найдено треков: %s", len(rows), extra=SAMPLED)
+    return [TrackSearchResult.model_validate(row) for row in rows]
+
+
+@router.get("/autocomplete", response_model=List[Suggestion], summary="Подсказки по префиксу",
+            description="Подсказывает названия, исполнителей и теги по началу любого слова. Отвечает из индекса "
+                        "в памяти, без запросов к базе данных; внутри каждого вида — по убыванию числа треков")
+async def get_autocomplete(prefix: str = Query(..., min_length=1, max_length=100),
+                           kind: List[Literal["title", "artist", "tag"]] = Query(["title", "artist", "tag"]),
+                           limit: int = Query(10, ge=1, le=50)):
+    suggestions = autocomplete.suggest(prefix, list(dict.fromkeys(kind)), limit)
+    logger.debug("Подсказки для %s: %s", prefix, len(suggestions), extra=SAMPLED)
+    return ORJSONResponse([{"kind": kind, "value": value, "count": count} for kind, value, count in suggestions])
+
+
+@router.get("/tracks/{track_id}/similar", response_model=List[SimilarTrack], summary="Похожие треки",
+            description="Возвращает треки с наиболее близким профилем тегов и исполнителей (приближённый поиск по LSH-индексу)")
+async def get_similar_tracks(track_id: int,
+                             k: int = Query(10, ge=1, le=100),
+                             db: AsyncSession = Depends(get_read_db)):
+    logger.info("Запрос похожих треков для трека id=%s, k=%s", track_id, k, extra=SAMPLED)
+    vector = similarity_index.vector(track_id)
+    if vector is None:
+        track = await db.get(TracksOrm, track_id)
+        if not track:
+            logger.warning("Запрошены похожие треки для несуществующего трека id=%s", track_id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такой трек не найден")
+        similarity_index.add_track(track.id, track.tags, track.artists)
+        vector = similarity_index.vector(track_id)
+
+    scores = dict(similarity_index.query(vector, k, exclude=track_id))
+    result = await db.execute(select(*TRACK_COLUMNS).where(TracksOrm.id.in_(scores)))
+    rows = sorted(result.all(), key=lambda row: -scores[row.id])
+    logger.info("Найдено похожих треков: %s для трека id=%s", len(rows), track_id, extra=SAMPLED)
+    return [SimilarTrack(**row._mapping, score=round(scores[row.id], 6)) for row in rows]
 
 
 @router.post("/tracks", response_model=Track, summary="Добавить новый трек в Базу Данных(админ-функция)",
              description="Добавляет трек в базу данных и возвращает его данные")
 async def add_track(track: TrackAdd,
                     db: AsyncSession = Depends(get_db),
-                    user: UsersOrm = Depends(get_current_user)):
-    logger.info(f"Пользователь {user.email} пытается добавить новый трек: {track.title}")
-    if user.email not in admin_list:
-        logger.warning(f"Пользователь {user.email} не является администратором и попытался добавить трек")
+                    user: CurrentUser = Depends(get_current_user)):
+    logger.info("Пользователь %s пытается добавить новый трек: %s", user.email, track.title)
+    if not user.is_admin:
+        logger.warning("Пользователь %s не является администратором и попытался добавить трек", user.email)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Только администратор может добавлять треки")
-    new_track = TracksOrm(**track.model_dump())
-    db.add(new_track)
+    result = await db.execute(insert(TracksOrm)
+                              .values(**track.model_dump())
+                              .returning(*TRACK_COLUMNS))
+    new_track = result.one()
     await db.commit()
-    await db.refresh(new_track)
-    logger.info(f"Новый трек добавлен: id={new_track.id}, title={new_track.title}")
+    await version_store.bump(tracks_key())
+    index_new_tracks([new_track])
+    logger.info("Новый трек добавлен: id=%s, title=%s", new_track.id, new_track.title)
     return Track.model_validate(new_track)
 
 
+async def load_batch(db: AsyncSession, number: int, tracks: list, errors: list, dedupe: bool,
+                     insert_batch, checkpoint=None) -> BulkBatchReport:
+    """Загружает одну пачку массовой загрузки отдельной транзакцией; ошибку базы записывает в отчёт пачки.
+
+    checkpoint(db, report) вызывается в той же транзакции перед commit — так фоновая задача сохраняет,
+    докуда дошла, атомарно с самими треками.
+    """
+    report = BulkBatchReport(batch=number, received=len(tracks) + len(errors),
+                             inserted=0, skipped=0, failed=len(errors), errors=errors[:MAX_ERRORS_PER_BATCH])
+    unique = dedupe_batch(tracks) if dedupe else tracks
+    try:
+        inserted = await insert_batch(db, unique, dedupe) if unique else []
+        report.inserted = len(inserted)
+        report.skipped = len(tracks) - len(inserted)
+        if checkpoint is not None:
+            await checkpoint(db, report)
+        await db.commit()
+    except DBAPIError as e:
+        await db.rollback()
+        logger.error("Пачка %s массовой загрузки отклонена базой данных: %s", report.batch, e.orig)
+        report.inserted = report.skipped = 0
+        report.failed += len(tracks)
+        report.errors.append(BulkRowError(line=None, error=str(e.orig)))
+        if checkpoint is not None:
+            await checkpoint(db, report)
+            await db.commit()
+    else:
+        index_new_tracks(inserted)
+        if inserted:
+            await version_store.bump(tracks_key())
+    logger.info("Пачка %s: получено=%s, добавлено=%s, пропущено=%s, ошибок=%s",
+                report.batch, report.received, report.inserted, report.skipped, report.failed)
+    return report
+
+
+def bulk_report(batches: list[BulkBatchReport]) -> BulkReport:
+    return BulkReport(inserted=sum(batch.inserted for batch in batches),
+                      skipped=sum(batch.skipped for batch in batches),
+                      failed=sum(batch.failed for batch in batches),
+                      batches=batches)
+
+
+@router.post("/tracks/bulk", response_model=BulkReport, summary="Массовая загрузка треков (админ-функция)",
+             description="Принимает потоковую загрузку NDJSON или CSV (title,artists,tags,url; списки через |), "
+                         "валидирует строки пачками и загружает их через COPY (method=copy) или многострочный "
+                         "INSERT ... RETURNING (method=insert). Каждая пачка — отдельная транзакция. "
+                         "С background=true файл сохраняется на диск, а загрузку выполняет фоновая задача: "
+                         "ответ 202 с задачей, отчёт — в её result (GET /jobs/{id})",
+             responses={202: {"model": Job}})
+async def bulk_add_tracks(request: Request,
+                          format: Literal["ndjson", "csv"] = Query("ndjson"),
+                          batch_size: int = Query(1000, ge=1, le=5000),
+                          dedupe: bool = Query(False),
+                          method: Literal["copy", "insert"] = Query("copy"),
+                          background: bool = Query(False),
+                          db: AsyncSession = Depends(get_db),
+                          user: CurrentUser = Depends(get_current_user)):
+    logger.info("Пользователь %s начинает массовую загрузку треков: формат=%s, пачка=%s, dedupe=%s, метод=%s",
+                user.email, format, batch_size, dedupe, method)
+    if not user.is_admin:
+        logger.warning("Пользователь %s не является администратором и попытался загрузить треки", user.email)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Только администратор может добавлять треки")
+
+    if background:
+        # Файл пишется на диск до постановки задачи: соединение с базой на время приёма тела не занято
+        path, size = await spool_upload(request.stream(), format)
+        job = await enqueue(db, "tracks_import", {"path": path, "size": size, "format": format,
+                                                  "batch_size": batch_size, "dedupe": dedupe, "method": method},
+                            user.id)
+        await db.commit()
+        job_runner.notify()
+        logger.info("Массовая загрузка поставлена в очередь: задача id=%s, файл %s, байт=%s", job.id, path, size)
+        return ORJSONResponse(Job.model_validate(job).model_dump(mode="json"), status_code=status.HTTP_202_ACCEPTED)
+
+    insert_batch = insert_batch_copy if method == "copy" else insert_batch_values
+    batches = []
+    try:
+        async for tracks, errors in iter_batches(iter_lines(request.stream()), format, batch_size):
+            batches.append(await load_batch(db, len(batches) + 1, tracks, errors, dedupe, insert_batch))
+    except ValueError as e:
+        logger.warning("Массовая загрузка прервана: %s", e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return bulk_report(batches)
+
+
 @router.post("/playlists", response_model= Playlist, summary="Создать плейлист",
              description="Создает плейлист")
 async def create_playlist(
         playlist: PlaylistCreate,
-        user: UsersOrm = Depends(get_current_user),
+        user: CurrentUser = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)):
-    logger.info(f"Пользователь id={user.id} создаёт плейлист: {playlist.name}")
+    logger.info("Пользователь id=%s создаёт плейлист: %s", user.id, playlist.name)
     if not user:
         logger.error("Пользователь не найден при создании плейлиста")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
 
-    new_playlist = PlaylistsOrm(name=playlist.name, user_id=user.id)
-    db.add(new_playlist)
+    result = await db.execute(insert(PlaylistsOrm)
+                              .values(name=playlist.name, user_id=user.id)
+                              .returning(PlaylistsOrm.id, PlaylistsOrm.name, PlaylistsOrm.user_id))
+    new_playlist = result.one()
     await db.commit()
-    await db.refresh(new_playlist)
-    logger.info(f"Плейлист создан: id={new_playlist.id}, name={new_playlist.name}, user_id={user.id}")
+    await version_store.bump(user_playlists_key(user.id))
+    logger.info("Плейлист создан: id=%s, name=%s, user_id=%s", new_playlist.id, new_playlist.name, user.id)
     return Playlist.model_validate(new_playlist)
 
-@router.get("/playlists", response_model=List[Playlist], summary="Получить все плейлисты пользователя",
-            description="Возвращает список всех плейлистов пользователя из базы данных")
-async def get_playlist( user: UsersOrm = Depends(get_current_user),
-                        db: AsyncSession = Depends(get_db)):
-    logger.info(f"Пользователь id={user.id} запрашивает список своих плейлистов")
-    result = await db.execute(select(PlaylistsOrm).where(PlaylistsOrm.user_id == user.id).order_by(PlaylistsOrm.id))
-    playlist = result.scalars().all()
-    logger.info(f"Найдено плейлистов: {len(playlist)} для пользователя id={user.id}")
-    return [Playlist.model_validate(p) for p in playlist]
+
+def generator_candidates_query(weights: dict[str, float], exclude_ids: list[int], limit: int):
+    """Кандидаты генератора: треки с общими тегами, лучшие по сумме весов своих тегов.
+
+    Без ORDER BY LIMIT отдавал бы первые подходящие строки таблицы — самые старые треки, да ещё с самым
+    частым тегом. Вес тега берётся из JSONB-параметра по ключу; random() перемешивает треки с равным весом,
+    чтобы выборка доставала до всего каталога, а не до одних и тех же строк.
+    """
+    tag = func.unnest(TracksOrm.tags).column_valued("tag")
+    weight = bindparam("tag_weights", weights, type_=JSONB)[tag].astext.cast(Float)
+    score = select(func.coalesce(func.sum(weight), 0.0)).scalar_subquery()
+    return (select(*TRACK_COLUMNS)
+            .where(TracksOrm.tags.overlap(list(weights)), TracksOrm.id.not_in(exclude_ids))
+            .order_by(score.desc(), func.random())
+            .limit(limit))
+
+
+@router.post("/playlists/generate", response_model=PlaylistWithTracks, summary="Сгенерировать плейлист",
+             description="Создаёт плейлист из треков, ассоциированных с тегами и треками-семенами, "
+                         "одним запросом и одной транзакцией")
+async def generate_playlist(params: PlaylistGenerate,
+                            user: CurrentUser = Depends(get_current_user),
+                            db: AsyncSession = Depends(get_db)):
+    logger.info("Пользователь id=%s генерирует плейлист %s: теги=%s, треки=%s, длина=%s",
+                user.id, params.name, params.seed_tags, params.seed_track_ids, params.length)
+    seed_ids = list(dict.fromkeys(params.seed_track_ids))
+    seeds = []
+    if seed_ids:
+        result = await db.execute(select(*TRACK_COLUMNS).where(TracksOrm.id.in_(seed_ids)))
+        by_id = {row.id: row for row in result.all()}
+        missing = [track_id for track_id in seed_ids if track_id not in by_id]
+        if missing:
+            logger.warning("Генерация плейлиста с несуществующими треками-семенами: %s", missing)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Треки не найдены: {missing}")
+        seeds = [by_id[track_id] for track_id in seed_ids][:params.length]
+
+    weights = expand_tags(params.seed_tags + [tag for row in seeds for tag in row.tags])
+    result = await db.execute(generator_candidates_query(weights, seed_ids,
+                                                         max(params.length * GENERATOR_CANDIDATES_FACTOR, 1000)))
+    candidates = result.all()
+    picked = sample_tracks([row.tags for row in candidates], weights, params.length - len(seeds),
+                           np.random.default_rng())
+    tracks = seeds + [candidates[i] for i in picked]
+
+    playlist_id = await db.scalar(insert(PlaylistsOrm)
+                                  .values(name=params.name, user_id=user.id)
+                                  .returning(PlaylistsOrm.id))
+    if tracks:
+        await db.execute(insert(PlaylistTracksOrm)
+                         .values([{"playlist_id": playlist_id, "track_id": row.id, "position": i * POSITION_GAP}
+                                  for i, row in enumerate(tracks, start=1)]))
+    await db.commit()
+    await version_store.bump(user_playlists_key(user.id))
+    logger.info("Сгенерирован плейлист id=%s из %s треков для пользователя id=%s", playlist_id, len(tracks), user.id)
+    return PlaylistWithTracks.model_validate({
+        "id": playlist_id,
+        "name": params.name,
+        "user_id": user.id,
+        "tracks": [row._mapping for row in tracks]
+    })
+
+
+def playlists_query(user_id: int, include: set[str], tracks_limit: int, limit: int, after_id: int | None):
+    """Страница плейлистов пользователя одним запросом: число треков — коррелированный count по индексу
+    playlist_tracks, первые треки — LATERAL-подзапрос с LIMIT, свёрнутый в JSON через json_agg"""
+    columns = [PlaylistsOrm.id, PlaylistsOrm.name, PlaylistsOrm.user_id]
+    query = select().where(PlaylistsOrm.user_id == user_id).order_by(PlaylistsOrm.id).limit(limit)
+    if after_id is not None:
+        query = query.where(PlaylistsOrm.id > after_id)
+    if "counts" in include:
+        columns.append(select(func.count())
+                       .where(PlaylistTracksOrm.playlist_id == PlaylistsOrm.id)
+                       .scalar_subquery()
+                       .label("track_count"))
+    if "tracks" in include:
+        first = (select(*TRACK_COLUMNS)
+                 .join(PlaylistTracksOrm, TracksOrm.id == PlaylistTracksOrm.track_id)
+                 .where(PlaylistTracksOrm.playlist_id == PlaylistsOrm.id)
+                 .order_by(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id)
+                 .limit(tracks_limit)
+                 .correlate(PlaylistsOrm)
+                 .subquery("first_tracks"))
+        tracks = func.coalesce(func.json_agg(first.table_valued(), type_=JSON), literal("[]", JSON))
+        aggregated = (select(tracks.label("tracks"))
+                      .select_from(first)
+                      .lateral("playlist_first_tracks"))
+        columns.append(aggregated.c.tracks)
+        query = query.select_from(PlaylistsOrm).join(aggregated, true())
+    return query.add_columns(*columns)
+
+
+@router.get("/playlists", response_model=List[PlaylistSummary], summary="Получить все плейлисты пользователя",
+            description="Возвращает плейлисты пользователя страницами по limit (курсор следующей страницы — "
+                        "в заголовке X-Next-Cursor). include=counts добавляет число треков, include=tracks — "
+                        "первые tracks_limit треков каждого плейлиста; всё одним запросом к базе данных")
+async def get_playlist( request: Request,
+                        response: Response,
+                        include: List[Literal["tracks", "counts"]] = Query([]),
+                        tracks_limit: int = Query(10, ge=1, le=100),
+                        limit: int = Query(100, ge=1, le=500),
+                        cursor: Optional[str] = Query(None),
+                        user_id: int = Depends(get_current_user_id),
+                        db: AsyncSession = Depends(get_read_db)):
+    logger.info("Пользователь id=%s запрашивает список своих плейлистов: include=%s, лимит=%s, курсор=%s",
+                user_id, include, limit, cursor, extra=SAMPLED)
+    not_modified = await conditional_response(request, response, user_playlists_key(user_id), True, user_id)
+    if not_modified:
+        logger.info("Список плейлистов пользователя id=%s не изменился, ответ 304", user_id, extra=SAMPLED)
+        return not_modified
+    after_id = decode_cursor(cursor) if cursor else None
+    result = await db.execute(playlists_query(user_id, set(include), tracks_limit, limit, after_id))
+    playlist = [dict(row) for row in result.mappings()]
+    if len(playlist) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(playlist[-1]["id"])
+    logger.info("Найдено плейлистов: %s для пользователя id=%s", len(playlist), user_id, extra=SAMPLED)
+    return rows_response(playlist, response)
 
 
 @router.get("/playlists/{playlist_id}/tracks", response_model=PlaylistWithTracks, summary="Открыть плейлист",
             description="Отображает все треки в плейлисте пользователя")
 async def get_playlist_tracks(playlist_id: int,
-                              db: AsyncSession = Depends(get_db),
-                              user: UsersOrm = Depends(get_current_user)):
-    logger.info(f"Пользователь id={user.id} запрашивает треки плейлиста id={playlist_id}")
-    playlist = await validate_playlist_owner(playlist_id, user, db)
-
-    result = await db.execute(select(TracksOrm)
-                              .join(PlaylistTracksOrm, TracksOrm.id == PlaylistTracksOrm.track_id)
-                              .where(PlaylistTracksOrm.playlist_id == playlist_id))
-    tracks = result.scalars().all()
-    logger.info(f"В плейлисте id={playlist_id} найдено треков: {len(tracks)}")
-    return PlaylistWithTracks.model_validate({
+                              request: Request,
+                              response: Response,
+                              db: AsyncSession = Depends(get_read_db),
+                              user_id: int = Depends(get_current_user_id)):
+    logger.info("Пользователь id=%s запрашивает треки плейлиста id=%s", user_id, playlist_id, extra=SAMPLED)
+    # user_id входит в ETag, поэтому чужой пользователь не получит 304 и дойдёт до проверки владельца
+    not_modified = await conditional_response(request, response, playlist_key(playlist_id), True, user_id)
+    if not_modified:
+        logger.info("Плейлист id=%s не изменился, ответ 304", playlist_id, extra=SAMPLED)
+        return not_modified
+    playlist = await validate_playlist_owner(playlist_id, user_id, db)
+
+    if catalog.ready:
+        # Из базы — только id треков плейлиста, сами треки — из реплики каталога
+        track_ids = (await db.scalars(select(PlaylistTracksOrm.track_id)
+                                      .where(PlaylistTracksOrm.playlist_id == playlist_id)
+                                      .order_by(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id))).all()
+        tracks = await catalog_tracks(track_ids, db)
+    else:
+        result = await db.execute(select(*TRACK_COLUMNS)
+                                  .join(PlaylistTracksOrm, TracksOrm.id == PlaylistTracksOrm.track_id)
+                                  .where(PlaylistTracksOrm.playlist_id == playlist_id)
+                                  .order_by(PlaylistTracksOrm.position, PlaylistTracksOrm.track_id))
+        tracks = [dict(row) for row in result.mappings()]
+    logger.info("В плейлисте id=%s найдено треков: %s", playlist_id, len(tracks), extra=SAMPLED)
+    return rows_response({
         "id": playlist.id,
         "name": playlist.name,
         "user_id": playlist.user_id,
         "tracks": tracks
-    })
+    }, response)
 
 @router.post("/playlists/{playlist_id}/tracks/{track_id}", summary="Добавить трек в плейлист",
              description="Добавляет выбранный трек в указанный плейлист пользователя")
 async def add_to_playlist(playlist_id: int,
                           track_id: int,
-                          user: UsersOrm = Depends(get_current_user),
+                          user_id: int = Depends(get_current_user_id),
                           db: AsyncSession = Depends(get_db)):
-    logger.info(f"Пользователь id={user.id} пытается добавить трек id={track_id} в плейлист id={playlist_id}")
-    playlist = await validate_playlist_owner(playlist_id, user, db)
-    track = await db.get(TracksOrm, track_id)
+    logger.info("Пользователь id=%s пытается добавить трек id=%s в плейлист id=%s", user_id, track_id, playlist_id)
+    # Один INSERT ... SELECT: строка появится, только если плейлист принадлежит пользователю, трек существует
+    # и его ещё нет в плейлисте. Причину отказа выясняем отдельными запросами лишь в этом редком случае
+    inserted = await db.scalar(pg_insert(PlaylistTracksOrm)
+                               .from_select(["playlist_id", "track_id", "position"],
+                                            select(PlaylistsOrm.id, TracksOrm.id, tail_position(playlist_id))
+                                            .join_from(PlaylistsOrm, TracksOrm, TracksOrm.id == track_id)
+                                            .where(PlaylistsOrm.id == playlist_id, PlaylistsOrm.user_id == user_id))
+                               .on_conflict_do_nothing()
+                               .returning(PlaylistTracksOrm.track_id))
+    if inserted is None:
+        await db.rollback()
+        await validate_playlist_owner(playlist_id, user_id, db)
+        if not await db.get(TracksOrm, track_id):
+            logger.warning("Попытка добавить несуществующий трек id=%s в плейлист id=%s", track_id, playlist_id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такой трек не найден")
+        logger.warning("Попытка добавить уже существующий трек id=%s в плейлист id=%s", track_id, playlist_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Трек уже находится в плейлисте")
+    await db.commit()
+    await version_store.bump(playlist_key(playlist_id), user_playlists_key(user_id))
+    logger.info("Трек id=%s добавлен в плейлист id=%s пользователем id=%s", track_id, playlist_id, user_id)
+    return {"message": "Трек добавлен"}
+
 
-    if not track:
-        logger.warning(f"Попытка добавить несуществующий трек id={track_id} в плейлист id={playlist_id}")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такой трек не найден")
+@router.post("/playlists/{playlist_id}/tracks/{track_id}/move", summary="Переместить трек в плейлисте",
+             description="Ставит трек сразу после трека after, без after — в начало плейлиста. Меняется одна строка: "
+                         "позиция берётся посередине между соседями, а плейлист перенумеровывается только "
+                         "изредка, когда промежутки между позициями становятся малы")
+async def move_playlist_track(playlist_id: int,
+                              track_id: int,
+                              background_tasks: BackgroundTasks,
+                              after: Optional[int] = Query(None, description="id трека, после которого встанет track_id"),
+                              user_id: int = Depends(get_current_user_id),
+                              db: AsyncSession = Depends(get_db)):
+    logger.info("Пользователь id=%s перемещает трек id=%s в плейлисте id=%s после трека id=%s",
+                user_id, track_id, playlist_id, after)
+    await validate_playlist_owner(playlist_id, user_id, db)
+    if after == track_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Трек нельзя поставить после самого себя")
+    requested = [track_id] if after is None else [track_id, after]
+    found = set((await db.scalars(select(PlaylistTracksOrm.track_id)
+                                  .where(PlaylistTracksOrm.playlist_id == playlist_id,
+                                         PlaylistTracksOrm.track_id.in_(requested)))).all())
+    for missing in requested:
+        if missing not in found:
+            logger.warning("Трек id=%s в плейлисте id=%s не найден при перемещении", missing, playlist_id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Трек {missing} в плейлисте не найден")
+    position, crowded = await move_track(db, playlist_id, track_id, after)
+    await db.commit()
+    if crowded:
+        background_tasks.add_task(rebalance_later, playlist_id)
+    await version_store.bump(playlist_key(playlist_id), user_playlists_key(user_id))
+    logger.info("Трек id=%s перемещён в плейлисте id=%s на позицию %s", track_id, playlist_id, position)
+    return {"message": "Трек перемещён"}
 
 
-    existing = await db.execute(select(PlaylistTracksOrm)
-                                .where(PlaylistTracksOrm.playlist_id == playlist.id,
-                                       PlaylistTracksOrm.track_id == track_id))
-    if existing.scalar_one_or_none():
-        logger.warning(f"Попытка добавить уже существующий трек id={track_id} в плейлист id={playlist_id}")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Трек уже находится в плейлисте")
+@router.patch("/playlists/{playlist_id}/tracks", response_model=PlaylistTracksPatchResult,
+              summary="Добавить и удалить треки в плейлисте пачкой",
+              description="Добавляет треки из add одним INSERT ... SELECT ... ON CONFLICT DO NOTHING и удаляет "
+                          "треки из remove одним DELETE в одной транзакции с проверкой владельца")
+async def patch_playlist_tracks(playlist_id: int,
+                                patch: PlaylistTracksPatch,
+                                user_id: int = Depends(get_current_user_id),
+                                db: AsyncSession = Depends(get_db)):
+    logger.info("Пользователь id=%s изменяет плейлист id=%s: добавить=%s, удалить=%s",
+                user_id, playlist_id, len(patch.add), len(patch.remove))
+    await validate_playlist_owner(playlist_id, user_id, db)
+    add_ids = list(dict.fromkeys(patch.add))
+    remove_ids = list(dict.fromkeys(patch.remove))
 
-    association = PlaylistTracksOrm(playlist_id=playlist.id, track_id=track.id)
-    db.add(association)
+    removed = []
+    if remove_ids:
+        result = await db.execute(delete(PlaylistTracksOrm)
+                                  .where(PlaylistTracksOrm.playlist_id == playlist_id,
+                                         PlaylistTracksOrm.track_id == any_(
+                                             bindparam("remove_ids", remove_ids, type_=ARRAY(Integer))))
+                                  .returning(PlaylistTracksOrm.track_id))
+        removed = result.scalars().all()
+
+    added, found = [], set()
+    if add_ids:
+        add_param = bindparam("add_ids", add_ids, type_=ARRAY(Integer))
+        existing = (select(TracksOrm.id)
+                    .where(TracksOrm.id == any_(add_param))
+                    .cte("existing"))
+        # Новые треки встают в конец плейлиста в порядке add
+        order = func.row_number().over(order_by=func.array_position(add_param, existing.c.id)) - 1
+        new_positions = tail_position(playlist_id) + order * POSITION_GAP
+        inserted = (pg_insert(PlaylistTracksOrm)
+                    .from_select(["playlist_id", "track_id", "position"],
+                                 select(literal(playlist_id), existing.c.id, new_positions))
+                    .on_conflict_do_nothing()
+                    .returning(PlaylistTracksOrm.track_id)
+                    .cte("inserted"))
+        result = await db.execute(select(existing.c.id, inserted.c.track_id)
+                                  .outerjoin(inserted, inserted.c.track_id == existing.c.id))
+        for track_id, inserted_id in result.all():
+            found.add(track_id)
+            if inserted_id is not None:
+                added.append(track_id)
     await db.commit()
-    await db.refresh(association)
-    logger.info(f"Трек id={track_id} добавлен в плейлист id={playlist_id} пользователем id={user.id}")
-    return {"message": "Трек добавлен"}
+    if added or removed:
+        await version_store.bump(playlist_key(playlist_id), user_playlists_key(user_id))
+
+    removed_set = set(removed)
+    added_set = set(added)
+    logger.info("Плейлист id=%s изменён пользователем id=%s: добавлено=%s, удалено=%s",
+                playlist_id, user_id, len(added), len(removed))
+    return PlaylistTracksPatchResult(
+        added=[track_id for track_id in add_ids if track_id in added_set],
+        skipped=[track_id for track_id in add_ids if track_id in found and track_id not in added_set],
+        missing=[track_id for track_id in add_ids if track_id not in found],
+        removed=[track_id for track_id in remove_ids if track_id in removed_set],
+        not_in_playlist=[track_id for track_id in remove_ids if track_id not in removed_set],
+    )
 
 
 @router.delete("/playlists/{playlist_id}", summary="Удалить плейлист",
                description="Удаляет плейлист, если пользователь является его создателем")
 async def delete_playlist(
     playlist_id: int,
-    user: UsersOrm = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"Пользователь id={user.id} пытается удалить плейлист id={playlist_id}")
-    playlist = await validate_playlist_owner(playlist_id, user, db)
-
-    await db.delete(playlist)
+    logger.info("Пользователь id=%s пытается удалить плейлист id=%s", user_id, playlist_id)
+    # Проверка владельца и удаление — один DELETE; треки плейлиста удаляет база через ON DELETE CASCADE
+    deleted = await db.scalar(delete(PlaylistsOrm)
+                              .where(PlaylistsOrm.id == playlist_id, PlaylistsOrm.user_id == user_id)
+                              .returning(PlaylistsOrm.id))
+    if deleted is None:
+        await db.rollback()
+        # Причина для ответа: нет плейлиста (404) или он чужой (403)
+        await validate_playlist_owner(playlist_id, user_id, db)
+        # Проверка прошла, но DELETE строку не нашёл: плейлист удалили или передали другому между запросами
+        logger.warning("Плейлист id=%s исчез при удалении пользователем id=%s", playlist_id, user_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такого плейлиста не существует")
     await db.commit()
-    logger.info(f"Плейлист id={playlist_id} удалён пользователем id={user.id}")
+    await version_store.bump(user_playlists_key(user_id), playlist_key(playlist_id))
+    logger.info("Плейлист id=%s удалён пользователем id=%s", playlist_id, user_id)
     return {"message": f"Плейлист с ID {playlist_id} удалён"}
 
 
@@ -178,21 +689,21 @@ async def delete_playlist(
                description="Удаляет указанный трек из плейлиста")
 async def delete_from_playlist(playlist_id: int,
                                track_id: int,
-                               user: UsersOrm = Depends(get_current_user),
+                               user_id: int = Depends(get_current_user_id),
                                db: AsyncSession = Depends(get_db)):
-    logger.info(f"Пользователь id={user.id} пытается удалить трек id={track_id} из плейлиста id={playlist_id}")
-    playlist = await validate_playlist_owner(playlist_id, user, db)
-
-    result = await db.execute(select(PlaylistTracksOrm)
+    logger.info("Пользователь id=%s пытается удалить трек id=%s из плейлиста id=%s", user_id, track_id, playlist_id)
+    deleted = await db.scalar(delete(PlaylistTracksOrm)
                               .where(PlaylistTracksOrm.playlist_id == playlist_id,
-                                     PlaylistTracksOrm.track_id == track_id))
-    association = result.scalar_one_or_none()
-
-    if not association:
-        logger.warning(f"Трек id={track_id} в плейлисте id={playlist_id} не найден при попытке удаления")
+                                     PlaylistTracksOrm.track_id == track_id,
+                                     PlaylistTracksOrm.playlist_id == PlaylistsOrm.id,
+                                     PlaylistsOrm.user_id == user_id)
+                              .returning(PlaylistTracksOrm.track_id))
+    if deleted is None:
+        await db.rollback()
+        await validate_playlist_owner(playlist_id, user_id, db)
+        logger.warning("Трек id=%s в плейлисте id=%s не найден при попытке удаления", track_id, playlist_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Трек в плейлисте не найден")
-
-    await db.delete(association)
     await db.commit()
-    logger.info(f"Трек id={track_id} удалён из плейлиста id={playlist_id} пользователем id={user.id}")
+    await version_store.bump(playlist_key(playlist_id), user_playlists_key(user_id))
+    logger.info("Трек id=%s удалён из плейлиста id=%s пользователем id=%s", track_id, playlist_id, user_id)
     return {"message": f"Трек удален"}
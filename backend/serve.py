@@ -0,0 +1,135 @@
+"""Запуск нескольких воркеров с предзагрузкой: python -m backend.serve --workers 4 --port 8000
+
+Родительский процесс собирает приложение, открывает сокет и один раз загружает общие структуры
+(граф тегов, индекс похожих треков, автодополнение, реплику каталога), затем делает fork воркеров
+uvicorn. Воркеры получают структуры готовыми, не читают базу при старте и делят страницы памяти с
+родителем, пока не изменят их. Соединения с базой fork не переживают: родитель закрывает свои до
+fork, каждый воркер открывает и прогревает свой пул в lifespan; хранилища версий ETag и лимитов
+открываются в воркере заново (os.register_at_fork в backend.etag и backend.admission). С --workers больше
+одного нужен общий VERSION_STORE_URL, иначе запуск отклоняется. Умерший воркер перезапускается из
+того же родителя — тоже без повторной загрузки. Только Linux и macOS (os.fork).
+"""
+import gc
+import os
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import importlib
+import dataclasses
+
+import uvicorn
+
+from backend.main import create_app, load_shared_state
+from backend.database import dispose_engines
+from backend.settings import get_settings
+from backend.logger_config import logger
+
+# Воркер, проживший меньше, перезапускается с паузой: иначе падающий при старте воркер займёт весь CPU
+MIN_WORKER_LIFETIME = 5
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+async def preload(app):
+    await load_shared_state(app.state.settings)
+    app.state.shared_state_loaded = True
+    # Соединения пула не переживают fork
+    await dispose_engines()
+
+
+def run_worker(app, sock: socket.socket, args) -> int:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Адрес клиента из X-Forwarded-For доверенных прокси: по нему считаются лимиты backend.admission
+    config = uvicorn.Config(app, host=args.host, port=args.port, timeout_graceful_shutdown=args.graceful_timeout,
+                            proxy_headers=True, forwarded_allow_ips=app.state.settings.forwarded_allow_ips)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return 0 if server.started else 3
+
+
+def spawn(app, sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = run_worker(app, sock, args)
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пре-форк сервер: общие структуры загружаются до fork воркеров")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--graceful-timeout", type=float, default=30)
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        raise SystemExit("backend.serve требует os.fork; на Windows запускайте uvicorn backend.main:app")
+
+    started = time.perf_counter()
+    app = create_app(dataclasses.replace(get_settings(), workers=args.workers))
+    from backend.etag import require_shared_version_store
+    from backend.admission import admission, MemoryBucketStore
+    try:
+        require_shared_version_store(args.workers)
+    except RuntimeError as error:
+        raise SystemExit(str(error))
+    if args.workers > 1 and admission.enabled and isinstance(admission.store, MemoryBucketStore):
+        logger.warning("Лимиты запросов хранятся в памяти каждого воркера: фактический лимит в %s раз выше, "
+                       "задайте RATE_LIMIT_STORE_URL=sqlite:///path/limits.db", args.workers)
+    sock = bind(args.host, args.port)
+    asyncio.run(preload(app))
+    # Ленивые импорты хеширования и JWT — тоже до fork, чтобы воркеры не повторяли их в первом запросе
+    from backend.auth import password_context
+    password_context()
+    importlib.import_module("jose.jwt")
+    # Объекты родителя уходят из-под сборщика мусора: его обходы не трогают общие страницы памяти воркеров
+    gc.collect()
+    gc.freeze()
+    logger.info("Общие структуры загружены за %.2f с, запуск воркеров: %s", time.perf_counter() - started,
+                args.workers)
+
+    workers = {spawn(app, sock, args): time.monotonic() for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        spawned = workers.pop(pid, None)
+        if spawned is None or stopping:
+            continue
+        logger.warning("Воркер pid=%s завершился с кодом %s, перезапуск", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - spawned < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+        if not stopping:
+            workers[spawn(app, sock, args)] = time.monotonic()
+    sock.close()
+    logger.info("Все воркеры остановлены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+from dataclasses import dataclass
+
+
+def env_bool(name: str, default: str = "") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def env_list(name: str, default: str = "") -> tuple[str, ...]:
+    return tuple(value.strip() for value in os.getenv(name, default).split(",") if value.strip())
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Все настройки приложения из окружения (и .env) в одном месте; читаются один раз при первом get_settings()"""
+
+    # База данных. Полный URL имеет приоритет над DB_*; sqlite+aiosqlite:///file.db подходит для локальных проверок
+    database_url: str = ""
+    # Необязательная реплика для чтения: GET-обработчики каталога и плейлистов идут туда
+    database_read_url: str | None = None
+    # Сколько секунд после записи реплика может отставать: в это окно ответы из неё не получают ETag
+    db_replica_max_lag: float = 0.0
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Кеш подготовленных выражений asyncpg на соединение; 0 — для PgBouncer в режиме transaction
+    db_statement_cache_size: int = 100
+    db_command_timeout: float = 60
+    # Сколько соединений пула открыть при старте, до первого запроса
+    db_pool_warmup: int = 10
+
+    # Аутентификация
+    secret_key: str | None = None
+    bcrypt_rounds: int = 12
+    bcrypt_workers: int = 4
+    bcrypt_max_queue: int = 64
+    admin_list: tuple[str, ...] = ()
+    user_cache_size: int = 10_000
+    user_cache_ttl: float = 60
+
+    # Логи: sinks — console и/или file, format — text или json
+    log_level: str = "INFO"
+    log_sinks: tuple[str, ...] = ("console", "file")
+    log_format: str = "text"
+    # Строки горячего пути (extra=SAMPLED) пишутся раз в log_sample_every для каждого шаблона сообщения
+    log_sample_every: int = 100
+    debug: bool = False
+
+    # Сколько воркеров обслуживают приложение: WEB_CONCURRENCY, как у uvicorn; backend.serve подставляет --workers
+    workers: int = 1
+    # Пусто — в памяти процесса; sqlite:///path — общий файл для нескольких воркеров uvicorn
+    version_store_url: str = ""
+    rate_limit_store_url: str = ""
+
+    # Структуры в памяти и их снимки
+    tag_graph_path: str = "tag_graph.npz"
+    similarity_index_path: str = "similarity_index"
+    catalog_replica: bool = False
+    catalog_snapshot_path: str = "catalog"
+    index_poll_interval: float = 5
+
+    # Контроль допуска: лимиты — «запросов в секунду/ёмкость корзины», 0 — без ограничения
+    admission_control: bool = True
+    rate_limit_auth: str = "1/10"
+    rate_limit_write: str = "20/40"
+    rate_limit_read: str = "100/200"
+    rate_limit_ip: str = "200/400"
+    # Адреса прокси, чьим X-Forwarded-For верить (через запятую, * — всем); переменную читает и сам uvicorn
+    forwarded_allow_ips: str = "127.0.0.1"
+    admission_concurrency: int = 20
+    admission_latency_budget: float = 0.5
+
+    # Фоновые задачи
+    job_workers: int = 2
+    job_db_pool_size: int = 3
+    job_poll_interval: float = 2
+    job_lease_seconds: float = 30
+    job_heartbeat_interval: float = 2
+    job_max_attempts: int = 3
+    job_retry_base_delay: float = 5
+    job_retry_max_delay: float = 600
+    bulk_spool_dir: str = "bulk_spool"
+
+    @classmethod
+    def from_env(cls, dotenv: bool = True) -> "Settings":
+        if dotenv:
+            # Единственное место, где читается .env (ищется вверх от backend/); заданные переменные он не перекрывает
+            from dotenv import load_dotenv
+            load_dotenv()
+        database_url = os.getenv("DATABASE_URL") or (
+            f'postgresql+asyncpg://{os.getenv("DB_LOGIN")}:{os.getenv("DB_PASSWORD")}'
+            f'@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}')
+        database_read_url = os.getenv("DATABASE_READ_URL") or None
+        db_pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+        db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        job_workers = int(os.getenv("JOB_WORKERS", "2"))
+        return cls(
+            database_url=database_url,
+            database_read_url=database_read_url,
+            db_replica_max_lag=float(os.getenv("DB_REPLICA_MAX_LAG", "5")) if database_read_url else 0.0,
+            db_pool_size=db_pool_size,
+            db_max_overflow=db_max_overflow,
+            db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            db_pool_pre_ping=env_bool("DB_POOL_PRE_PING", "true"),
+            db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+            db_command_timeout=float(os.getenv("DB_COMMAND_TIMEOUT", "60")),
+            db_pool_warmup=int(os.getenv("DB_POOL_WARMUP", str(db_pool_size))),
+            secret_key=os.getenv("SECRET_KEY"),
+            bcrypt_rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+            bcrypt_workers=int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            bcrypt_max_queue=int(os.getenv("BCRYPT_MAX_QUEUE", "64")),
+            admin_list=env_list("ADMIN_LIST"),
+            user_cache_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+            user_cache_ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            log_sinks=env_list("LOG_SINKS", "console,file"),
+            log_format=os.getenv("LOG_FORMAT", "text"),
+            log_sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "100")),
+            debug=env_bool("DEBUG"),
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            version_store_url=os.getenv("VERSION_STORE_URL", ""),
+            rate_limit_store_url=os.getenv("RATE_LIMIT_STORE_URL", ""),
+            tag_graph_path=os.getenv("TAG_GRAPH_PATH", "tag_graph.npz"),
+            similarity_index_path=os.getenv("SIMILARITY_INDEX_PATH", "similarity_index"),
+            catalog_replica=env_bool("CATALOG_REPLICA"),
+            catalog_snapshot_path=os.getenv("CATALOG_SNAPSHOT_PATH", "catalog"),
+            # CATALOG_POLL_INTERVAL — прежнее имя, когда опрос догонял только реплику каталога
+            index_poll_interval=float(os.getenv("INDEX_POLL_INTERVAL", os.getenv("CATALOG_POLL_INTERVAL", "5"))),
+            admission_control=env_bool("ADMISSION_CONTROL", "true"),
+            rate_limit_auth=os.getenv("RATE_LIMIT_AUTH", "1/10"),
+            rate_limit_write=os.getenv("RATE_LIMIT_WRITE", "20/40"),
+            rate_limit_read=os.getenv("RATE_LIMIT_READ", "100/200"),
+            rate_limit_ip=os.getenv("RATE_LIMIT_IP", "200/400"),
+            forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+            # По умолчанию одновременно обрабатывается столько запросов, сколько соединений может выдать пул
+            admission_concurrency=int(os.getenv("ADMISSION_CONCURRENCY", str(db_pool_size + db_max_overflow))),
+            admission_latency_budget=float(os.getenv("ADMISSION_LATENCY_BUDGET", "0.5")),
+            job_workers=job_workers,
+            job_db_pool_size=int(os.getenv("JOB_DB_POOL_SIZE", str(job_workers + 1))),
+            job_poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "2")),
+            job_lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "30")),
+            job_heartbeat_interval=float(os.getenv("JOB_HEARTBEAT_INTERVAL", "2")),
+            job_max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            job_retry_base_delay=float(os.getenv("JOB_RETRY_BASE_DELAY", "5")),
+            job_retry_max_delay=float(os.getenv("JOB_RETRY_MAX_DELAY", "600")),
+            bulk_spool_dir=os.getenv("BULK_SPOOL_DIR", "bulk_spool"),
+        )
+
+
+_current: Settings | None = None
+
+
+def get_settings() -> Settings:
+    """Настройки процесса: переданные в use_settings() (create_app), иначе прочитанные из окружения"""
+    global _current
+    if _current is None:
+        _current = Settings.from_env()
+    return _current
+
+
+def use_settings(settings: Settings):
+    """Делает settings настройками процесса. Модули читают их в свои константы при импорте, поэтому вызывать
+    нужно до импорта роутеров — это делает create_app()"""
+    global _current
+    _current = settings
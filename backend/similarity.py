@@ -0,0 +1,183 @@
+import os
+import shutil
+import zlib
+import argparse
+import asyncio
+
+import numpy as np
+
+from backend.settings import get_settings
+from backend.database import TracksOrm, stream_tracks, dispose_engines
+from backend.logger_config import logger, configure_logging
+
+
+DIM = 128
+TABLES = 12
+BITS = 10
+# Верхняя граница кандидатов из одного бакета: треки с одинаковым набором тегов дают одинаковые векторы
+BUCKET_LIMIT = 2000
+PLANES_SEED = 20250708
+
+
+def encode(tags: list[str], artists: list[str]) -> np.ndarray:
+    """Хешированный (feature hashing) разреженный профиль трека, нормированный по L2"""
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature in [f"tag:{tag}" for tag in tags] + [f"artist:{artist}" for artist in artists]:
+        h = zlib.crc32(feature.encode())
+        vector[h % DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SimilarityIndex:
+    """LSH-индекс по случайным гиперплоскостям поверх матрицы векторов треков.
+
+    Базовая часть (ids, vectors, отсортированные коды бакетов) загружается из снимка через
+    np.load(mmap_mode="r"), поэтому воркеры делят одну копию в page cache. Треки, добавленные
+    после снимка, хранятся в памяти процесса и ищутся через словари бакетов.
+    """
+
+    def __init__(self, tables: int = TABLES, bits: int = BITS):
+        self.tables = tables
+        self.bits = bits
+        self.planes = np.random.default_rng(PLANES_SEED).standard_normal((tables * bits, DIM)).astype(np.float32)
+        self.weights = (1 << np.arange(bits, dtype=np.int64))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, DIM), dtype=np.float32)
+        self.codes = np.zeros((tables, 0), dtype=np.int64)
+        self.order = np.zeros((tables, 0), dtype=np.int32)
+        self.extra_ids: dict[int, int] = {}
+        self.extra_vectors: list[np.ndarray] = []
+        self.extra_buckets: list[dict[int, list[int]]] = [{} for _ in range(tables)]
+        self.max_track_id = 0
+
+    def __len__(self):
+        return len(self.ids) + len(self.extra_vectors)
+
+    def _codes(self, vectors: np.ndarray) -> np.ndarray:
+        bits = (vectors @ self.planes.T > 0).reshape(len(vectors), self.tables, self.bits)
+        return (bits * self.weights).sum(axis=2).T
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        self.__init__(self.tables, self.bits)
+        self.ids = ids
+        self.vectors = vectors
+        codes = self._codes(vectors)
+        self.order = np.argsort(codes, axis=1, kind="stable").astype(np.int32)
+        self.codes = np.take_along_axis(codes, self.order, axis=1)
+        self.max_track_id = int(ids[-1]) if len(ids) else 0
+
+    def add_track(self, track_id: int, tags: list[str], artists: list[str]):
+        if self.vector(track_id) is not None:
+            return
+        vector = encode(tags, artists)
+        row = len(self.extra_vectors)
+        self.extra_vectors.append(vector)
+        self.extra_ids[track_id] = row
+        for table, code in enumerate(self._codes(vector[None, :])[:, 0]):
+            self.extra_buckets[table].setdefault(int(code), []).append(track_id)
+        self.max_track_id = max(self.max_track_id, track_id)
+
+    def vector(self, track_id: int) -> np.ndarray | None:
+        row = np.searchsorted(self.ids, track_id)
+        if row < len(self.ids) and self.ids[row] == track_id:
+            return self.vectors[row]
+        row = self.extra_ids.get(track_id)
+        return self.extra_vectors[row] if row is not None else None
+
+    def _candidates(self, codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        rows = []
+        extra = set()
+        for table, code in enumerate(codes):
+            lo, hi = np.searchsorted(self.codes[table], [code, code + 1])
+            rows.append(self.order[table, lo:min(hi, lo + BUCKET_LIMIT)])
+            extra.update(self.extra_buckets[table].get(int(code), ()))
+        base = np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int32)
+        return base, np.fromiter(extra, dtype=np.int64, count=len(extra))
+
+    def query(self, vector: np.ndarray, k: int, exclude: int | None = None,
+              min_candidates: int = 0) -> list[tuple[int, float]]:
+        codes = self._codes(vector[None, :])[:, 0]
+        base, extra = self._candidates(codes)
+        if len(base) + len(extra) < max(min_candidates, k + 1):
+            # Мультизондирование: соседние бакеты с одним перевёрнутым битом в каждой таблице
+            probes = [self._candidates(codes ^ (1 << bit)) for bit in range(self.bits)]
+            base = np.unique(np.concatenate([base] + [p[0] for p in probes]))
+            extra = np.unique(np.concatenate([extra] + [p[1] for p in probes]))
+
+        ids = np.concatenate([self.ids[base], extra])
+        vectors = np.concatenate([self.vectors[base],
+                                  np.array([self.extra_vectors[self.extra_ids[i]] for i in extra],
+                                           dtype=np.float32).reshape(-1, DIM)])
+        scores = vectors @ vector
+        if exclude is not None:
+            scores[ids == exclude] = -np.inf
+        top = np.argpartition(-scores, k)[:k + 1] if len(scores) > k + 1 else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])][:k]
+
+    def save(self, path: str):
+        ids = np.concatenate([self.ids, np.fromiter(self.extra_ids.keys(), dtype=np.int64)])
+        vectors = np.concatenate([self.vectors, np.array(self.extra_vectors, dtype=np.float32).reshape(-1, DIM)])
+        order = np.argsort(ids, kind="stable")
+        snapshot = SimilarityIndex(self.tables, self.bits)
+        snapshot.build(ids[order], vectors[order])
+
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ("ids", "vectors", "codes", "order"):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(snapshot, name))
+        if os.path.exists(path):
+            os.replace(path, f"{path}.old")
+        os.replace(tmp_path, path)
+        shutil.rmtree(f"{path}.old", ignore_errors=True)
+
+    def load(self, path: str):
+        self.__init__(self.tables, self.bits)
+        for name in ("ids", "vectors", "codes", "order"):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self.max_track_id = int(self.ids[-1]) if len(self.ids) else 0
+
+
+similarity_index = SimilarityIndex()
+
+
+async def encode_tracks() -> tuple[np.ndarray, np.ndarray]:
+    ids = []
+    vectors = []
+    async for track_id, tags, artists in stream_tracks(TracksOrm.tags, TracksOrm.artists):
+        ids.append(track_id)
+        vectors.append(encode(tags, artists))
+    return np.array(ids, dtype=np.int64), np.array(vectors, dtype=np.float32).reshape(-1, DIM)
+
+
+async def init_similarity_index():
+    """Подключает снимок индекса (SIMILARITY_INDEX_PATH) и догоняет его треками, добавленными после сборки"""
+    path = get_settings().similarity_index_path
+    if not os.path.isdir(path):
+        logger.warning("Снимок индекса похожих треков %s не найден, индекс собран в памяти процесса", path)
+        similarity_index.build(*await encode_tracks())
+        return
+    similarity_index.load(path)
+    added = 0
+    async for track_id, tags, artists in stream_tracks(TracksOrm.tags, TracksOrm.artists,
+                                                       after_id=similarity_index.max_track_id):
+        similarity_index.add_track(track_id, tags, artists)
+        added += 1
+    logger.info("Индекс похожих треков загружен из %s: треков=%s, догружено=%s", path, len(similarity_index), added)
+
+
+async def rebuild(path: str):
+    index = SimilarityIndex()
+    index.build(*await encode_tracks())
+    index.save(path)
+    await dispose_engines()
+    logger.info("Индекс похожих треков пересобран: треков=%s, снимок=%s", len(index), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-пересборка LSH-индекса похожих треков")
+    parser.add_argument("--out", default=get_settings().similarity_index_path)
+    configure_logging()
+    asyncio.run(rebuild(parser.parse_args().out))
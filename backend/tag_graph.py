@@ -0,0 +1,204 @@
+import os
+import argparse
+import asyncio
+from array import array
+from itertools import permutations
+
+import numpy as np
+
+from backend.settings import get_settings
+from backend.database import TracksOrm, stream_tracks, dispose_engines
+from backend.logger_config import logger, configure_logging
+
+
+# Сколько пар из инкрементальных обновлений копится до слияния в CSR-матрицу
+COMPACT_THRESHOLD = 50_000
+
+
+class TagGraph:
+    """Граф совместной встречаемости тегов.
+
+    Основа хранится в симметричной CSR-матрице (indptr/indices/data), которую строит
+    офлайн-пересборка. Треки, добавленные после неё, копятся в словаре delta и
+    периодически сливаются в матрицу, поэтому запись стоит O(tags²) одного трека.
+    """
+
+    def __init__(self):
+        self.vocab: dict[str, int] = {}
+        self.tags: list[str] = []
+        self.tag_counts = np.zeros(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.int32)
+        self.delta: dict[int, dict[int, int]] = {}
+        self.delta_size = 0
+        self.total_tracks = 0
+        self.max_track_id = 0
+        self._cache: dict[tuple[int, str, int], list[tuple[str, float, int]]] = {}
+
+    def _tag_id(self, tag: str) -> int:
+        tag_id = self.vocab.get(tag)
+        if tag_id is None:
+            tag_id = self.vocab[tag] = len(self.tags)
+            self.tags.append(tag)
+            if tag_id >= len(self.tag_counts):
+                self.tag_counts = np.resize(self.tag_counts, max(16, 2 * len(self.tag_counts)))
+                self.tag_counts[tag_id:] = 0
+        return tag_id
+
+    def add_track(self, track_id: int, tags: list[str]):
+        tag_ids = [self._tag_id(tag) for tag in dict.fromkeys(tags)]
+        for tag_id in tag_ids:
+            self.tag_counts[tag_id] += 1
+        for i, j in permutations(tag_ids, 2):
+            row = self.delta.setdefault(i, {})
+            row[j] = row.get(j, 0) + 1
+            self.delta_size += 1
+        self.total_tracks += 1
+        self.max_track_id = max(self.max_track_id, track_id)
+        self._cache.clear()
+        if self.delta_size >= COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self):
+        """Сливает накопленные инкрементальные пары в CSR-матрицу за O(nnz)"""
+        if not self.delta and len(self.indptr) == len(self.tags) + 1:
+            return
+        size = len(self.tags)
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        delta_rows = array("q")
+        delta_cols = array("q")
+        delta_vals = array("q")
+        for i, row in self.delta.items():
+            for j, count in row.items():
+                delta_rows.append(i)
+                delta_cols.append(j)
+                delta_vals.append(count)
+        self._set_matrix(size,
+                         np.concatenate([rows, np.frombuffer(delta_rows, dtype=np.int64)]),
+                         np.concatenate([self.indices.astype(np.int64), np.frombuffer(delta_cols, dtype=np.int64)]),
+                         np.concatenate([self.data.astype(np.int64), np.frombuffer(delta_vals, dtype=np.int64)]))
+        self.delta = {}
+        self.delta_size = 0
+
+    def _set_matrix(self, size: int, rows: np.ndarray, cols: np.ndarray, vals: np.ndarray):
+        if size == 0:
+            return
+        keys, inverse = np.unique(rows * size + cols, return_inverse=True)
+        sums = np.bincount(inverse, weights=vals).astype(np.int32)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // size, minlength=size))]).astype(np.int64)
+        self.indices = (keys % size).astype(np.int32)
+        self.data = sums
+
+    def _row(self, tag_id: int) -> tuple[np.ndarray, np.ndarray]:
+        if tag_id + 1 < len(self.indptr):
+            start, end = self.indptr[tag_id], self.indptr[tag_id + 1]
+            indices, data = self.indices[start:end], self.data[start:end]
+        else:
+            indices, data = self.indices[:0], self.data[:0]
+        delta = self.delta.get(tag_id)
+        if not delta:
+            return indices, data.astype(np.int64)
+        merged, inverse = np.unique(
+            np.concatenate([indices, np.fromiter(delta.keys(), dtype=np.int32, count=len(delta))]),
+            return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(
+            [data, np.fromiter(delta.values(), dtype=np.int32, count=len(delta))]))
+        return merged, counts.astype(np.int64)
+
+    def related(self, tag: str, k: int = 20, metric: str = "jaccard") -> list[tuple[str, float, int]] | None:
+        tag_id = self.vocab.get(tag)
+        if tag_id is None:
+            return None
+        key = (tag_id, metric, k)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        neighbours, together = self._row(tag_id)
+        if len(neighbours) == 0:
+            self._cache[key] = []
+            return []
+        own = self.tag_counts[tag_id]
+        other = self.tag_counts[neighbours]
+        if metric == "pmi":
+            scores = np.log(together * self.total_tracks / (own * other))
+        else:
+            scores = together / (own + other - together)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.lexsort((-together[top], -scores[top]))]
+        result = [(self.tags[neighbours[i]], round(float(scores[i]), 6), int(together[i])) for i in top]
+        self._cache[key] = result
+        return result
+
+    async def build(self, tracks):
+        """Полная сборка из асинхронного потока (track_id, tags) — используется только офлайн"""
+        self.__init__()
+        rows = array("q")
+        cols = array("q")
+        async for track_id, tags in tracks:
+            tag_ids = [self._tag_id(tag) for tag in dict.fromkeys(tags)]
+            for tag_id in tag_ids:
+                self.tag_counts[tag_id] += 1
+            for i, j in permutations(tag_ids, 2):
+                rows.append(i)
+                cols.append(j)
+            self.total_tracks += 1
+            self.max_track_id = max(self.max_track_id, track_id)
+        rows = np.frombuffer(rows, dtype=np.int64)
+        self._set_matrix(len(self.tags), rows, np.frombuffer(cols, dtype=np.int64), np.ones(len(rows)))
+
+    def save(self, path: str):
+        self.compact()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, tags=np.array(self.tags, dtype=str), tag_counts=self.tag_counts[:len(self.tags)],
+                     indptr=self.indptr, indices=self.indices, data=self.data,
+                     meta=np.array([self.total_tracks, self.max_track_id], dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        self.__init__()
+        with np.load(path) as snapshot:
+            self.tags = snapshot["tags"].tolist()
+            self.vocab = {tag: i for i, tag in enumerate(self.tags)}
+            self.tag_counts = snapshot["tag_counts"].astype(np.int64)
+            self.indptr = snapshot["indptr"]
+            self.indices = snapshot["indices"]
+            self.data = snapshot["data"]
+            self.total_tracks, self.max_track_id = (int(v) for v in snapshot["meta"])
+
+
+tag_graph = TagGraph()
+
+
+async def init_tag_graph():
+    """Загружает снимок графа (TAG_GRAPH_PATH) и догоняет его треками, добавленными после сборки"""
+    path = get_settings().tag_graph_path
+    if os.path.exists(path):
+        tag_graph.load(path)
+        logger.info("Граф тегов загружен из %s: тегов=%s, треков=%s", path, len(tag_graph.tags), tag_graph.total_tracks)
+    else:
+        logger.warning("Снимок графа тегов %s не найден, граф будет собран из базы данных", path)
+    added = 0
+    async for track_id, tags in stream_tracks(TracksOrm.tags, after_id=tag_graph.max_track_id):
+        tag_graph.add_track(track_id, tags)
+        added += 1
+    tag_graph.compact()
+    logger.info("Граф тегов готов: догружено треков=%s, всего тегов=%s", added, len(tag_graph.tags))
+
+
+async def rebuild(path: str):
+    graph = TagGraph()
+    await graph.build(stream_tracks(TracksOrm.tags))
+    graph.save(path)
+    await dispose_engines()
+    logger.info("Граф тегов пересобран: треков=%s, тегов=%s, рёбер=%s, снимок=%s",
+                graph.total_tracks, len(graph.tags), len(graph.indices), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-пересборка графа совместной встречаемости тегов")
+    parser.add_argument("--out", default=get_settings().tag_graph_path)
+    configure_logging()
+    asyncio.run(rebuild(parser.parse_args().out))
@@ -0,0 +1,24 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, HTTPException, Query, status
+
+from backend.models import RelatedTag
+from backend.tag_graph import tag_graph
+from backend.logger_config import logger
+
+
+router = APIRouter(prefix="/tags", tags=["Теги"])
+
+
+@router.get("/{tag}/related", response_model=List[RelatedTag], summary="Связанные теги",
+            description="Возвращает теги, чаще всего встречающиеся вместе с указанным, "
+                        "по мере Jaccard или PMI. Отвечает из графа в памяти, без запросов к базе данных")
+async def get_related_tags(tag: str,
+                           k: int = Query(20, ge=1, le=100),
+                           metric: Literal["jaccard", "pmi"] = Query("jaccard")):
+    related = tag_graph.related(tag, k, metric)
+    if related is None:
+        logger.warning("Запрошены связанные теги для неизвестного тега: %s", tag)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Такой тег не найден")
+    logger.debug("Связанные теги для %s (%s): %s", tag, metric, len(related))
+    return [RelatedTag(tag=name, score=score, count=count) for name, score, count in related]
@@ -0,0 +1,101 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from backend.settings import get_settings
+from backend.database import TracksOrm, read_session, stream_tracks
+from backend.tag_graph import tag_graph
+from backend.similarity import similarity_index
+from backend.autocomplete import autocomplete
+from backend.catalog import catalog
+from backend.logger_config import logger
+
+
+# Как часто воркер проверяет max(id) и догоняет структуры в памяти треками, добавленными другими воркерами
+INDEX_POLL_INTERVAL = get_settings().index_poll_interval
+# Треки с id чуть меньше известного максимума могли закоммититься позже него: их перечитываем при опросе
+POLL_LOOKBACK = 1000
+
+
+class IndexedTracks:
+    """Какие треки уже добавлены в граф тегов, индекс похожих треков, подсказки и реплику каталога.
+
+    Граф тегов и подсказки считают треки, повторное добавление исказило бы счётчики. Всё, что не выше floor,
+    считается добавленным при загрузке; выше floor id помнятся поштучно, но только в окне POLL_LOOKBACK
+    от максимума — дальше назад опрос не перечитывает.
+    """
+
+    def __init__(self):
+        self.floor = 0
+        self.max_track_id = 0
+        self.recent: set[int] = set()
+
+    def loaded(self, max_track_id: int):
+        self.floor = self.max_track_id = max_track_id
+        self.recent.clear()
+
+    def claim(self, tracks) -> list:
+        """Оставляет из строк (id, ...) ещё не добавленные и отмечает их добавленными"""
+        new = []
+        for row in tracks:
+            if row[0] > self.floor and row[0] not in self.recent:
+                self.recent.add(row[0])
+                new.append(row)
+        if new:
+            self.max_track_id = max(self.max_track_id, max(row[0] for row in new))
+            if len(self.recent) > 2 * POLL_LOOKBACK:
+                self.floor = max(self.floor, self.max_track_id - POLL_LOOKBACK)
+                self.recent = {track_id for track_id in self.recent if track_id > self.floor}
+        return new
+
+
+indexed_tracks = IndexedTracks()
+
+
+def index_new_tracks(tracks):
+    """Инкрементально добавляет строки (id, title, artists, tags, url) в графы и индексы в памяти"""
+    tracks = indexed_tracks.claim(tracks)
+    for track_id, title, artists, tags, url in tracks:
+        tag_graph.add_track(track_id, tags)
+        similarity_index.add_track(track_id, tags, artists)
+        if catalog.ready:
+            catalog.add_track(track_id, title, artists, tags, url)
+    autocomplete.add_tracks(tracks)
+    return len(tracks)
+
+
+def track_indexes_loaded():
+    """Вызывается после загрузки структур: всё, что они прочитали из базы, больше не добавляется"""
+    indexed_tracks.loaded(max(tag_graph.max_track_id, similarity_index.max_track_id, autocomplete.max_track_id,
+                              catalog.max_track_id))
+
+
+async def catch_up_indexes() -> int:
+    after_id = max(indexed_tracks.floor, indexed_tracks.max_track_id - POLL_LOOKBACK)
+    added = 0
+    batch = []
+    async for row in stream_tracks(TracksOrm.title, TracksOrm.artists, TracksOrm.tags, TracksOrm.url,
+                                   after_id=after_id):
+        batch.append(row)
+        if len(batch) >= 10_000:
+            added += index_new_tracks(batch)
+            batch = []
+    return added + index_new_tracks(batch)
+
+
+async def poll_track_indexes(interval: float = INDEX_POLL_INTERVAL):
+    """Фоновая задача: треки, добавленные другими воркерами, подтягиваются по изменению max(id).
+
+    Запись трека обновляет структуры только в обработавшем её воркере; без опроса остальные отдавали бы
+    устаревшие связанные теги, похожие треки, подсказки и каталог до перезапуска.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with read_session() as session:
+                max_id = await session.scalar(select(func.max(TracksOrm.id)))
+            if max_id and max_id > indexed_tracks.max_track_id:
+                added = await catch_up_indexes()
+                logger.info("Структуры в памяти догнали базу: добавлено треков=%s", added)
+        except Exception:
+            logger.exception("Не удалось догнать структуры в памяти")
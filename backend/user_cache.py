@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from backend.settings import get_settings
+
+
+settings = get_settings()
+admin_list = list(settings.admin_list)
+USER_CACHE_SIZE = settings.user_cache_size
+USER_CACHE_TTL = settings.user_cache_ttl
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """Поля пользователя, которые нужны обработчикам; признак админа вычисляется один раз"""
+    id: int
+    email: str
+    username: str
+    is_admin: bool
+
+    @classmethod
+    def from_orm(cls, user) -> "CurrentUser":
+        return cls(id=user.id, email=user.email, username=user.username, is_admin=user.email in admin_list)
+
+
+class UserCache:
+    """Ограниченный LRU-кеш «токен → пользователь» с TTL, не превышающим срок жизни самого токена"""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, CurrentUser]] = OrderedDict()
+        self._tokens: dict[int, set[str]] = {}
+        # Токены с уже проверенной подписью → id: для обработчиков, которым нужен только id, и лимитов запросов
+        self._ids: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> CurrentUser | None:
+        entry = self._entries.get(token)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._drop(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+
+    def user_id(self, token: str) -> int | None:
+        """id по ранее проверенному токену, без проверки подписи; None — токен ещё не встречался или устарел"""
+        now = time.monotonic()
+        entry = self._entries.get(token)
+        if entry is not None and entry[0] > now:
+            return entry[1].id
+        entry = self._ids.get(token)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        return None
+
+    def _ttl(self, token_exp: float | None) -> float:
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return 0
+        return self.ttl if token_exp is None else min(self.ttl, token_exp - time.time())
+
+    def put_id(self, token: str, user_id: int, token_exp: float | None = None):
+        ttl = self._ttl(token_exp)
+        if ttl <= 0:
+            return
+        self._ids[token] = (time.monotonic() + ttl, user_id)
+        self._ids.move_to_end(token)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def put(self, token: str, user: CurrentUser, token_exp: float | None = None):
+        ttl = self._ttl(token_exp)
+        if ttl <= 0:
+            return
+        if token in self._entries:
+            self._drop(token)
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._tokens.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, token: str):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens[user.id]
+
+    def invalidate_user(self, user_id: int):
+        """Вызывается при изменении или удалении пользователя: сбрасывает все его токены"""
+        for token in list(self._tokens.get(user_id, ())):
+            self._drop(token)
+        for token in [token for token, (_, cached_id) in self._ids.items() if cached_id == user_id]:
+            del self._ids[token]
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens.clear()
+        self._ids.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
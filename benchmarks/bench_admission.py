@@ -0,0 +1,122 @@
+"""Нагрузочный тест: задержка обычных пользователей, пока один клиент заваливает сервис запросами.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_admission --abuse-rate 1000 --users 20
+
+Злоупотребляющий клиент — один пользователь с одного адреса — шлёт --abuse-rate запросов в секунду, не
+дожидаясь ответов: создаёт плейлисты и входит в аккаунт (bcrypt). Нагрузка открытая, чтобы быстрые отказы
+429/503 не превращались в ещё более частые запросы, как было бы у клиента с фиксированным числом потоков.
+Обычные пользователи, каждый со своего адреса, читают свои плейлисты с паузой --think. Прогон повторяется без контроля допуска и с ним (backend.admission с лимитами
+из окружения); выводятся p50/p95/p99 обычных пользователей и статусы ответов обеих сторон.
+"""
+import argparse
+import asyncio
+import collections
+import time
+
+from benchmarks.common import configure_app_database, percentiles
+
+configure_app_database()
+
+import httpx
+
+from backend.main import app
+from backend.auth import create_access_token, get_password_hash
+from backend.admission import admission, create_bucket_store, ConcurrencyLimiter
+from backend.database import engine
+from backend.user_cache import user_cache
+from benchmarks.seed import seed, BENCH_PASSWORD
+
+ABUSER_ID = 1
+
+
+def client_for(address: str) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False, client=(address, 50000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None)
+
+
+async def abuse(client: httpx.AsyncClient, email: str, rate: float, stop: asyncio.Event,
+                statuses: collections.Counter):
+    """Открытая нагрузка: запросы уходят с частотой rate, не дожидаясь ответов на предыдущие"""
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(ABUSER_ID)})}"}
+
+    async def one(i: int):
+        if i % 4:
+            response = await client.post("/playlists", json={"name": f"spam{i}"}, headers=headers)
+        else:
+            response = await client.post("/auth/login", json={"email": email, "username": None,
+                                                              "password": BENCH_PASSWORD})
+        statuses[response.status_code] += 1
+
+    pending, i, start = set(), 0, time.perf_counter()
+    while not stop.is_set():
+        i += 1
+        task = asyncio.create_task(one(i))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+    await asyncio.gather(*pending)
+
+
+async def browse(client: httpx.AsyncClient, user_id: int, playlist_id: int, stop: asyncio.Event, think: float,
+                 statuses: collections.Counter) -> list[float]:
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(f"/playlists/{playlist_id}/tracks", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] += 1
+        await asyncio.sleep(think)
+    return latencies
+
+
+async def measure(owned: list[tuple[int, int]], email: str, args) -> tuple[dict, dict, dict]:
+    user_cache.clear()
+    abuser_statuses, user_statuses = collections.Counter(), collections.Counter()
+    stop = asyncio.Event()
+    clients = [client_for("10.0.0.1")] + [client_for(f"10.1.{i // 250}.{i % 250 + 1}") for i in range(len(owned))]
+    try:
+        abuser = asyncio.create_task(abuse(clients[0], email, args.abuse_rate, stop, abuser_statuses))
+        browsers = [asyncio.create_task(browse(client, user_id, playlist_id, stop, args.think, user_statuses))
+                    for client, (user_id, playlist_id) in zip(clients[1:], owned)]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await abuser
+        latencies = [value for samples in await asyncio.gather(*browsers) for value in samples]
+    finally:
+        for client in clients:
+            await client.aclose()
+    return percentiles(latencies), dict(user_statuses), dict(abuser_statuses)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--abuse-rate", type=float, default=1000, help="запросов в секунду от злоупотребляющего клиента")
+    parser.add_argument("--users", type=int, default=20, help="обычных пользователей")
+    parser.add_argument("--tracks", type=int, default=5000)
+    parser.add_argument("--think", type=float, default=0.05, help="пауза обычного пользователя между запросами, с")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    dataset = await seed(engine, args.users + 1, args.tracks, 1, get_password_hash(BENCH_PASSWORD))
+    first_playlist = {}
+    for playlist_id, (user_id, _) in sorted(dataset.playlists.items()):
+        first_playlist.setdefault(user_id, playlist_id)
+    owned = [(user_id, playlist_id) for user_id, playlist_id in first_playlist.items() if user_id != ABUSER_ID]
+    email = dataset.user_email(ABUSER_ID)
+    print(f"обычных пользователей с плейлистами: {len(owned)}, злоупотребление: {args.abuse_rate:g} запросов/с, "
+          f"очередь к пулу: {admission.limiter.limit} мест, бюджет ожидания {admission.limiter.budget} с")
+    try:
+        for name, enabled in [("без контроля допуска", False), ("с контролем допуска", True)]:
+            admission.enabled = enabled
+            admission.store = create_bucket_store()
+            admission.limiter = ConcurrencyLimiter()
+            latency, user_statuses, abuser_statuses = await measure(owned, email, args)
+            print(f"{name}: обычные пользователи, мс {latency}, статусы {user_statuses}; "
+                  f"злоупотребляющий клиент: статусы {abuser_statuses}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
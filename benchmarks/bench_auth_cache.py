@@ -0,0 +1,84 @@
+"""Бенчмарк аутентифицированных эндпоинтов с кешем пользователей и без него.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_auth_cache --requests 5000 --concurrency 32
+
+Запросы идут в приложение в том же процессе через httpx.ASGITransport, поэтому измеряется
+стоимость обработчика и базы данных без сети.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import configure_app_database, percentiles
+
+configure_app_database()
+
+import httpx
+from sqlalchemy import text
+
+from fastapi import Depends
+
+from backend.main import app
+from backend.router import get_current_user
+from backend.auth import create_access_token
+from backend.database import engine, async_session, Model, UsersOrm, PlaylistsOrm
+from backend.user_cache import user_cache
+
+
+@app.get("/_bench/me")
+async def bench_me(user=Depends(get_current_user)):
+    # Только зависимость get_current_user: без кеша это декодирование JWT и db.get(UsersOrm) на каждый запрос
+    return {"id": user.id}
+
+
+async def seed() -> str:
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.create_all)
+        await conn.execute(text("TRUNCATE users RESTART IDENTITY CASCADE"))
+    async with async_session() as db:
+        user = UsersOrm(email="bench@example.com", username="bench", password="-")
+        db.add(user)
+        await db.flush()
+        db.add_all(PlaylistsOrm(name=f"playlist {i}", user_id=user.id) for i in range(20))
+        await db.commit()
+        return create_access_token({"sub": str(user.id)})
+
+
+async def drive(client: httpx.AsyncClient, path: str, token: str, requests: int, concurrency: int):
+    latencies = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for _ in queue:
+            start = time.perf_counter()
+            response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start), percentiles(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    token = await seed()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/_bench/me", "/playlists"):
+            for enabled in (False, True):
+                user_cache.clear()
+                user_cache.ttl = 60 if enabled else 0
+                user_cache.hits = user_cache.misses = 0
+                rps, stats = await drive(client, path, token, args.requests, args.concurrency)
+                print(f"GET {path}, кеш {'включён' if enabled else 'выключен'}: {rps:,.0f} rps, "
+                      f"latency, ms {stats}, {user_cache.stats()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Бенчмарк загрузки каталога: строк/с для пути add_track (add → commit → refresh на каждый трек)
+против пачек POST /tracks/bulk через многострочный INSERT ... RETURNING и COPY.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_bulk_ingest --rows 100000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend.bulk import insert_batch_copy, insert_batch_values
+from backend.database import Model, TracksOrm
+from backend.models import TrackAdd
+from benchmarks.common import bench_engine, synthetic_tracks
+
+
+async def reset(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.create_all)
+        await conn.execute(text("TRUNCATE tracks RESTART IDENTITY CASCADE"))
+
+
+async def per_row(session_factory, tracks: list[TrackAdd], batch_size: int):
+    async with session_factory() as db:
+        for track in tracks:
+            new_track = TracksOrm(**track.model_dump())
+            db.add(new_track)
+            await db.commit()
+            await db.refresh(new_track)
+
+
+def batched(insert_batch):
+    async def load(session_factory, tracks: list[TrackAdd], batch_size: int):
+        async with session_factory() as db:
+            for start in range(0, len(tracks), batch_size):
+                await insert_batch(db, tracks[start:start + batch_size], False)
+                await db.commit()
+    return load
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--per-row-rows", type=int, default=2_000,
+                        help="построчный путь медленный, поэтому меряется на меньшем объёме")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    tracks = [TrackAdd(title=title, artists=artists, tags=tags, url=url)
+              for title, artists, tags, url in synthetic_tracks(args.rows)]
+    engine = bench_engine()
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    for name, load, rows in [("add_track (построчно)", per_row, args.per_row_rows),
+                             ("INSERT ... RETURNING", batched(insert_batch_values), args.rows),
+                             ("COPY + INSERT ... SELECT", batched(insert_batch_copy), args.rows)]:
+        await reset(engine)
+        start = time.perf_counter()
+        await load(session_factory, tracks[:rows], args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {rows} строк за {elapsed:.2f} с, {rows / elapsed:,.0f} строк/с")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
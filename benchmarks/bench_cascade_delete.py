@@ -0,0 +1,110 @@
+"""Бенчмарк удаления больших плейлистов и аккаунтов: каскад ORM против ON DELETE CASCADE в базе.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_cascade_delete --sizes 1000 20000
+
+Каскад ORM — как было до passive_deletes: коллекции загружаются в сессию (selectinload) и session.delete
+удаляет каждую строку playlist_tracks отдельным объектом. Каскад базы — как сейчас в DELETE /playlists/{id}
+и DELETE /auth/me: один DELETE ... RETURNING id. Для каждого выводятся время, число SQL-запросов и пик
+памяти Python (tracemalloc).
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.common import configure_app_database
+
+configure_app_database()
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import selectinload
+
+from backend.database import engine, async_session, UsersOrm, PlaylistsOrm, PlaylistTracksOrm
+from backend.positions import POSITION_GAP
+from backend.query_stats import collect_queries
+from benchmarks.seed import seed, insert_chunked
+
+
+async def fill(user_id: int, playlists: int, size: int):
+    async with engine.begin() as conn:
+        await conn.execute(insert(UsersOrm).values(id=user_id, email=f"user{user_id}@bench.local",
+                                                   username=f"user{user_id}", password="-"))
+        for i in range(playlists):
+            playlist_id = user_id * 1000 + i
+            await conn.execute(insert(PlaylistsOrm).values(id=playlist_id, name="bench", user_id=user_id))
+            await insert_chunked(conn, PlaylistTracksOrm, [
+                {"playlist_id": playlist_id, "track_id": track_id, "position": track_id * POSITION_GAP}
+                for track_id in range(1, size + 1)])
+
+
+async def orm_playlist(user_id: int):
+    async with async_session() as db:
+        playlist = await db.scalar(select(PlaylistsOrm).where(PlaylistsOrm.user_id == user_id)
+                                   .options(selectinload(PlaylistsOrm.tracks)))
+        await db.delete(playlist)
+        await db.commit()
+
+
+async def db_playlist(user_id: int):
+    async with async_session() as db:
+        await db.scalar(delete(PlaylistsOrm)
+                        .where(PlaylistsOrm.id == user_id * 1000, PlaylistsOrm.user_id == user_id)
+                        .returning(PlaylistsOrm.id))
+        await db.commit()
+
+
+async def orm_account(user_id: int):
+    async with async_session() as db:
+        user = await db.scalar(select(UsersOrm).where(UsersOrm.id == user_id)
+                               .options(selectinload(UsersOrm.playlists).selectinload(PlaylistsOrm.tracks)))
+        await db.delete(user)
+        await db.commit()
+
+
+async def db_account(user_id: int):
+    async with async_session() as db:
+        await db.scalar(delete(UsersOrm).where(UsersOrm.id == user_id).returning(UsersOrm.id))
+        await db.commit()
+
+
+async def measure(remove, user_id: int) -> tuple[float, int, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    with collect_queries() as stats:
+        await remove(user_id)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    async with async_session() as db:
+        left = (await db.scalars(select(PlaylistTracksOrm.playlist_id)
+                                 .where(PlaylistTracksOrm.playlist_id.between(user_id * 1000, user_id * 1000 + 999))
+                                 .limit(1))).first()
+    assert left is None, "строки playlist_tracks остались после удаления"
+    return elapsed * 1000, stats.count, peak / 2 ** 20
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20_000])
+    parser.add_argument("--account-playlists", type=int, default=20)
+    args = parser.parse_args()
+
+    await seed(engine, users=0, tracks=max(args.sizes), playlists_per_user=0, password_hash="-")
+    user_id = 1
+    try:
+        cases = [("плейлист", 1, orm_playlist, db_playlist),
+                 (f"аккаунт ({args.account_playlists} плейлистов)", args.account_playlists, orm_account, db_account)]
+        for size in args.sizes:
+            for what, playlists, orm_path, db_path in cases:
+                for name, remove in (("каскад ORM", orm_path), ("каскад базы", db_path)):
+                    await fill(user_id, playlists, size)
+                    elapsed, queries, peak = await measure(remove, user_id)
+                    print(f"{what} по {size} треков, {name:12}: {elapsed:9.1f} мс, SQL-запросов {queries:6}, "
+                          f"пик памяти {peak:7.1f} МБ")
+                    user_id += 1
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
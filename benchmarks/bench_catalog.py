@@ -0,0 +1,108 @@
+"""Бенчмарк реплики каталога: память на миллион треков и задержка чтения из снимка через mmap.
+
+    python -m benchmarks.bench_catalog --tracks 1000000
+
+База данных не нужна: снимок строится из синтетических треков во временном каталоге. Для сравнения
+показывается, сколько заняли бы те же треки словарями Python (tracemalloc на выборке, пересчёт на миллион).
+Сквозную задержку GET /tracks и GET /playlists/{id}/tracks с репликой (CATALOG_REPLICA=1) и без неё
+меряет benchmarks.suite.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from backend.catalog import CatalogReplica, COLUMNS
+from benchmarks.common import synthetic_tracks, percentiles
+
+
+def rss_mb() -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def rows(count: int):
+    for track_id, (title, artists, tags, url) in enumerate(synthetic_tracks(count), start=1):
+        yield track_id, title, artists, tags, url
+
+
+def dicts_mb_per_million(sample: int) -> float:
+    tracemalloc.start()
+    tracks = [{"id": track_id, "title": title, "artists": artists, "tags": tags, "url": url}
+              for track_id, title, artists, tags, url in rows(sample)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tracks
+    return size / sample * 1_000_000 / 2 ** 20
+
+
+def latency_us(fn, repeat: int) -> dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    parser.add_argument("--dict-sample", type=int, default=100_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-catalog-"), "catalog")
+    start = time.perf_counter()
+    builder = CatalogReplica()
+    builder.build(rows(args.tracks))
+    builder.save(path)
+    print(f"сборка и запись снимка: {time.perf_counter() - start:.1f} с, строк в пуле: "
+          f"{len(builder.string_offsets) - 1:,}")
+    del builder
+
+    disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    per_million = disk / args.tracks * 1_000_000 / 2 ** 20
+    print(f"снимок на диске: {disk / 2 ** 20:.1f} МБ, {per_million:.1f} МБ на миллион треков "
+          f"(общие страницы page cache для всех воркеров)")
+    print(f"те же треки словарями Python: {dicts_mb_per_million(args.dict_sample):.1f} МБ на миллион "
+          f"в каждом воркере")
+
+    before = rss_mb()
+    start = time.perf_counter()
+    catalog = CatalogReplica()
+    catalog.load(path)
+    print(f"загрузка снимка: {(time.perf_counter() - start) * 1000:.1f} мс")
+    if before is not None:
+        after_load = rss_mb()
+        # Прогреваем все страницы, как после долгой работы: RSS растёт, но это разделяемая память
+        for name in COLUMNS:
+            getattr(catalog, name).sum()
+        print(f"RSS: {after_load - before:+.1f} МБ после загрузки, {rss_mb() - before:+.1f} МБ после чтения "
+              f"всех страниц")
+
+    expected = {track_id: (title, artists, tags, url) for track_id, title, artists, tags, url in rows(1000)}
+    for track_id, (title, artists, tags, url) in expected.items():
+        track = catalog.get(track_id)
+        assert (track["title"], track["artists"], track["tags"], track["url"]) == (title, artists, tags, url)
+
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.tracks) for _ in range(args.repeat)]
+    playlist = [rng.randint(1, args.tracks) for _ in range(50)]
+    print(f"get(id), мкс: {latency_us(lambda: catalog.get(ids[rng.randrange(len(ids))]), args.repeat)}")
+    print(f"get_many(50 id), мкс: {latency_us(lambda: catalog.get_many(playlist), args.repeat // 10)}")
+    print(f"page(20, offset), мкс: "
+          f"{latency_us(lambda: catalog.page(20, rng.randrange(args.tracks)), args.repeat)}")
+    print(f"page(20, after_id), мкс: "
+          f"{latency_us(lambda: catalog.page(20, after_id=rng.randrange(args.tracks)), args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Бенчмарк накладных расходов логирования на запрос: синхронные обработчики против очереди, INFO против DEBUG.
+
+    python -m benchmarks.bench_logging --requests 5000 --concurrency 32
+
+База данных не нужна: пробный маршрут пишет в лог то же, что типичный обработчик (строки горячего пути,
+отладочные строки авторизации и проверки владельца). Вывод «консоли» и файла идёт во временный каталог.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+import httpx
+from fastapi import FastAPI
+
+from backend.logger_config import logger, make_formatter, RequestContextFilter, RequestIdMiddleware, SAMPLED
+from benchmarks.common import percentiles
+
+
+formatter = make_formatter("text")
+app = FastAPI()
+app.add_middleware(RequestIdMiddleware)
+
+
+@app.get("/_bench/playlist/{playlist_id}")
+async def bench_playlist(playlist_id: int):
+    user_id = 42
+    logger.debug("Пользователь %s (id=%s) успешно авторизован", "bench", user_id, extra=SAMPLED)
+    logger.info("Пользователь id=%s запрашивает треки плейлиста id=%s", user_id, playlist_id, extra=SAMPLED)
+    logger.debug("Пользователь id=%s успешно прошёл валидацию владельца для плейлиста id=%s",
+                 user_id, playlist_id, extra=SAMPLED)
+    logger.info("В плейлисте id=%s найдено треков: %s", playlist_id, 25, extra=SAMPLED)
+    return {"id": playlist_id}
+
+
+def sync_handlers(directory: str, level: int, sample_every: int):
+    # Прежняя схема: StreamHandler и RotatingFileHandler пишут прямо из цикла событий
+    console = logging.StreamHandler(open(os.path.join(directory, "console.log"), "a"))
+    file = RotatingFileHandler(os.path.join(directory, "app.log"), maxBytes=10*1024*1024, backupCount=5)
+    for handler in (console, file):
+        handler.setFormatter(formatter)
+        handler.addFilter(RequestContextFilter(sample_every))
+    logger.setLevel(level)
+    return [console, file], None
+
+
+def queued_handlers(directory: str, level: int, sample_every: int):
+    console = logging.StreamHandler(open(os.path.join(directory, "console.log"), "a"))
+    file = RotatingFileHandler(os.path.join(directory, "app.log"), maxBytes=10*1024*1024, backupCount=5)
+    for handler in (console, file):
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(sample_every))
+    listener = QueueListener(log_queue, console, file)
+    listener.start()
+    logger.setLevel(level)
+    return [queue_handler], listener
+
+
+async def drive(client: httpx.AsyncClient, requests: int, concurrency: int):
+    latencies = []
+    pending = iter(range(requests))
+
+    async def worker():
+        for i in pending:
+            start = time.perf_counter()
+            response = await client.get(f"/_bench/playlist/{i}")
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    cpu = time.thread_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return (time.thread_time() - cpu) * 1000 / requests, percentiles(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    configs = [
+        ("логи выключены (WARNING)", queued_handlers, logging.WARNING, 1),
+        ("синхронно, DEBUG, без выборки", sync_handlers, logging.DEBUG, 1),
+        ("очередь, DEBUG, без выборки", queued_handlers, logging.DEBUG, 1),
+        ("очередь, INFO, без выборки", queued_handlers, logging.INFO, 1),
+        ("очередь, INFO, выборка 1/100", queued_handlers, logging.INFO, 100),
+    ]
+    saved = logger.handlers[:], logger.level
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make_handlers, level, sample_every in configs:
+            with tempfile.TemporaryDirectory() as directory:
+                logger.handlers, listener = make_handlers(directory, level, sample_every)
+                await drive(client, min(500, args.requests), args.concurrency)
+                cpu_ms, stats = await drive(client, args.requests, args.concurrency)
+                if listener:
+                    listener.stop()
+                for handler in (*logger.handlers, *(listener.handlers if listener else ())):
+                    handler.close()
+            print(f"{name}: {cpu_ms:.3f} мс CPU цикла на запрос, latency, ms {stats}")
+    logger.handlers, level = saved
+    logger.setLevel(level)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
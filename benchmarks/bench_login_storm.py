@@ -0,0 +1,100 @@
+"""Нагрузочный тест: задержка GET /tracks во время шторма входов.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_login_storm --logins 200 --concurrency 50
+
+Сравниваются два режима: bcrypt прямо в обработчике (как было до пула — цикл событий блокируется
+на каждый хеш) и bcrypt в ограниченном пуле потоков из backend.auth.
+"""
+import argparse
+import asyncio
+import collections
+import time
+
+from benchmarks.common import configure_app_database, percentiles, synthetic_tracks
+
+configure_app_database()
+
+import httpx
+from sqlalchemy import text, insert
+
+from backend import auth
+from backend.main import app
+from backend.database import engine, async_session, Model, UsersOrm, TracksOrm
+
+
+async def seed(tracks: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.create_all)
+        await conn.execute(text("TRUNCATE users, tracks RESTART IDENTITY CASCADE"))
+    async with async_session() as db:
+        db.add(UsersOrm(email="storm@example.com", username="storm", password=auth.get_password_hash("password")))
+        await db.execute(insert(TracksOrm).values([
+            {"title": title, "artists": artists, "tags": tags, "url": url}
+            for title, artists, tags, url in synthetic_tracks(tracks)]))
+        await db.commit()
+
+
+async def run_inline(func, *args):
+    # Поведение до пула: хеш считается прямо в цикле событий
+    return func(*args)
+
+
+async def storm(client: httpx.AsyncClient, logins: int, concurrency: int, statuses: collections.Counter):
+    queue = iter(range(logins))
+
+    async def worker():
+        for _ in queue:
+            response = await client.post("/auth/login", json={"username": "storm", "email": "storm@example.com",
+                                                                "password": "password"})
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/tracks", params={"limit": 20})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def measure(client: httpx.AsyncClient, args) -> tuple[dict, dict, float]:
+    statuses = collections.Counter()
+    stop = asyncio.Event()
+    probes = [asyncio.create_task(probe(client, stop, args.probe_interval)) for _ in range(args.probes)]
+    start = time.perf_counter()
+    await storm(client, args.logins, args.concurrency, statuses)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    latencies = [value for samples in await asyncio.gather(*probes) for value in samples]
+    return percentiles(latencies), dict(statuses), elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probes", type=int, default=4, help="параллельных клиентов GET /tracks")
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    parser.add_argument("--tracks", type=int, default=1000)
+    args = parser.parse_args()
+
+    await seed(args.tracks)
+    print(f"bcrypt rounds={auth.BCRYPT_ROUNDS}, workers={auth.BCRYPT_WORKERS}, max queue={auth.BCRYPT_MAX_QUEUE}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        pooled = auth.run_hashing
+        for name, runner in [("bcrypt в цикле событий", run_inline), ("bcrypt в пуле потоков", pooled)]:
+            auth.run_hashing = runner
+            stats, statuses, elapsed = await measure(client, args)
+            print(f"{name}: GET /tracks latency, ms {stats}; входы {statuses} за {elapsed:.1f} с")
+        auth.run_hashing = pooled
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Бенчмарк накладных расходов /metrics: пропускная способность с MetricsMiddleware и без него.
+
+    python -m benchmarks.bench_metrics --requests 5000 --rounds 15
+
+База данных не нужна: пробный маршрут отдаёт страницу из 20 треков, как GET /tracks, но из памяти —
+так доля записи метрик в общем времени запроса получается наибольшей (оценка сверху). Раунды с метриками
+и без них чередуются, чтобы прогрев и шум распределились поровну; цель — накладные расходы меньше 2%.
+Отдельно меряется сама обёртка MetricsMiddleware вокруг пустого ASGI-приложения: на ней шума нет.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from backend.metrics import MetricsMiddleware, monitor_loop_lag
+from benchmarks.common import synthetic_tracks
+
+
+PAGE = [{"id": i + 1, "title": title, "artists": artists, "tags": tags, "url": url}
+        for i, (title, artists, tags, url) in enumerate(synthetic_tracks(20))]
+
+
+def make_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/tracks/{track_id}")
+    async def bench_tracks(track_id: int):
+        return ORJSONResponse(PAGE)
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def throughput(app: FastAPI, requests: int, concurrency: int) -> float:
+    pending = iter(range(requests))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            for i in pending:
+                (await client.get(f"/tracks/{i}")).raise_for_status()
+
+        # CPU потока цикла событий, а не время по часам: меньше шума от соседних процессов
+        start = time.thread_time()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.thread_time() - start)
+
+
+async def middleware_cost_us(calls: int = 200_000) -> float:
+    class Route:
+        path = "/tracks/{track_id}"
+
+    async def inner(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    elapsed = {}
+    for name, app in (("bare", inner), ("metrics", MetricsMiddleware(inner))):
+        start = time.perf_counter()
+        for _ in range(calls):
+            await app({"type": "http", "method": "GET"}, receive, send)
+        elapsed[name] = (time.perf_counter() - start) / calls * 1e6
+    return elapsed["metrics"] - elapsed["bare"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    apps = {False: make_app(False), True: make_app(True)}
+    results = {False: [], True: []}
+    for with_metrics in (False, True):
+        await throughput(apps[with_metrics], min(2000, args.requests), args.concurrency)
+    for round_number in range(args.rounds):
+        # Порядок внутри раунда тоже чередуется: второй прогон в паре систематически чуть медленнее
+        for with_metrics in ((False, True) if round_number % 2 else (True, False)):
+            lag_monitor = asyncio.create_task(monitor_loop_lag()) if with_metrics else None
+            results[with_metrics].append(await throughput(apps[with_metrics], args.requests, args.concurrency))
+            if lag_monitor:
+                lag_monitor.cancel()
+    without, with_ = statistics.median(results[False]), statistics.median(results[True])
+    cost_us = await middleware_cost_us()
+    print(f"без метрик: {without:,.0f} rps (медиана {args.rounds} раундов)")
+    print(f"с метриками: {with_:,.0f} rps")
+    print(f"накладные расходы по пропускной способности: {(1 - with_ / without) * 100:.2f}%")
+    print(f"MetricsMiddleware: {cost_us:.2f} мкс на запрос, "
+          f"{cost_us / (1e6 / without) * 100:.2f}% времени запроса без метрик")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Бенчмарк экрана «Моя библиотека»: все плейлисты пользователя с числом треков и первыми треками.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_playlist_library --playlists 50
+
+Сравниваются два способа получить одно и то же:
+  * N+1 — GET /playlists и затем GET /playlists/{id}/tracks на каждый плейлист (счётчик и первые треки
+    клиент берёт из полного списка треков);
+  * один запрос — GET /playlists?include=counts&include=tracks&tracks_limit=K.
+Для каждого выводятся задержка экрана целиком и число SQL-запросов (хуки backend.query_stats).
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import configure_app_database, percentiles
+
+configure_app_database()
+
+import httpx
+
+from backend.main import app
+from backend.auth import create_access_token
+from backend.database import engine
+from backend.query_stats import collect_queries
+from benchmarks.seed import seed
+
+
+async def n_plus_one(client: httpx.AsyncClient, headers: dict, tracks_limit: int) -> list[dict]:
+    playlists = (await client.get("/playlists", headers=headers)).json()
+    for playlist in playlists:
+        tracks = (await client.get(f"/playlists/{playlist['id']}/tracks", headers=headers)).json()["tracks"]
+        playlist["track_count"] = len(tracks)
+        playlist["tracks"] = tracks[:tracks_limit]
+    return playlists
+
+
+async def single(client: httpx.AsyncClient, headers: dict, tracks_limit: int) -> list[dict]:
+    params = [("include", "counts"), ("include", "tracks"), ("tracks_limit", tracks_limit)]
+    response = await client.get("/playlists", params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+async def measure(fn, client: httpx.AsyncClient, headers: dict, tracks_limit: int, repeat: int):
+    latencies, queries = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with collect_queries() as stats:
+            await fn(client, headers, tracks_limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries = stats.count
+    return percentiles(latencies), queries
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=50)
+    parser.add_argument("--tracks", type=int, default=20_000)
+    parser.add_argument("--tracks-limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    await seed(engine, users=1, tracks=args.tracks, playlists_per_user=args.playlists, password_hash="-")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            expected = await n_plus_one(client, headers, args.tracks_limit)
+            assert await single(client, headers, args.tracks_limit) == expected, "ответы не совпадают"
+            for name, fn in (("N+1", n_plus_one), ("include", single)):
+                latency, queries = await measure(fn, client, headers, args.tracks_limit, args.repeat)
+                print(f"{name:8} плейлистов {len(expected)}, SQL-запросов {queries:4}, мс: {latency}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
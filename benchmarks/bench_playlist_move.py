@@ -0,0 +1,90 @@
+"""Бенчмарк перемещения трека в длинном плейлисте (POST /playlists/{id}/tracks/{track_id}/move).
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_playlist_move --size 10000
+
+Три замера на плейлисте из --size треков:
+  * случайные перемещения — трек после случайного трека, меняется одна строка;
+  * худший случай — треки раз за разом ставятся в одно и то же место, промежуток позиций делится пополам,
+    пока не сработает фоновая (или, если не успела, синхронная) перенумерация;
+  * полная перенумерация плейлиста (backend.positions.rebalance) — столько стоил бы каждый перенос
+    при позициях 1, 2, 3, ... без промежутков.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import configure_app_database, percentiles
+
+configure_app_database()
+
+import httpx
+from sqlalchemy import insert
+
+from backend.main import app
+from backend.auth import create_access_token
+from backend.database import engine, async_session, PlaylistsOrm, PlaylistTracksOrm
+from backend.positions import POSITION_GAP, rebalance
+from backend.query_stats import collect_queries
+from benchmarks.seed import seed, insert_chunked
+
+
+async def timed_moves(client: httpx.AsyncClient, headers: dict, moves: list[tuple[int, int]]):
+    latencies, queries = [], 0
+    for track_id, after in moves:
+        start = time.perf_counter()
+        with collect_queries() as stats:
+            response = await client.post(f"/playlists/1/tracks/{track_id}/move", params={"after": after},
+                                         headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, stats.count)
+    return percentiles(latencies), queries
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--moves", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    await seed(engine, users=1, tracks=args.size, playlists_per_user=0, password_hash="-", seed=args.seed)
+    async with engine.begin() as conn:
+        await conn.execute(insert(PlaylistsOrm).values(id=1, name="bench", user_id=1))
+        await insert_chunked(conn, PlaylistTracksOrm, [
+            {"playlist_id": 1, "track_id": track_id, "position": track_id * POSITION_GAP}
+            for track_id in range(1, args.size + 1)])
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            moves = []
+            for _ in range(args.moves):
+                track_id, after = rng.sample(range(1, args.size + 1), 2)
+                moves.append((track_id, after))
+            latency, queries = await timed_moves(client, headers, moves)
+            print(f"случайные перемещения: SQL-запросов до {queries}, мс: {latency}")
+
+            anchor = rng.randint(1, args.size)
+            crowded = [(track_id, anchor) for track_id in rng.sample(range(1, args.size + 1), args.moves + 1)
+                       if track_id != anchor][:args.moves]
+            latency, queries = await timed_moves(client, headers, crowded)
+            print(f"в одно место подряд: SQL-запросов до {queries}, мс: {latency}")
+
+        samples = []
+        for _ in range(20):
+            async with async_session() as db:
+                start = time.perf_counter()
+                await rebalance(db, 1)
+                await db.commit()
+                samples.append((time.perf_counter() - start) * 1000)
+        print(f"полная перенумерация {args.size} строк, мс: {percentiles(samples)}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Бенчмарк пула соединений: пропускная способность и ожидание соединения в зависимости от размера пула.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_pool --pool-sizes 2 5 10 20 40 --concurrency 64
+
+Подходит и SQLite-файл (sqlite+aiosqlite:///bench.db) как локальная замена Postgres. Каждый воркер берёт сессию
+из пула, читает страницу каталога (как GET /tracks) и возвращает соединение; max_overflow=0, чтобы
+размер пула был жёстким пределом.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend.database import create_engine_from_url, Model, TracksOrm
+from benchmarks.common import bench_database_url, synthetic_tracks, percentiles
+
+
+async def seed(url: str, count: int):
+    engine = create_engine_from_url(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.drop_all)
+        await conn.run_sync(Model.metadata.create_all)
+        rows = [{"title": title, "artists": artists, "tags": tags, "url": track_url}
+                for title, artists, tags, track_url in synthetic_tracks(count)]
+        for start in range(0, len(rows), 1000):
+            await conn.execute(insert(TracksOrm), rows[start:start + 1000])
+    await engine.dispose()
+
+
+async def run(url: str, pool_size: int, concurrency: int, requests: int, tracks: int):
+    engine = create_engine_from_url(url, pool_size=pool_size, max_overflow=0)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    rng = random.Random(pool_size)
+    latencies = []
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            async with session_factory() as db:
+                result = await db.execute(select(TracksOrm.id, TracksOrm.title, TracksOrm.artists,
+                                                 TracksOrm.tags, TracksOrm.url)
+                                          .where(TracksOrm.id > rng.randrange(tracks))
+                                          .order_by(TracksOrm.id)
+                                          .limit(20))
+                result.all()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = engine.pool.stats
+    print(f"пул {pool_size:>3}: {requests / elapsed:,.0f} запросов/с, latency, ms {percentiles(latencies)}, "
+          f"ожидание соединения: среднее {stats.wait_seconds / stats.checkouts * 1000:.3f} мс, "
+          f"макс {stats.max_wait_seconds * 1000:.1f} мс, таймаутов {stats.timeouts}")
+    await engine.dispose()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[2, 5, 10, 20, 40])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    url = bench_database_url()
+    if not args.skip_seed:
+        await seed(url, args.tracks)
+    for pool_size in args.pool_sizes:
+        await run(url, pool_size, args.concurrency, args.requests, args.tracks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Микробенчмарк сериализации списков треков: CPU на ответ для 100/1000/10000 треков.
+
+    python -m benchmarks.bench_serialization --sizes 100 1000 10000
+
+База данных не нужна. Сравниваются:
+- прежний путь: ORM-объекты → Track.model_validate на каждую строку → повторная валидация и сериализация
+  через response_model (serialize_response FastAPI) → JSONResponse;
+- TypeAdapter(list[Track]): одна пакетная валидация строк и dump_json;
+- текущий путь: строки-словари из выборки колонок сразу в ORJSONResponse.
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+
+from backend.database import TracksOrm
+from backend.models import Track
+from benchmarks.common import synthetic_tracks
+
+
+response_field = create_model_field(name="response", type_=List[Track], mode="serialization")
+tracks_adapter = TypeAdapter(list[Track])
+
+
+async def previous_path(orm_tracks: list[TracksOrm], rows: list[dict]) -> bytes:
+    content = [Track.model_validate(t) for t in orm_tracks]
+    serialized = await serialize_response(field=response_field, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def type_adapter_path(orm_tracks: list[TracksOrm], rows: list[dict]) -> bytes:
+    return tracks_adapter.dump_json(tracks_adapter.validate_python(rows))
+
+
+async def orjson_rows_path(orm_tracks: list[TracksOrm], rows: list[dict]) -> bytes:
+    return ORJSONResponse(rows).body
+
+
+async def cpu_ms(path, orm_tracks, rows, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        await path(orm_tracks, rows)
+    return (time.process_time() - start) * 1000 / repeat
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10_000])
+    parser.add_argument("--budget-ms", type=float, default=2000, help="примерное CPU-время на каждый замер")
+    args = parser.parse_args()
+
+    paths = [("model_validate + response_model", previous_path),
+             ("TypeAdapter(list[Track])", type_adapter_path),
+             ("строки + ORJSONResponse", orjson_rows_path)]
+    for size in args.sizes:
+        rows = [{"id": i + 1, "title": title, "artists": artists, "tags": tags, "url": url}
+                for i, (title, artists, tags, url) in enumerate(synthetic_tracks(size))]
+        orm_tracks = [TracksOrm(**row) for row in rows]
+        repeat = max(3, int(args.budget_ms / max(0.01, await cpu_ms(previous_path, orm_tracks, rows, 1))))
+        print(f"\n=== {size} треков, повторов {repeat}")
+        baseline = None
+        for name, path in paths:
+            assert (await path(orm_tracks, rows)).count(b'"id"') == size
+            elapsed = await cpu_ms(path, orm_tracks, rows, repeat)
+            baseline = baseline or elapsed
+            print(f"{name}: {elapsed:.3f} мс CPU на ответ, в {baseline / elapsed:.1f} раза быстрее прежнего пути")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
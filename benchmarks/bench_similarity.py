@@ -0,0 +1,70 @@
+"""Бенчмарк GET /tracks/{track_id}/similar: полнота (recall@k) и задержка LSH против точного поиска.
+
+    python -m benchmarks.bench_similarity --sizes 100000 1000000 --configs 12x10 10x14 16x8
+
+База данных не нужна: векторы строятся из синтетического каталога тем же encode(), что и в сервисе.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.similarity import SimilarityIndex, encode
+from benchmarks.common import synthetic_tracks, percentiles
+
+
+def exact_top(vectors: np.ndarray, query: np.ndarray, k: int, exclude: int) -> np.ndarray:
+    scores = vectors @ query
+    scores[exclude] = -np.inf
+    top = np.argpartition(-scores, k)[:k]
+    return scores[top]
+
+
+def run(size: int, configs: list[tuple[int, int]], queries: int, k: int):
+    started = time.perf_counter()
+    vectors = np.array([encode(tags, artists) for _, artists, tags, _ in synthetic_tracks(size)], dtype=np.float32)
+    ids = np.arange(1, size + 1, dtype=np.int64)
+    print(f"\n=== {size} треков, векторы {vectors.nbytes / 2**20:.0f} MiB, "
+          f"подготовка {time.perf_counter() - started:.1f} с")
+
+    sample = np.random.default_rng(7).choice(size, queries, replace=False)
+    exact_ms = []
+    thresholds = []
+    for row in sample:
+        start = time.perf_counter()
+        top_scores = exact_top(vectors, vectors[row], k, row)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        thresholds.append(top_scores.min() - 1e-6)
+    print(f"точный поиск: latency, ms {percentiles(exact_ms)}")
+
+    for tables, bits in configs:
+        index = SimilarityIndex(tables, bits)
+        start = time.perf_counter()
+        index.build(ids, vectors)
+        build_s = time.perf_counter() - start
+        lsh_ms = []
+        recall = []
+        for row, threshold in zip(sample, thresholds):
+            start = time.perf_counter()
+            found = index.query(vectors[row], k, exclude=int(ids[row]))
+            lsh_ms.append((time.perf_counter() - start) * 1000)
+            recall.append(min(k, sum(score >= threshold for _, score in found)) / k)
+        print(f"LSH {tables} таблиц x {bits} бит: сборка {build_s:.1f} с, recall@{k}={np.mean(recall):.3f}, "
+              f"latency, ms {percentiles(lsh_ms)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--configs", nargs="+", default=["12x10", "10x14", "16x8"],
+                        help="конфигурации LSH в виде <таблиц>x<бит>")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    configs = [tuple(int(part) for part in config.split("x")) for config in args.configs]
+    for size in args.sizes:
+        run(size, configs, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
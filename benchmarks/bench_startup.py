@@ -0,0 +1,145 @@
+"""Время старта: импорт приложения (python -X importtime) и время до первого ответа на запрос.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_startup --repeat 5 --save startup.json
+    ... внести изменение ...
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_startup --repeat 5 --compare startup.json
+
+Импорт меряется в отдельном интерпретаторе: время импорта backend.main и создания приложения, разложенное
+по пакетам верхнего уровня (собственное время модулей, без вложенных). Время до первого ответа — от запуска
+процесса до первого 200 на GET /tracks?limit=1: для uvicorn backend.main:app и для backend.serve (fork
+воркеров после предзагрузки). База заполняется benchmarks.seed один раз перед замерами.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import statistics
+import tempfile
+import subprocess
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import configure_app_database
+
+configure_app_database()
+os.environ.setdefault("LOG_SINKS", "")
+# backend.serve с несколькими воркерами отклоняет запуск без общего хранилища версий ETag
+os.environ.setdefault("VERSION_STORE_URL", f"sqlite:///{tempfile.gettempdir()}/bench_startup_versions.db")
+
+
+def import_profile() -> tuple[float, Counter]:
+    """(общее время, мс; собственное время модулей по пакетам верхнего уровня, мс)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main; backend.main.app"],
+                            capture_output=True, text=True, check=True)
+    total, by_package = 0.0, Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1000
+        # Вложенные импорты сдвинуты вправо; время верхнего уровня уже включает их
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us) / 1000
+    return total, by_package
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(command: list[str], port: int, timeout: float) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise SystemExit(f"Процесс {' '.join(command)} завершился с кодом {process.returncode}")
+                try:
+                    if client.get("/tracks", params={"limit": 1}).status_code == 200:
+                        return (time.perf_counter() - started) * 1000
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        raise SystemExit(f"Нет ответа за {timeout} с: {' '.join(command)}")
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def prepare(users: int, tracks: int):
+    from backend.auth import get_password_hash
+    from backend.database import engine, dispose_engines
+    from benchmarks.seed import seed, BENCH_PASSWORD
+    try:
+        await seed(engine, users, tracks, 1, get_password_hash(BENCH_PASSWORD))
+    finally:
+        await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tracks", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2, help="воркеров backend.serve")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--save", help="Сохранить результаты как базовые в JSON")
+    parser.add_argument("--compare", help="Сравнить с базовыми результатами из JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    asyncio.run(prepare(args.users, args.tracks))
+
+    imports = [import_profile() for _ in range(args.repeat)]
+    import_ms = statistics.median(total for total, _ in imports)
+    packages = Counter()
+    for _, by_package in imports:
+        packages.update(by_package)
+    print(f"импорт backend.main и create_app(): медиана {import_ms:.1f} мс")
+    for name, ms in packages.most_common(10):
+        print(f"    {name:<24} {ms / args.repeat:8.1f} мс")
+
+    commands = {
+        "uvicorn": lambda port: [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port)],
+        "serve": lambda port: [sys.executable, "-m", "backend.serve", "--port", str(port),
+                               "--workers", str(args.workers)],
+    }
+    report = {"import_ms": round(import_ms, 1)}
+    for name, command in commands.items():
+        samples = []
+        for _ in range(args.repeat):
+            port = free_port()
+            samples.append(time_to_first_request(command(port), port, args.timeout))
+        report[f"{name}_first_request_ms"] = round(statistics.median(samples), 1)
+        print(f"{name}: до первого ответа медиана {statistics.median(samples):.1f} мс, "
+              f"мин {min(samples):.1f} мс, макс {max(samples):.1f} мс")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Базовые результаты сохранены в {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = [f"{key}: {baseline[key]} → {value} мс" for key, value in report.items()
+                       if key in baseline and value > baseline[key] * (1 + args.threshold / 100)]
+        if regressions:
+            print(f"Регрессии больше {args.threshold}%: {regressions}")
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Бенчмарк GET /tracks/search: план запроса и задержка на синтетическом каталоге.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_tag_search --tracks 1000000
+
+Каждый сценарий прогоняется дважды: с GIN-индексом ix_tracks_tags и с отключёнными
+индексными сканами (эквивалент каталога без миграции c15da513637c).
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from backend.database import Model
+from backend.router import search_query
+from benchmarks.common import bench_engine, synthetic_tracks, timed, percentiles
+
+
+SCENARIOS = [
+    ("популярный тег", ["tag0"], "any"),
+    ("два тега, any", ["tag3", "tag40"], "any"),
+    ("два тега, all", ["tag3", "tag40"], "all"),
+    ("редкий тег", ["tag1900"], "any"),
+]
+
+
+async def seed(engine, count: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.create_all)
+        await conn.execute(text("TRUNCATE tracks RESTART IDENTITY CASCADE"))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "tracks", records=synthetic_tracks(count), columns=["title", "artists", "tags", "url"])
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE tracks"))
+
+
+async def run_scenario(raw, dialect, name: str, tags: list[str], mode: str, repeat: int, use_index: bool):
+    compiled = search_query(tags, mode, None, 10, 0).compile(dialect=dialect)
+    sql = str(compiled)
+    params = [compiled.params[key] for key in compiled.positiontup]
+    await raw.execute(f"SET enable_bitmapscan = {'on' if use_index else 'off'}")
+    await raw.execute(f"SET enable_indexscan = {'on' if use_index else 'off'}")
+
+    plan = await raw.fetch("EXPLAIN (ANALYZE, BUFFERS) " + sql, *params)
+    stats = percentiles(await timed(lambda: raw.fetch(sql, *params), repeat))
+    print(f"\n=== {name} ({'GIN' if use_index else 'без индекса'}) tags={tags} mode={mode}")
+    print("\n".join(row[0] for row in plan))
+    print(f"latency, ms: {stats}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    engine = bench_engine()
+    if not args.skip_seed:
+        await seed(engine, args.tracks)
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        for name, tags, mode in SCENARIOS:
+            for use_index in (True, False):
+                await run_scenario(raw, engine.dialect, name, tags, mode, args.repeat, use_index)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Проверка очереди ConcurrencyLimiter: отказы и отмены не должны терять слоты.
+
+    python -m benchmarks.check_admission
+
+База данных не нужна. Сценарии: отмена ожидающего запроса (клиент отключился), отмена в момент выдачи
+слота, таймаут бюджета ожидания. После каждого все слоты должны вернуться (in_flight == 0, очередь пуста),
+а новый acquire() — пройти сразу. При нарушении скрипт завершается с кодом 1.
+"""
+import os
+import sys
+import asyncio
+
+os.environ.setdefault("SECRET_KEY", "check-secret")
+
+from backend.admission import ConcurrencyLimiter, Overloaded
+
+
+def drained(limiter: ConcurrencyLimiter) -> bool:
+    return limiter.in_flight == 0 and not limiter.waiters
+
+
+async def cancel_queued() -> bool:
+    limiter = ConcurrencyLimiter(limit=1, budget=10)
+    await limiter.acquire()
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    queued.cancel()
+    await asyncio.gather(queued, return_exceptions=True)
+    limiter.release(0.01)
+    if not drained(limiter):
+        return False
+    await asyncio.wait_for(limiter.acquire(), 1)
+    limiter.release(0.01)
+    return drained(limiter)
+
+
+async def cancel_when_granted() -> bool:
+    limiter = ConcurrencyLimiter(limit=1, budget=10)
+    await limiter.acquire()
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    # Слот передан ожидающему, но его задача отменена раньше, чем успела проснуться
+    limiter.release(0.01)
+    queued.cancel()
+    result, = await asyncio.gather(queued, return_exceptions=True)
+    if not isinstance(result, BaseException):
+        # wait_for успел вернуть выданный слот вместо отмены: его освобождает вызывающий, как после запроса
+        limiter.release(0.01)
+    return drained(limiter)
+
+
+async def timeout_queued() -> bool:
+    limiter = ConcurrencyLimiter(limit=1, budget=0.05)
+    await limiter.acquire()
+    try:
+        await limiter.acquire()
+        return False
+    except Overloaded:
+        pass
+    limiter.release(0.01)
+    return drained(limiter)
+
+
+async def main():
+    failed = 0
+    for check in (cancel_queued, cancel_when_granted, timeout_queued):
+        try:
+            ok = await asyncio.wait_for(check(), 5)
+        except asyncio.TimeoutError:
+            ok = False
+        failed += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {check.__name__}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
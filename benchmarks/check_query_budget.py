@@ -0,0 +1,91 @@
+"""Проверка бюджета SQL-запросов: сколько statement'ов выполняет каждый эндпоинт.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.check_query_budget
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m pytest tests
+
+Запросы считаются хуками backend.query_stats при холодном кеше пользователей. Если эндпоинт превысил
+бюджет, скрипт завершается с кодом 1 — так регрессии вроде лишнего SELECT перед INSERT видны сразу.
+Нужен Postgres: на SQLite часть запросов роутов не выполняется.
+"""
+import asyncio
+import os
+import sys
+
+from benchmarks.common import configure_app_database
+
+configure_app_database()
+os.environ["ADMIN_LIST"] = "budget-admin@example.com"
+
+import httpx
+
+from backend.main import app
+from backend.database import engine, Model
+from backend.query_stats import collect_queries
+from backend.user_cache import user_cache
+
+
+# (метод, путь, тело, ожидаемый статус, максимум запросов)
+BUDGET = [
+    ("POST", "/auth/register", {"email": "budget-admin@example.com", "username": "admin", "password": "p"}, 201, 1),
+    ("POST", "/auth/register", {"email": "budget-admin@example.com", "username": "admin", "password": "p"}, 400, 1),
+    ("POST", "/auth/login", {"email": "budget-admin@example.com", "username": None, "password": "p"}, 200, 1),
+    ("POST", "/tracks", {"title": "t", "artists": ["a"], "tags": ["rock"], "url": "u"}, 200, 2),
+    ("POST", "/tracks", {"title": "t2", "artists": ["b"], "tags": ["pop"], "url": "u"}, 200, 2),
+    ("GET", "/tracks?limit=10", None, 200, 1),
+    ("GET", "/tracks/search?tags=rock", None, 200, 1),
+    ("GET", "/autocomplete?prefix=t", None, 200, 0),
+    ("POST", "/playlists", {"name": "p"}, 200, 2),
+    ("GET", "/playlists", None, 200, 1),
+    ("GET", "/playlists?include=counts&include=tracks", None, 200, 1),
+    ("POST", "/playlists/1/tracks/1", None, 200, 1),
+    ("POST", "/playlists/1/tracks/1", None, 400, 3),
+    ("PATCH", "/playlists/1/tracks", {"add": [2], "remove": [1]}, 200, 3),
+    ("POST", "/playlists/1/tracks/2/move", None, 200, 5),
+    ("GET", "/playlists/1/tracks", None, 200, 2),
+    ("DELETE", "/playlists/1/tracks/2", None, 200, 1),
+    ("DELETE", "/playlists/1", None, 200, 1),
+    ("DELETE", "/auth/me", None, 200, 2),
+]
+
+
+async def check_budget() -> list[str]:
+    """Прогоняет BUDGET на пустой схеме и возвращает строки отчёта эндпоинтов, вышедших за бюджет.
+
+    Вызывается из main() и из tests/test_query_budget.py.
+    """
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("check_query_budget работает только с Postgres (BENCH_DATABASE_URL=postgresql+asyncpg://...): "
+                         "часть запросов роутов на SQLite не выполняется")
+
+    failures = []
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Model.metadata.drop_all)
+            await conn.run_sync(Model.metadata.create_all)
+
+        headers = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://budget") as client:
+            for method, path, body, expected_status, budget in BUDGET:
+                user_cache.clear()
+                with collect_queries() as stats:
+                    response = await client.request(method, path, json=body, headers=headers)
+                if path == "/auth/login" and response.status_code == 200:
+                    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+                ok = response.status_code == expected_status and stats.count <= budget
+                line = (f"{method} {path}: статус {response.status_code} (ожидался {expected_status}), "
+                        f"запросов {stats.count} из {budget}, {stats.seconds * 1000:.1f} мс в базе данных")
+                if not ok:
+                    failures.append(line)
+                print(f"{'OK  ' if ok else 'FAIL'} {line}")
+    finally:
+        await engine.dispose()
+    return failures
+
+
+async def main():
+    sys.exit(1 if await check_budget() else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
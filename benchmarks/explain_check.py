@@ -0,0 +1,161 @@
+"""Регрессионная проверка планов запросов: EXPLAIN каждого SQL-запроса, который выполняют роуты.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.explain_check --users 5000 --tracks 50000
+
+База заполняется benchmarks.seed (после заполнения выполняется ANALYZE), затем запросы к роутам идут в
+приложение через httpx, а каждый выполненный ими statement перехватывается и повторяется как
+EXPLAIN (FORMAT JSON) с теми же параметрами. Seq Scan по таблице в плане — значит, нужного индекса нет
+или запрос перестал в него попадать: скрипт печатает план и завершается с кодом 1. Таблицы должны быть
+заметно больше нескольких страниц, иначе планировщик честно выберет Seq Scan — поэтому размеры по умолчанию
+крупные. Нужен Postgres: на SQLite EXPLAIN другой, а половина запросов не выполняется.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from dataclasses import dataclass
+
+from benchmarks.common import configure_app_database
+
+configure_app_database()
+os.environ.setdefault("ADMIN_LIST", "user1@bench.local")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LOG_SINKS", "")
+
+import httpx
+from sqlalchemy import event
+
+from backend.main import app
+from backend.auth import create_access_token, get_password_hash
+from backend.database import engine
+from backend.user_cache import user_cache
+from backend.pagination import encode_cursor
+from benchmarks.seed import seed, Dataset, BENCH_PASSWORD
+
+# Операторы, которые планирует Postgres; служебные SET/SHOW/BEGIN пропускаются
+EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+@dataclass
+class Check:
+    name: str
+    method: str
+    path: str
+    user_id: int | None = None
+    json: dict | None = None
+    # Таблицы, полный просмотр которых в этом запросе ожидаем (причина — в комментарии у проверки)
+    allow_seq_scan: tuple[str, ...] = ()
+
+
+def checks(dataset: Dataset) -> list[Check]:
+    by_user: dict[int, list[int]] = {}
+    for playlist_id, (user_id, _) in dataset.playlists.items():
+        by_user.setdefault(user_id, []).append(playlist_id)
+    # Владелец хотя бы двух плейлистов: один изменяется проверками, другой удаляется
+    user_id, (playlist_id, doomed_playlist_id, *_) = next(item for item in by_user.items() if len(item[1]) >= 2)
+    track_ids = dataset.playlists[playlist_id][1]
+    outside = next(track_id for track_id in range(1, dataset.tracks + 1) if track_id not in set(track_ids))
+    email = dataset.user_email(user_id)
+    return [
+        Check("tracks_offset", "GET", "/tracks?limit=20&offset=100"),
+        Check("tracks_cursor", "GET", f"/tracks?limit=20&cursor={encode_cursor(100)}"),
+        Check("tracks_search", "GET", "/tracks/search?tags=tag300&tags=tag301&limit=20"),
+        Check("tracks_search_text", "GET", "/tracks/search?q=trakc%2012&limit=20"),
+        Check("tracks_similar", "GET", f"/tracks/{track_ids[0]}/similar?k=10"),
+        Check("tracks_export", "GET", "/tracks/export?format=ndjson", allow_seq_scan=("tracks",)),
+        Check("track_add", "POST", "/tracks", 1, {"title": "explain", "artists": ["artist0"], "tags": ["tag0"],
+                                                  "url": "https://example.com/explain"}),
+        # Тело — одна строка NDJSON; dedupe ищет уже загруженные треки по ix_tracks_title
+        Check("tracks_bulk_dedupe", "POST", "/tracks/bulk?format=ndjson&method=insert&dedupe=true", 1,
+              {"title": "track 12", "artists": ["artist0"], "tags": ["tag0"], "url": "https://example.com/bulk"}),
+        Check("auth_register", "POST", "/auth/register", None, {"email": "explain@bench.local", "username": "explain",
+                                                                 "password": BENCH_PASSWORD}),
+        Check("auth_login", "POST", "/auth/login", None, {"email": email, "username": None, "password": BENCH_PASSWORD}),
+        Check("playlist_create", "POST", "/playlists", user_id, {"name": "explain"}),
+        Check("playlists_list", "GET", "/playlists", user_id),
+        Check("playlists_library", "GET", "/playlists?include=counts&include=tracks&tracks_limit=10", user_id),
+        Check("playlist_tracks", "GET", f"/playlists/{playlist_id}/tracks", user_id),
+        Check("playlist_add_track", "POST", f"/playlists/{playlist_id}/tracks/{outside}", user_id),
+        Check("playlist_move", "POST", f"/playlists/{playlist_id}/tracks/{outside}/move?after={track_ids[0]}",
+              user_id),
+        Check("playlist_patch", "PATCH", f"/playlists/{playlist_id}/tracks", user_id,
+              {"add": [outside + 1, outside + 2], "remove": [track_ids[1]]}),
+        Check("playlist_delete_track", "DELETE", f"/playlists/{playlist_id}/tracks/{track_ids[2]}", user_id),
+        # Кандидаты ранжируются по весу тегов среди всех треков с общими тегами: для частых тегов это
+        # большая доля tracks, и планировщик вправе читать её подряд вместо bitmap-скана по GIN
+        Check("playlist_generate", "POST", "/playlists/generate", user_id,
+              {"name": "explain", "length": 50, "seed_tags": ["tag300"], "seed_track_ids": [track_ids[0]]},
+              allow_seq_scan=("tracks",)),
+        Check("playlist_delete", "DELETE", f"/playlists/{doomed_playlist_id}", user_id),
+        Check("auth_delete_me", "DELETE", "/auth/me", dataset.users),
+    ]
+
+
+def seq_scans(node: dict) -> list[str]:
+    found = [node["Relation Name"]] if node.get("Node Type") == "Seq Scan" else []
+    for child in node.get("Plans", ()):
+        found += seq_scans(child)
+    return found
+
+
+async def explain(statement: str, parameters) -> dict:
+    async with engine.connect() as conn:
+        value = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)).scalar()
+        await conn.rollback()
+    return (json.loads(value) if isinstance(value, str) else value)[0]["Plan"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--tracks", type=int, default=50_000)
+    parser.add_argument("--playlists-per-user", type=float, default=2)
+    parser.add_argument("--verbose", action="store_true", help="Печатать планы всех запросов, а не только плохие")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("explain_check работает только с Postgres (BENCH_DATABASE_URL=postgresql+asyncpg://...)")
+
+    captured: list[tuple[str, object]] = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().lower().startswith(EXPLAINABLE):
+            captured.append((statement, parameters))
+
+    failed = 0
+    try:
+        dataset = await seed(engine, args.users, args.tracks, args.playlists_per_user,
+                             get_password_hash(BENCH_PASSWORD))
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://explain") as client:
+            for check in checks(dataset):
+                user_cache.clear()
+                headers = {}
+                if check.user_id is not None:
+                    headers["Authorization"] = f"Bearer {create_access_token({'sub': str(check.user_id)})}"
+                captured.clear()
+                response = await client.request(check.method, check.path, json=check.json, headers=headers)
+                # EXPLAIN сам не перехватывается: он не начинается ни с одного из EXPLAINABLE
+                statements = list(captured)
+                for statement, parameters in statements:
+                    plan = await explain(statement, parameters)
+                    bad = [table for table in seq_scans(plan) if table not in check.allow_seq_scan]
+                    if bad:
+                        failed += 1
+                        print(f"FAIL {check.name}: Seq Scan по {', '.join(bad)}\n     {' '.join(statement.split())}")
+                        print(json.dumps(plan, ensure_ascii=False, indent=2))
+                    elif args.verbose:
+                        print(f"     {plan['Node Type']}, стоимость {plan['Total Cost']}: "
+                              f"{' '.join(statement.split())[:200]}")
+                failed += response.status_code >= 500
+                print(f"{'OK  ' if response.status_code < 500 else 'FAIL'} {check.name}: {check.method} {check.path} "
+                      f"→ {response.status_code}, планов проверено: {len(statements)}")
+    finally:
+        await engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""Синтетический каталог для бенчмарков: пользователи, треки с Zipf-распределением тегов и исполнителей,
+плейлисты разного размера.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.seed --users 1000 --tracks 100000
+
+Одинаковые параметры и --seed дают одинаковые данные. Таблицы пересоздаются.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+
+from sqlalchemy import insert
+
+from backend.database import create_engine_from_url, Model, TracksOrm, UsersOrm, PlaylistsOrm, PlaylistTracksOrm
+from backend.positions import POSITION_GAP
+from benchmarks.common import bench_database_url, synthetic_tracks
+
+
+INSERT_CHUNK = 1000
+# Размеры плейлистов и их доли: в основном короткие, изредка очень длинные
+PLAYLIST_SIZES = (5, 20, 50, 200, 1000)
+PLAYLIST_SIZE_WEIGHTS = (30, 35, 20, 12, 3)
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class Dataset:
+    users: int
+    tracks: int
+    # playlist_id → (user_id, track_ids)
+    playlists: dict[int, tuple[int, list[int]]] = field(default_factory=dict)
+    # Теги, которые действительно есть у треков, от частых к редким
+    tags: list[str] = field(default_factory=list)
+
+    def user_email(self, user_id: int) -> str:
+        return f"user{user_id}@bench.local"
+
+
+async def insert_chunked(conn, table, rows: list[dict]):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        await conn.execute(insert(table), rows[start:start + INSERT_CHUNK])
+
+
+async def seed(engine, users: int, tracks: int, playlists_per_user: float, password_hash: str,
+               seed: int = 42) -> Dataset:
+    rng = random.Random(seed)
+    dataset = Dataset(users=users, tracks=tracks)
+    async with engine.begin() as conn:
+        await conn.run_sync(Model.metadata.drop_all)
+        await conn.run_sync(Model.metadata.create_all)
+        await insert_chunked(conn, UsersOrm, [
+            {"id": user_id, "email": dataset.user_email(user_id), "username": f"user{user_id}",
+             "password": password_hash}
+            for user_id in range(1, users + 1)])
+        rows = [{"id": track_id, "title": title, "artists": artists, "tags": tags, "url": url}
+                for track_id, (title, artists, tags, url) in enumerate(synthetic_tracks(tracks, seed), start=1)]
+        dataset.tags = [tag for tag, _ in Counter(tag for row in rows for tag in row["tags"]).most_common()]
+        await insert_chunked(conn, TracksOrm, rows)
+
+        playlists, associations = [], []
+        for playlist_id in range(1, int(users * playlists_per_user) + 1):
+            user_id = rng.randint(1, users)
+            size = min(tracks, rng.choices(PLAYLIST_SIZES, PLAYLIST_SIZE_WEIGHTS)[0])
+            track_ids = rng.sample(range(1, tracks + 1), size)
+            dataset.playlists[playlist_id] = (user_id, track_ids)
+            playlists.append({"id": playlist_id, "name": f"playlist {playlist_id}", "user_id": user_id})
+            associations.extend({"playlist_id": playlist_id, "track_id": track_id, "position": i * POSITION_GAP}
+                                for i, track_id in enumerate(track_ids, start=1))
+        await insert_chunked(conn, PlaylistsOrm, playlists)
+        await insert_chunked(conn, PlaylistTracksOrm, associations)
+
+        if conn.dialect.name == "postgresql":
+            # id заданы явно, поэтому последовательности нужно сдвинуть за них
+            for table in ("users", "tracks", "playlists"):
+                await conn.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                           f"(SELECT coalesce(max(id), 1) FROM {table}))")
+            await conn.exec_driver_sql("ANALYZE")
+    return dataset
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--playlists-per-user", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from backend.auth import get_password_hash
+    engine = create_engine_from_url(bench_database_url())
+    dataset = await seed(engine, args.users, args.tracks, args.playlists_per_user,
+                         get_password_hash(BENCH_PASSWORD), args.seed)
+    associations = sum(len(track_ids) for _, track_ids in dataset.playlists.values())
+    print(f"Пользователей: {dataset.users}, треков: {dataset.tracks}, плейлистов: {len(dataset.playlists)}, "
+          f"треков в плейлистах: {associations}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,362 @@
+"""Нагрузочный прогон всех маршрутов router.py, tags_router.py и auth_router.py внутри процесса (httpx ASGITransport).
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.suite --users 200 --tracks 20000 --save base.json
+    ... внести изменение ...
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.suite --users 200 --tracks 20000 --compare base.json
+
+Перед прогоном база пересоздаётся и заполняется benchmarks.seed с тем же --seed, поэтому результаты разных запусков
+сравнимы. Без сети подходит SQLite-файл (sqlite+aiosqlite:////tmp/bench.db); сценарии, которым нужен Postgres
+(поиск по массивам, COPY, DELETE USING), на нём пропускаются. Сравнивать имеет смысл только
+прогоны на одной базе и с одинаковыми параметрами — они сохраняются в meta отчёта.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from benchmarks.common import configure_app_database, percentiles
+
+configure_app_database()
+BENCH_ADMIN = "user1@bench.local"
+os.environ.setdefault("ADMIN_LIST", BENCH_ADMIN)
+# Вход и регистрация упираются в bcrypt; стоимость по умолчанию снижена, для замера bcrypt задайте BCRYPT_ROUNDS явно
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LOG_SINKS", "")
+snapshots = tempfile.mkdtemp(prefix="bench-suite-")
+os.environ["TAG_GRAPH_PATH"] = os.path.join(snapshots, "tag_graph.npz")
+os.environ["SIMILARITY_INDEX_PATH"] = os.path.join(snapshots, "similarity_index")
+os.environ["CATALOG_SNAPSHOT_PATH"] = os.path.join(snapshots, "catalog")
+
+import httpx
+
+from backend.main import app
+from backend.auth import create_access_token, get_password_hash, BCRYPT_ROUNDS
+from backend.database import engine
+from backend.pagination import encode_cursor
+from backend.tag_graph import init_tag_graph
+from backend.similarity import init_similarity_index
+from backend.autocomplete import init_autocomplete
+from backend.catalog import CATALOG_REPLICA, init_catalog
+from benchmarks.seed import seed, Dataset, BENCH_PASSWORD
+from benchmarks.common import synthetic_tracks
+
+
+@dataclass
+class Context:
+    dataset: Dataset
+    tokens: dict[int, str]
+    rng: random.Random
+    # Пары (playlist_id, track_id) и плейлисты, которые сценарии удаления расходуют по одной
+    removable_pairs: list[tuple[int, int]]
+    removable_playlists: list[int]
+
+    def auth(self, user_id: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    def random_user(self) -> int:
+        return self.rng.randint(1, self.dataset.users)
+
+    def random_track(self) -> int:
+        return self.rng.randint(1, self.dataset.tracks)
+
+    def random_playlist(self) -> tuple[int, int]:
+        playlist_id = self.rng.randint(1, len(self.dataset.playlists))
+        return playlist_id, self.dataset.playlists[playlist_id][0]
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Callable[[httpx.AsyncClient, Context, int], Awaitable[httpx.Response]]
+    expected: tuple[int, ...] = (200,)
+    # Доля от --requests: тяжёлые сценарии (выгрузка каталога, bcrypt) гоняются реже
+    share: float = 1.0
+    postgres_only: bool = False
+
+
+def bulk_body(i: int, rows: int = 100) -> bytes:
+    lines = (json.dumps({"title": f"bulk {i}-{n}", "artists": artists, "tags": tags, "url": url})
+             for n, (_, artists, tags, url) in enumerate(synthetic_tracks(rows, seed=i)))
+    return "\n".join(lines).encode()
+
+
+def tracks_offset(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/tracks", params={"limit": 20, "offset": ctx.rng.randrange(ctx.dataset.tracks)})
+
+
+def tracks_cursor(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/tracks", params={"limit": 20, "cursor": encode_cursor(ctx.random_track())})
+
+
+def tracks_export(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/tracks/export", params={"format": "ndjson"})
+
+
+def tracks_search(client: httpx.AsyncClient, ctx: Context, i: int):
+    # Популярный тег и тег из середины распределения
+    tags = [f"tag{ctx.rng.randrange(50)}", f"tag{ctx.rng.randrange(500)}"]
+    return client.get("/tracks/search", params={"tags": tags, "limit": 20})
+
+
+def tracks_search_text(client: httpx.AsyncClient, ctx: Context, i: int):
+    # Часть названия с опечаткой: «trakc 12»
+    return client.get("/tracks/search", params={"q": f"trakc {ctx.random_track()}", "limit": 20})
+
+
+def autocomplete(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/autocomplete", params={"prefix": ctx.rng.choice(("tr", "track 1", "tag1", "artist2"))})
+
+
+def tracks_similar(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get(f"/tracks/{ctx.random_track()}/similar", params={"k": 10})
+
+
+def tags_related(client: httpx.AsyncClient, ctx: Context, i: int):
+    # Только теги, которые есть в заполненной базе: при малом --tracks часть tag0..tag199 не встречается
+    return client.get(f"/tags/{ctx.rng.choice(ctx.dataset.tags[:200])}/related")
+
+
+def track_add(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.post("/tracks", headers=ctx.auth(1), json={
+        "title": f"added {i}", "artists": ["artist0"], "tags": ["tag0", "tag1"], "url": f"https://example.com/{i}"})
+
+
+def tracks_bulk(method: str):
+    def request(client: httpx.AsyncClient, ctx: Context, i: int):
+        return client.post("/tracks/bulk", headers=ctx.auth(1), params={"method": method}, content=bulk_body(i))
+    return request
+
+
+def playlist_create(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.post("/playlists", headers=ctx.auth(ctx.random_user()), json={"name": f"created {i}"})
+
+
+def playlist_generate(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.post("/playlists/generate", headers=ctx.auth(ctx.random_user()), json={
+        "name": f"generated {i}", "length": 50,
+        "seed_tags": [f"tag{ctx.rng.randrange(100)}"], "seed_track_ids": [ctx.random_track()]})
+
+
+def playlists_list(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/playlists", headers=ctx.auth(ctx.random_user()))
+
+
+def playlists_counts(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/playlists", params={"include": "counts"}, headers=ctx.auth(ctx.random_user()))
+
+
+def playlists_library(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.get("/playlists", params=[("include", "counts"), ("include", "tracks"), ("tracks_limit", 10)],
+                      headers=ctx.auth(ctx.random_user()))
+
+
+def playlist_move(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id, user_id = ctx.random_playlist()
+    track_id, after = ctx.rng.sample(ctx.dataset.playlists[playlist_id][1], 2)
+    return client.post(f"/playlists/{playlist_id}/tracks/{track_id}/move", params={"after": after},
+                       headers=ctx.auth(user_id))
+
+
+def playlist_tracks(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id, user_id = ctx.random_playlist()
+    return client.get(f"/playlists/{playlist_id}/tracks", headers=ctx.auth(user_id))
+
+
+def playlist_add_track(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id, user_id = ctx.random_playlist()
+    return client.post(f"/playlists/{playlist_id}/tracks/{ctx.random_track()}", headers=ctx.auth(user_id))
+
+
+def playlist_patch(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id, user_id = ctx.random_playlist()
+    return client.patch(f"/playlists/{playlist_id}/tracks", headers=ctx.auth(user_id), json={
+        "add": [ctx.random_track() for _ in range(10)], "remove": [ctx.random_track() for _ in range(2)]})
+
+
+def playlist_delete_track(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id, track_id = ctx.removable_pairs.pop()
+    return client.delete(f"/playlists/{playlist_id}/tracks/{track_id}",
+                         headers=ctx.auth(ctx.dataset.playlists[playlist_id][0]))
+
+
+def playlist_delete(client: httpx.AsyncClient, ctx: Context, i: int):
+    playlist_id = ctx.removable_playlists.pop()
+    return client.delete(f"/playlists/{playlist_id}", headers=ctx.auth(ctx.dataset.playlists[playlist_id][0]))
+
+
+def auth_register(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.post("/auth/register", json={
+        "email": f"new{i}@bench.local", "username": f"new{i}", "password": BENCH_PASSWORD})
+
+
+def auth_login(client: httpx.AsyncClient, ctx: Context, i: int):
+    return client.post("/auth/login", json={
+        "email": ctx.dataset.user_email(ctx.random_user()), "username": None, "password": BENCH_PASSWORD})
+
+
+# Порядок важен: удаления идут после чтений, чтобы не выбивать плейлисты из-под других сценариев
+SCENARIOS = [
+    Scenario("tracks_offset", tracks_offset),
+    Scenario("tracks_cursor", tracks_cursor),
+    Scenario("tracks_export", tracks_export, share=0.01),
+    Scenario("tracks_search", tracks_search, postgres_only=True),
+    Scenario("tracks_search_text", tracks_search_text, postgres_only=True),
+    Scenario("autocomplete", autocomplete),
+    Scenario("tracks_similar", tracks_similar),
+    Scenario("tags_related", tags_related),
+    Scenario("track_add", track_add, share=0.2),
+    Scenario("tracks_bulk_insert", tracks_bulk("insert"), share=0.02),
+    Scenario("tracks_bulk_copy", tracks_bulk("copy"), share=0.02, postgres_only=True),
+    Scenario("playlist_create", playlist_create, share=0.2),
+    Scenario("playlist_generate", playlist_generate, share=0.1, postgres_only=True),
+    Scenario("playlists_list", playlists_list),
+    Scenario("playlists_counts", playlists_counts),
+    Scenario("playlists_library", playlists_library, postgres_only=True),
+    Scenario("playlist_tracks", playlist_tracks),
+    # 404 — трек или плейлист уже удалён сценариями удаления
+    Scenario("playlist_move", playlist_move, expected=(200, 404), share=0.2),
+    # 400 — случайный трек уже есть в плейлисте
+    Scenario("playlist_add_track", playlist_add_track, expected=(200, 400), share=0.2),
+    Scenario("playlist_patch", playlist_patch, share=0.2, postgres_only=True),
+    Scenario("playlist_delete_track", playlist_delete_track, share=0.2, postgres_only=True),
+    Scenario("playlist_delete", playlist_delete, share=0.05, postgres_only=True),
+    Scenario("auth_register", auth_register, expected=(201,), share=0.1),
+    Scenario("auth_login", auth_login, share=0.1),
+]
+
+
+def removable(dataset: Dataset, rng: random.Random, pairs: int, playlists: int) -> tuple[list, list]:
+    """Удаляемые плейлисты берутся с конца, удаляемые пары — из остальных, чтобы сценарии не мешали друг другу"""
+    playlist_ids = sorted(dataset.playlists)
+    doomed = playlist_ids[-playlists:] if playlists else []
+    candidates = [(pid, tid) for pid in playlist_ids[:len(playlist_ids) - len(doomed)]
+                  for tid in dataset.playlists[pid][1]]
+    return rng.sample(candidates, min(pairs, len(candidates))), doomed
+
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, scenario: Scenario, requests: int,
+                       concurrency: int) -> dict:
+    latencies, statuses = [], Counter()
+    pending = iter(range(requests))
+
+    async def worker():
+        for i in pending:
+            start = time.perf_counter()
+            response = await scenario.request(client, ctx, i)
+            await response.aread()
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    unexpected = sum(count for code, count in statuses.items() if code not in scenario.expected)
+    return {"requests": requests, "rps": round(requests / elapsed, 1), **percentiles(latencies),
+            "statuses": {str(code): count for code, count in sorted(statuses.items())}, "unexpected": unexpected}
+
+
+def compare(baseline: dict, report: dict, threshold: float) -> list[str]:
+    """Регрессия — рост p95 или падение пропускной способности больше чем на threshold процентов"""
+    if baseline["meta"]["params"] != report["meta"]["params"]:
+        print("Внимание: параметры прогона отличаются от базовых, сравнение может быть некорректным")
+    regressions = []
+    print(f"\n{'сценарий':<24}{'rps было':>12}{'стало':>12}{'Δ':>9}{'p95 было':>12}{'стало':>12}{'Δ':>9}")
+    for name, current in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<24}{'—':>12}{current['rps']:>12,.1f}{'':>9}{'—':>12}{current['p95']:>12.2f}")
+            continue
+        rps_delta = (current["rps"] / before["rps"] - 1) * 100
+        p95_delta = (current["p95"] / before["p95"] - 1) * 100 if before["p95"] else 0.0
+        flag = ""
+        if rps_delta < -threshold or p95_delta > threshold:
+            regressions.append(name)
+            flag = "  регрессия"
+        print(f"{name:<24}{before['rps']:>12,.1f}{current['rps']:>12,.1f}{rps_delta:>+8.1f}%"
+              f"{before['p95']:>12.2f}{current['p95']:>12.2f}{p95_delta:>+8.1f}%{flag}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--tracks", type=int, default=20_000)
+    parser.add_argument("--playlists-per-user", type=float, default=3)
+    parser.add_argument("--requests", type=int, default=2000, help="Запросов на сценарий при share=1")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="Имена сценариев")
+    parser.add_argument("--save", help="Сохранить результаты как базовые в JSON")
+    parser.add_argument("--compare", help="Сравнить с базовыми результатами из JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    dataset = await seed(engine, args.users, args.tracks, args.playlists_per_user,
+                         get_password_hash(BENCH_PASSWORD), args.seed)
+    await init_tag_graph()
+    await init_similarity_index()
+    await init_autocomplete()
+    if CATALOG_REPLICA:
+        await init_catalog()
+    postgres = engine.dialect.name == "postgresql"
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    counts = {s.name: max(args.concurrency, int(args.requests * s.share)) for s in scenarios}
+    rng = random.Random(args.seed)
+    pairs, doomed = removable(dataset, rng, counts.get("playlist_delete_track", 0),
+                              counts.get("playlist_delete", 0))
+    ctx = Context(dataset, {uid: create_access_token({"sub": str(uid)}) for uid in range(1, dataset.users + 1)},
+                  rng, pairs, doomed)
+    params = dict(users=args.users, tracks=args.tracks, playlists_per_user=args.playlists_per_user,
+                  requests=args.requests, concurrency=args.concurrency, seed=args.seed,
+                  dialect=engine.dialect.name, bcrypt_rounds=BCRYPT_ROUNDS, catalog_replica=CATALOG_REPLICA)
+
+    results = {}
+    # Исключение в обработчике превращается в 500 и попадает в статусы сценария, а не обрывает прогон
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for scenario in scenarios:
+                if scenario.postgres_only and not postgres:
+                    print(f"{scenario.name:<24} пропущен: нужен Postgres")
+                    continue
+                requests = min(counts[scenario.name], len(ctx.removable_pairs)) \
+                    if scenario.name == "playlist_delete_track" else counts[scenario.name]
+                result = results[scenario.name] = await run_scenario(client, ctx, scenario, requests,
+                                                                     args.concurrency)
+                print(f"{scenario.name:<24}{result['rps']:>10,.1f} rps  p50 {result['p50']:>8.2f}  "
+                      f"p95 {result['p95']:>8.2f}  p99 {result['p99']:>8.2f} мс  статусы {result['statuses']}")
+    finally:
+        await engine.dispose()
+
+    report = {"meta": {"created_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                       "platform": platform.platform(), "params": params},
+              "results": results}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Базовые результаты сохранены в {args.save}")
+    failed = [name for name, result in results.items() if result["unexpected"]]
+    if failed:
+        print(f"Неожиданные статусы ответов в сценариях: {failed}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"Регрессии больше {args.threshold}%: {regressions}")
+            sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())